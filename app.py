@@ -11,18 +11,183 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///database.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'fallback-secret-key')
+    app.config['PRINCIPAL_CACHE_SIZE'] = int(os.getenv('PRINCIPAL_CACHE_SIZE', '10000'))
+    app.config['PRINCIPAL_CACHE_TTL'] = float(os.getenv('PRINCIPAL_CACHE_TTL', '60'))
+    app.config['PASSWORD_HASH_ROUNDS'] = int(os.getenv('PASSWORD_HASH_ROUNDS', '29000'))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+    app.config['PASSWORD_HASH_ADMISSION_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_ADMISSION_TIMEOUT', '2'))
+    app.config['QUEUE_STATS_WINDOW_HOURS'] = float(os.getenv('QUEUE_STATS_WINDOW_HOURS', '24'))
+    app.config['QUEUE_STATS_SYNC_INTERVAL'] = float(os.getenv('QUEUE_STATS_SYNC_INTERVAL', '5'))
+    app.config['QUEUE_STATS_REBUILD_INTERVAL'] = float(os.getenv('QUEUE_STATS_REBUILD_INTERVAL', '300'))
+    app.config['PREDICTION_CACHE_TTL'] = float(os.getenv('PREDICTION_CACHE_TTL', '15'))
+    app.config['PREDICTION_CACHE_MAX_STALE'] = float(os.getenv('PREDICTION_CACHE_MAX_STALE', '300'))
+    app.config['LIVE_POLL_INTERVAL'] = float(os.getenv('LIVE_POLL_INTERVAL', '5'))
+    app.config['LIVE_KEEPALIVE'] = float(os.getenv('LIVE_KEEPALIVE', '15'))
+    # an open stream holds a worker thread; keep this below the threads per worker
+    app.config['LIVE_MAX_SUBSCRIBERS'] = int(os.getenv('LIVE_MAX_SUBSCRIBERS', '16'))
+    app.config['LIVE_MAX_STREAM_SECONDS'] = float(os.getenv('LIVE_MAX_STREAM_SECONDS', '300'))  # 0: no limit
+    app.config['ID_NODE_ID'] = int(os.getenv('ID_NODE_ID', '0'))
+    app.config['AVAILABILITY_SYNC_INTERVAL'] = float(os.getenv('AVAILABILITY_SYNC_INTERVAL', '5'))
+    app.config['AVAILABILITY_RELOAD_INTERVAL'] = float(os.getenv('AVAILABILITY_RELOAD_INTERVAL', '300'))
+    app.config['SYMPTOM_RULES_PATH'] = os.getenv('SYMPTOM_RULES_PATH')
+    app.config['SYMPTOM_RULES_CHECK_INTERVAL'] = float(os.getenv('SYMPTOM_RULES_CHECK_INTERVAL', '2'))
+    app.config['TRIAGE_WORKERS'] = int(os.getenv('TRIAGE_WORKERS', '2'))
+    app.config['TRIAGE_MAX_PENDING'] = int(os.getenv('TRIAGE_MAX_PENDING', '1000'))
+    app.config['NOTIFY_EMAIL_TRANSPORT'] = os.getenv('NOTIFY_EMAIL_TRANSPORT', 'console')  # console or smtp
+    app.config['SMTP_HOST'] = os.getenv('SMTP_HOST', 'localhost')
+    app.config['SMTP_PORT'] = int(os.getenv('SMTP_PORT', '25'))
+    app.config['SMTP_SENDER'] = os.getenv('SMTP_SENDER', 'noreply@mediq.local')
+    app.config['SMTP_USERNAME'] = os.getenv('SMTP_USERNAME')
+    app.config['SMTP_PASSWORD'] = os.getenv('SMTP_PASSWORD')
+    app.config['SMTP_STARTTLS'] = os.getenv('SMTP_STARTTLS', '0') == '1'
+    app.config['NOTIFY_POLL_INTERVAL'] = float(os.getenv('NOTIFY_POLL_INTERVAL', '2'))
+    app.config['NOTIFY_BATCH_SIZE'] = int(os.getenv('NOTIFY_BATCH_SIZE', '100'))
+    app.config['NOTIFY_MAX_ATTEMPTS'] = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '5'))
+    app.config['NOTIFY_BACKOFF_BASE'] = float(os.getenv('NOTIFY_BACKOFF_BASE', '5'))
+    app.config['NOTIFY_BACKOFF_MAX'] = float(os.getenv('NOTIFY_BACKOFF_MAX', '600'))
+    app.config['REMINDER_OFFSETS'] = os.getenv('REMINDER_OFFSETS', '24h,1h')  # empty disables reminders
+    app.config['REMINDER_TICK'] = float(os.getenv('REMINDER_TICK', '1'))
+    app.config['REMINDER_WINDOW'] = float(os.getenv('REMINDER_WINDOW', '3600'))
+    app.config['REMINDER_GRACE'] = float(os.getenv('REMINDER_GRACE', '900'))
+    app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO')
+    app.config['LOG_LEVELS'] = os.getenv('LOG_LEVELS', '')  # per module: "auth=WARNING,services.queue_service=DEBUG"
+    app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'json')  # json or text
+    app.config['LOG_DEBUG_SAMPLE_RATE'] = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1'))
+    app.config['LOG_QUEUE_SIZE'] = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', '1') == '1'
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')  # when set, /metrics needs "Bearer <token>"
+    app.config['SLOW_REQUEST_MS'] = float(os.getenv('SLOW_REQUEST_MS', '500'))  # 0 disables the slow log
+    app.config['SLOW_REQUEST_MAX_STATEMENTS'] = int(os.getenv('SLOW_REQUEST_MAX_STATEMENTS', '50'))
+    app.config['PROFILE_ENABLED'] = os.getenv('PROFILE_ENABLED', '0') == '1'
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # plus admin "X-Profile: 1"
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config['PROFILE_INTERVAL_MS'] = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+    app.config['PROFILE_MAX_FILES'] = int(os.getenv('PROFILE_MAX_FILES', '500'))
+    app.config['PROFILE_CPROFILE'] = os.getenv('PROFILE_CPROFILE', '0') == '1'
+
+    # logging first, so everything below (migrations, warm-up) is captured
+    import log_config
+    log_config.pipeline.configure(
+        level=app.config['LOG_LEVEL'],
+        levels=app.config['LOG_LEVELS'],
+        fmt=app.config['LOG_FORMAT'],
+        debug_sample_rate=app.config['LOG_DEBUG_SAMPLE_RATE'],
+        queue_size=app.config['LOG_QUEUE_SIZE'],
+    )
+    log_config.init_app(app)
 
     # CORS setup
     origins = os.getenv('CORS_ORIGINS', 'http://localhost:3000').split(',')
     CORS(app, origins=origins)
     
     db.init_app(app)
-    
+
+    if app.config['METRICS_ENABLED']:
+        import metrics
+        metrics.instrumentation.configure(
+            slow_ms=app.config['SLOW_REQUEST_MS'],
+            max_recorded=app.config['SLOW_REQUEST_MAX_STATEMENTS'],
+        )
+        metrics.init_app(app, token=app.config['METRICS_TOKEN'])
+
+    import profiling
+    profiling.profiler.configure(
+        enabled=app.config['PROFILE_ENABLED'],
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        directory=app.config['PROFILE_DIR'],
+        interval=app.config['PROFILE_INTERVAL_MS'] / 1000.0,
+        max_files=app.config['PROFILE_MAX_FILES'],
+        cprofile=app.config['PROFILE_CPROFILE'],
+    )
+    profiling.init_app(app)
+
+    from serialization import JSONProvider
+    app.json = JSONProvider(app)
+
+    from auth import principal_cache
+    principal_cache.configure(
+        maxsize=app.config['PRINCIPAL_CACHE_SIZE'],
+        ttl=app.config['PRINCIPAL_CACHE_TTL'],
+    )
+
+    from services.prediction_cache import prediction_cache
+    prediction_cache.configure(
+        ttl=app.config['PREDICTION_CACHE_TTL'],
+        max_stale=app.config['PREDICTION_CACHE_MAX_STALE'],
+    )
+
+    from services.id_generator import generator as id_generator
+    id_generator.configure(node_id=app.config['ID_NODE_ID'])
+
+    from services.symptom_service import engine as symptom_engine
+    symptom_engine.configure(
+        path=app.config['SYMPTOM_RULES_PATH'],
+        check_interval=app.config['SYMPTOM_RULES_CHECK_INTERVAL'],
+    )
+
+    from services.triage_pipeline import pipeline as triage_pipeline
+    triage_pipeline.configure(
+        workers=app.config['TRIAGE_WORKERS'],
+        max_pending=app.config['TRIAGE_MAX_PENDING'],
+        app=app,
+    )
+
+    from services import notification_service
+    transports = {}
+    if app.config['NOTIFY_EMAIL_TRANSPORT'] == 'smtp':
+        transports[notification_service.EMAIL] = notification_service.SMTPTransport(
+            host=app.config['SMTP_HOST'],
+            port=app.config['SMTP_PORT'],
+            sender=app.config['SMTP_SENDER'],
+            username=app.config['SMTP_USERNAME'],
+            password=app.config['SMTP_PASSWORD'],
+            starttls=app.config['SMTP_STARTTLS'],
+        )
+    notification_service.dispatcher.configure(
+        poll_interval=app.config['NOTIFY_POLL_INTERVAL'],
+        batch_size=app.config['NOTIFY_BATCH_SIZE'],
+        max_attempts=app.config['NOTIFY_MAX_ATTEMPTS'],
+        backoff_base=app.config['NOTIFY_BACKOFF_BASE'],
+        backoff_max=app.config['NOTIFY_BACKOFF_MAX'],
+        transports=transports,
+        app=app,
+    )
+    # picks up rows left behind by a previous run once this worker serves traffic
+    app.before_request(notification_service.dispatcher.ensure_running)
+
+    from services.reminder_scheduler import scheduler as reminders
+    reminders.configure(
+        offsets=app.config['REMINDER_OFFSETS'],
+        tick=app.config['REMINDER_TICK'],
+        window=app.config['REMINDER_WINDOW'],
+        grace=app.config['REMINDER_GRACE'],
+        app=app,
+    )
+    app.before_request(reminders.ensure_running)
+
+    from services.live_updates import broker as live_broker
+    live_broker.configure(
+        poll_interval=app.config['LIVE_POLL_INTERVAL'],
+        keepalive=app.config['LIVE_KEEPALIVE'],
+        max_subscribers=app.config['LIVE_MAX_SUBSCRIBERS'],
+        max_stream_seconds=app.config['LIVE_MAX_STREAM_SECONDS'],
+        app=app,
+    )
+
+    from services import password_service
+    password_service.configure(
+        rounds=app.config['PASSWORD_HASH_ROUNDS'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+        admission_timeout=app.config['PASSWORD_HASH_ADMISSION_TIMEOUT'],
+    )
 
     # Import models after db is bound
     from models import (
         User, Patient, Doctor, Nurse, HospitalAdministrator,
-        Appointment, Hospital, SymptomReport, QueueReport, TimeSlot
+        Appointment, Hospital, SymptomReport, QueueReport, TimeSlot,
+        HospitalStats, GlobalCounter, SchemaMigration, NotificationOutbox
     )
 
     from routes.patient_routes import patient_bp
@@ -37,9 +202,77 @@ def create_app():
     app.register_blueprint(hospital_bp, url_prefix='/api/hospital')
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     app.register_blueprint(nurse_bp, url_prefix="/api/nurse")
+    # column projections for the list endpoints, built once
+    from serialization import build_registry
+    build_registry()
+
     with app.app_context():
         db.create_all()
 
+        # create_all never alters existing tables; bring live databases up to date
+        from migrations import run_migrations
+        run_migrations(db.engine)
+
+        # first start against an existing database: seed the counters once
+        from services import analytics_service
+        if not analytics_service.is_initialized():
+            analytics_service.rebuild()
+
+        # rolling queue statistics start from the reports already in the window
+        from services.queue_stats import engine as queue_stats
+        queue_stats.configure(
+            window_hours=app.config['QUEUE_STATS_WINDOW_HOURS'],
+            sync_interval=app.config['QUEUE_STATS_SYNC_INTERVAL'],
+            rebuild_interval=app.config['QUEUE_STATS_REBUILD_INTERVAL'],
+            app=app,
+        )
+        queue_stats.warm()
+
+        # free-slot index for slot lookups and the cross-doctor search
+        from services.availability_index import index as availability
+        availability.configure(
+            sync_interval=app.config['AVAILABILITY_SYNC_INTERVAL'],
+            reload_interval=app.config['AVAILABILITY_RELOAD_INTERVAL'],
+            app=app,
+        )
+        availability.warm()
+    # periodic catch-up and full reloads run on background threads started
+    # once this worker serves traffic
+    app.before_request(queue_stats.ensure_running)
+    app.before_request(availability.ensure_running)
+
+    @app.cli.command('rebuild-analytics')
+    def rebuild_analytics_command():
+        """Recompute hospital_stats and global_counter from source tables."""
+        from services import analytics_service
+        counts = analytics_service.rebuild()
+        print(f"Analytics rebuilt: {counts}")
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade_command():
+        """Apply pending schema migrations from migrations.py."""
+        from migrations import run_migrations
+        applied = run_migrations(db.engine)
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+
+    @app.cli.command('normalize-appointment-dates')
+    def normalize_appointment_dates_command():
+        """Backfill appointment.scheduled_at from legacy date_time strings."""
+        from migrations import backfill_scheduled_at
+        with db.engine.begin() as conn:
+            converted, unparseable = backfill_scheduled_at(conn)
+        print(f"Converted {converted} appointments, {unparseable} could not be parsed")
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """EXPLAIN every hot query and fail if one needs a full table scan."""
+        from query_plans import check_query_plans
+        ok, report = check_query_plans(db.engine)
+        for line in report:
+            print(line)
+        if not ok:
+            raise SystemExit(1)
+
     @app.route('/')
     def index():
         return jsonify({"message": "MediQ API running"}), 200
@@ -1,14 +1,109 @@
 import jwt
-from flask import current_app, request, jsonify
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import current_app, g, request, jsonify
 from functools import wraps
 from models import User, Patient, Doctor, HospitalAdministrator
 from database import db
 
+log = logging.getLogger(__name__)
+
+# Session-independent snapshot of the columns views read off the current user.
+# Cached across requests, so it must never be an ORM instance.
+Principal = namedtuple('Principal', ['id', 'role', 'name', 'email', 'phone'])
+
+
+class PrincipalCache:
+    """
+    Bounded LRU cache of authenticated principals keyed by (user_id, token iat).
+    Entries expire after `ttl` seconds so changes made by other workers are
+    picked up eventually; local writes call invalidate() for immediate effect.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (user_id, iat) -> (expires_at, principal)
+        self._by_user = {}             # user_id -> set of (user_id, iat) keys
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize=None, ttl=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._entries.clear()
+            self._by_user.clear()
+
+    def get(self, user_id, issued_at):
+        key = (user_id, issued_at)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return principal
+
+    def put(self, user_id, issued_at, principal):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        key = (user_id, issued_at)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+
+principal_cache = PrincipalCache()
+
+
+def invalidate_principal(user_id):
+    """Drop cached principals for a user whose row was changed or deleted."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return
+    principal_cache.invalidate(user_id)
+
+
 def generate_jwt(payload, exp_seconds=3600):
     import datetime
     secret = current_app.config['SECRET_KEY']
     payload_copy = payload.copy()
-    payload_copy['exp'] = datetime.datetime.utcnow() + datetime.timedelta(seconds=exp_seconds)
+    now = datetime.datetime.utcnow()
+    payload_copy['iat'] = now
+    payload_copy['exp'] = now + datetime.timedelta(seconds=exp_seconds)
     token = jwt.encode(payload_copy, secret, algorithm='HS256')
     return token
 
@@ -24,20 +119,30 @@ def decode_jwt(token):
 
 def get_current_user():
     auth = request.headers.get('Authorization', None)
-    print("Authorization header:", auth)  # 👈 add this
     if not auth:
         return None
     parts = auth.split()
     if len(parts) != 2 or parts[0].lower() != 'bearer':
         return None
     token = parts[1]
-    print("Token:", token[:30], "...")  # 👈 add this
     data = decode_jwt(token)
-    print("Decoded data:", data)  # 👈 add this
     if not data:
+        log.debug("rejected bearer token")
         return None
-    user = User.query.get(data.get('user_id'))
-    print("User found:", user)
+    try:
+        user_id = int(data.get('user_id'))
+    except (TypeError, ValueError):
+        return None
+    issued_at = data.get('iat')
+
+    user = principal_cache.get(user_id, issued_at)
+    if user is None:
+        row = User.query.get(user_id)
+        if row is None:
+            return None
+        user = Principal(row.id, row.role, row.name, row.email, row.phone)
+        principal_cache.put(user_id, issued_at, user)
+    log.debug("authenticated", extra={"user_id": user.id, "role": user.role})
     return user
 
 
@@ -50,6 +155,7 @@ def role_required(*roles):
                 return jsonify({"error": "Authentication required"}), 401
             if user.role not in roles:
                 return jsonify({"error": "Insufficient permissions"}), 403
+            g.principal = user     # for request-level tags (profiles)
             return f(user, *args, **kwargs)
         return wrapper
     return decorator
@@ -0,0 +1,144 @@
+# Concurrent booking benchmark.
+#
+# Many patients hammer one popular doctor who only has a handful of slots, so
+# almost every booking races another one for the same slot. A fraction of the
+# successful bookings are cancelled again to put slots back into play. At the
+# end the database is checked for double bookings: no slot may carry more than
+# one Scheduled appointment, and a slot is marked unavailable exactly when it
+# does carry one.
+#
+#   python -m benchmarks.bench_booking --threads 16 --slots 8 --duration 10
+import argparse
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.harness import make_app, summarize
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16, help="concurrent booking clients")
+    parser.add_argument("--patients", type=int, default=64)
+    parser.add_argument("--slots", type=int, default=8, help="slots offered by the doctor")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--cancel-rate", type=float, default=0.5,
+                        help="fraction of successful bookings cancelled again")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    app, cleanup = make_app(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_ROUNDS=1000)
+    try:
+        from database import db
+        from models import Appointment, Hospital, TimeSlot
+
+        with app.app_context():
+            db.session.add(Hospital(hospital_id="HOSP-BENCH", name="Bench Hospital"))
+            db.session.commit()
+            hospital_pk = Hospital.query.filter_by(hospital_id="HOSP-BENCH").first().id
+
+        setup = app.test_client()
+
+        def register(name, role, **extra):
+            setup.post("/api/auth/register", json=dict(
+                name=name, email=f"{name}@example.com", password="password", role=role, **extra))
+            r = setup.post("/api/auth/login", json={"email": f"{name}@example.com",
+                                                    "password": "password"})
+            return r.json["user_id"], {"Authorization": "Bearer " + r.json["access_token"]}
+
+        doctor_id, doctor_headers = register("benchdoctor", "doctor", specialty="General")
+        day = (datetime.utcnow() + timedelta(days=1)).date()
+        slots = []
+        for i in range(args.slots):
+            start = datetime.combine(day, datetime.min.time()) + timedelta(hours=9, minutes=15 * i)
+            slots.append({
+                "slot_id": f"TS-BENCH-{i}",
+                "date": start.strftime("%Y-%m-%d"),
+                "start_time": start.strftime("%H:%M"),
+                "end_time": (start + timedelta(minutes=15)).strftime("%H:%M"),
+            })
+        setup.put("/api/doctor/update_availability", json=slots, headers=doctor_headers)
+        with app.app_context():
+            TimeSlot.query.update({TimeSlot.hospital_id: hospital_pk})
+            db.session.commit()
+
+        patients = [register(f"benchpatient{i}", "patient")[1] for i in range(args.patients)]
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        booked, conflicts, errors, cancels = [], [], [], []
+        reasons = {}
+
+        def client_loop(n):
+            client = app.test_client()
+            rng = random.Random(args.seed + n)
+            mine = patients[n::args.threads]
+            while not stop.is_set():
+                headers = rng.choice(mine)
+                slot = rng.choice(slots)
+                t0 = time.perf_counter()
+                r = client.post("/api/patient/book_appointment", json={
+                    "doctor_id": doctor_id, "hospital_id": hospital_pk, "slot_id": slot["slot_id"],
+                }, headers=headers)
+                dt = time.perf_counter() - t0
+                with lock:
+                    if r.status_code == 201:
+                        booked.append(dt)
+                    elif r.status_code in (400, 409):
+                        conflicts.append(dt)
+                        reason = (r.get_json(silent=True) or {}).get("error", "?")
+                        reasons[reason] = reasons.get(reason, 0) + 1
+                    else:
+                        errors.append(dt)
+                if r.status_code == 201 and rng.random() < args.cancel_rate:
+                    t0 = time.perf_counter()
+                    client.delete(f"/api/patient/appointments/{r.json['appointment_id']}",
+                                  headers=headers)
+                    with lock:
+                        cancels.append(time.perf_counter() - t0)
+
+        threads = [threading.Thread(target=client_loop, args=(n,)) for n in range(args.threads)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            scheduled = {}
+            for slot_pk, in db.session.query(Appointment.time_slot_id) \
+                    .filter(Appointment.status == "Scheduled"):
+                scheduled[slot_pk] = scheduled.get(slot_pk, 0) + 1
+            double_booked = {k: v for k, v in scheduled.items() if v > 1}
+            unslotted = scheduled.pop(None, 0)
+            mismatched = [
+                s.slot_id for s in TimeSlot.query.all()
+                if s.is_available != (scheduled.get(s.id, 0) == 0)
+            ]
+
+        print(f"threads={args.threads} patients={args.patients} slots={args.slots} "
+              f"cancel_rate={args.cancel_rate} duration={elapsed:.1f}s")
+        attempts = booked + conflicts + errors
+        summarize("book (all attempts)", attempts, elapsed)
+        summarize("book (201 booked)", booked, elapsed)
+        summarize("book (409/400 rejected)", conflicts, elapsed)
+        summarize("book (other errors)", errors, elapsed)
+        summarize("cancel", cancels, elapsed)
+        for reason, count in sorted(reasons.items(), key=lambda kv: -kv[1]):
+            print(f"  rejected: {count:>6}  {reason}")
+        print(f"double-booked slots: {len(double_booked)}  "
+              f"appointments without slot: {unslotted}  "
+              f"slot flag mismatches: {len(mismatched)}")
+        if double_booked or unslotted or mismatched:
+            raise SystemExit("FAIL: slot reservation invariant violated")
+        print("OK: no double bookings")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
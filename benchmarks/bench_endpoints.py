@@ -0,0 +1,300 @@
+# Endpoint regression benchmark.
+#
+# Seeds a temporary database with a fixed dataset, then calls each hot
+# endpoint in-process through the Flask test client and records latency
+# percentiles and the number of SQL statements each request ran. The results
+# are compared with benchmarks/baseline.json: the run fails (exit status 1)
+# when an endpoint runs more statements than its baseline allows (a new
+# per-row query shows up as dozens more) or its median latency grows past
+# --latency-factor times the baseline.
+#
+#   python -m benchmarks.bench_endpoints                     # compare
+#   python -m benchmarks.bench_endpoints --update-baseline   # accept current numbers
+#   python -m benchmarks.bench_endpoints --only login,view_analytics
+#
+# Latency baselines are machine-dependent; refresh them with --update-baseline
+# on the machine that runs the comparison. Statement counts are not.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.harness import make_app, percentile
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+DOCTORS = 20
+PATIENTS = 200
+APPOINTMENTS_PER_PATIENT = 10
+SLOTS_PER_DOCTOR = 32
+QUEUE_REPORTS = 500
+PASSWORD = "password"
+
+
+# ===================== Dataset =====================
+
+def seed(app, bookers):
+    """Fixed dataset; returns the ids the scenarios need."""
+    from database import db
+    from models import (Appointment, Doctor, HospitalAdministrator, Hospital, Patient,
+                        QueueReport, TimeSlot)
+    from services import analytics_service
+    from services.availability_index import index as availability
+    from services.password_service import hash_password
+    from services.queue_stats import engine as queue_stats
+
+    with app.app_context():
+        password_hash = hash_password(PASSWORD)
+        hospital = Hospital(hospital_id="HOSP-BENCH", name="Bench Hospital",
+                            departments="general,cardiology")
+        db.session.add(hospital)
+        db.session.flush()
+        admin = HospitalAdministrator(name="bench admin", email="admin@bench", role="admin",
+                                      password_hash=password_hash, admin_id="ADM-BENCH",
+                                      hospital_id=hospital.id)
+        doctors = [Doctor(name=f"doctor {i}", email=f"doctor{i}@bench", role="doctor",
+                          password_hash=password_hash, doctor_id=f"DOC-BENCH-{i}",
+                          specialty="General", hospital_id=hospital.id)
+                   for i in range(DOCTORS)]
+        patients = [Patient(name=f"patient {i}", email=f"patient{i}@bench", role="patient",
+                            password_hash=password_hash, patient_id=f"PAT-BENCH-{i}")
+                    for i in range(PATIENTS + bookers)]
+        db.session.add_all([admin, *doctors, *patients])
+        db.session.flush()
+
+        now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        day = (now + timedelta(days=1)).date()
+        db.session.execute(TimeSlot.__table__.insert(), [{
+            "slot_id": f"TS-BENCH-{d.id}-{i}", "doctor_id": d.id, "hospital_id": hospital.id,
+            "start_time": datetime.combine(day, datetime.min.time()) + timedelta(hours=8, minutes=15 * i),
+            "end_time": datetime.combine(day, datetime.min.time()) + timedelta(hours=8, minutes=15 * i + 15),
+            "is_available": True, "slot_type": "consult",
+        } for d in doctors for i in range(SLOTS_PER_DOCTOR)])
+        # one open slot per booking request, with the last doctor
+        booking_start = datetime.combine(day, datetime.min.time()) + timedelta(days=30, hours=8)
+        db.session.execute(TimeSlot.__table__.insert(), [{
+            "slot_id": f"TS-BENCH-BOOK-{i}", "doctor_id": doctors[-1].id, "hospital_id": hospital.id,
+            "start_time": booking_start + timedelta(minutes=15 * i),
+            "end_time": booking_start + timedelta(minutes=15 * i + 15),
+            "is_available": True, "slot_type": "consult",
+        } for i in range(bookers)])
+
+        rows = []
+        for p_index, p in enumerate(patients[:PATIENTS]):
+            for k in range(APPOINTMENTS_PER_PATIENT):
+                # the newest appointment of each patient is upcoming, the rest are history
+                upcoming = k == APPOINTMENTS_PER_PATIENT - 1
+                rows.append({
+                    "appointment_id": f"APPT-BENCH-{p_index}-{k}",
+                    "patient_id": p.id, "doctor_id": doctors[(p_index + k) % DOCTORS].id,
+                    "hospital_id": hospital.id,
+                    "scheduled_at": now + timedelta(hours=2 + p_index % 8) if upcoming
+                    else now - timedelta(days=k + 1, minutes=p_index),
+                    "status": "Scheduled" if upcoming else "Completed",
+                    "created_at": now - timedelta(days=k + 1),
+                })
+        db.session.execute(Appointment.__table__.insert(), rows)
+
+        db.session.execute(QueueReport.__table__.insert(), [{
+            "report_id": f"QR-BENCH-{i}", "hospital_id": hospital.id,
+            "submitted_by": "bench", "department": "general",
+            "queue_length": 5 + i % 20, "wait_time_reported": 10 + i % 50,
+            "timestamp": now - timedelta(minutes=2 * i), "is_validated": True,
+        } for i in range(QUEUE_REPORTS)])
+        db.session.commit()
+
+        # the in-memory structures were warmed by create_app on an empty database
+        analytics_service.rebuild()
+        queue_stats.warm()
+        availability.warm()
+
+        return {
+            "hospital_pk": hospital.id,
+            "hospital_id": hospital.hospital_id,
+            "doctor_pks": [d.id for d in doctors],
+            "day": day.isoformat(),
+            "booker_emails": [p.email for p in patients[PATIENTS:]],
+            "booking_doctor_pk": doctors[-1].id,
+            "booking_start": booking_start,
+        }
+
+
+# ===================== Scenarios =====================
+
+def scenarios(client, ids, bookers):
+    def login(email):
+        r = client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+        assert r.status_code == 200, r.get_json()
+        return {"Authorization": "Bearer " + r.json["access_token"]}
+
+    admin = login("admin@bench")
+    doctor = login("doctor0@bench")
+    patient = login("patient0@bench")
+    booker_headers = iter([login(email) for email in bookers])
+    booking_times = iter(range(len(bookers)))
+
+    def book():
+        # each request books the next free slot as a patient with no other appointment
+        when = ids["booking_start"] + timedelta(minutes=15 * next(booking_times))
+        return ("POST", "/api/patient/book_appointment", next(booker_headers), {
+            "doctor_id": ids["booking_doctor_pk"], "hospital_id": ids["hospital_pk"],
+            "date_time": when.strftime("%Y-%m-%dT%H:%M"),
+        }, 201)
+
+    return {
+        "login": lambda: ("POST", "/api/auth/login", None,
+                          {"email": "patient1@bench", "password": PASSWORD}, 200),
+        "book_appointment": book,
+        "queue_status": lambda: ("GET", "/api/patient/queue_status", patient, None, 200),
+        "predict_wait_time": lambda: (
+            "GET", f"/api/hospital/predict_wait_time?hospital_id={ids['hospital_pk']}&department=general",
+            None, None, 200),
+        "get_available_slots": lambda: (
+            "GET", f"/api/hospital/get_available_slots?doctor_id={ids['doctor_pks'][0]}&date={ids['day']}",
+            None, None, 200),
+        "view_analytics": lambda: ("GET", "/api/admin/view_analytics", admin, None, 200),
+        "admin_appointments": lambda: ("GET", "/api/admin/appointments?limit=100", admin, None, 200),
+        "doctor_patients": lambda: ("GET", "/api/doctor/patients?per_page=100", doctor, None, 200),
+    }
+
+
+class StatementCounter:
+    """Counts SQL statements run by the benchmark thread (not background threads)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.thread = threading.get_ident()
+        self.count = 0
+        event.listen(engine, "after_cursor_execute", self._count)
+
+    def _count(self, *args):
+        if threading.get_ident() == self.thread:
+            self.count += 1
+
+
+def run(client, counter, make_call, iterations, warmup):
+    latencies, statements = [], []
+    for i in range(warmup + iterations):
+        method, path, headers, body, expected = make_call()
+        before = counter.count
+        t0 = time.perf_counter()
+        r = client.open(path, method=method, headers=headers, json=body)
+        elapsed = time.perf_counter() - t0
+        if r.status_code != expected:
+            raise SystemExit(f"{method} {path}: expected {expected}, got {r.status_code} {r.get_data(as_text=True)[:200]}")
+        if i >= warmup:
+            latencies.append(elapsed)
+            statements.append(counter.count - before)
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "statements": max(statements),
+        "statements_median": statistics.median(statements),
+    }
+
+
+# ===================== Comparison =====================
+
+def compare(name, result, base, args):
+    """Regression messages for one endpoint (empty when within bounds)."""
+    problems = []
+    allowed = base["statements"] + max(args.statement_slack, int(base["statements"] * 0.2))
+    if result["statements"] > allowed:
+        problems.append(f"{name}: {result['statements']} SQL statements per request, "
+                        f"baseline {base['statements']} (allowed {allowed})")
+    limit = max(base["p50_ms"] * args.latency_factor, base["p50_ms"] + args.latency_floor_ms)
+    if result["p50_ms"] > limit:
+        problems.append(f"{name}: p50 {result['p50_ms']:.2f}ms, baseline {base['p50_ms']:.2f}ms "
+                        f"(allowed {limit:.2f}ms)")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", default="", help="comma-separated endpoint names")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write this run's numbers as the new baseline")
+    parser.add_argument("--latency-factor", type=float, default=2.0,
+                        help="fail when p50 exceeds baseline p50 times this")
+    parser.add_argument("--latency-floor-ms", type=float, default=1.0,
+                        help="ignore p50 growth smaller than this many ms (timer noise)")
+    parser.add_argument("--statement-slack", type=int, default=2,
+                        help="extra statements per request tolerated (at least 20%% of baseline)")
+    args = parser.parse_args(argv)
+
+    bookers = args.warmup + args.iterations
+    app, cleanup = make_app(
+        PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_ROUNDS=1000, REMINDER_OFFSETS="",
+        NOTIFY_POLL_INTERVAL=0, TRIAGE_WORKERS=0, LOG_LEVEL="WARNING", SLOW_REQUEST_MS=0,
+    )
+    try:
+        from database import db
+        ids = seed(app, bookers)
+        with app.app_context():
+            counter = StatementCounter(db.engine)
+        client = app.test_client()
+        calls = scenarios(client, ids, ids["booker_emails"])
+        selected = [n for n in args.only.split(",") if n] or list(calls)
+        unknown = set(selected) - set(calls)
+        if unknown:
+            raise SystemExit(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+        results = {name: run(client, counter, calls[name], args.iterations, args.warmup)
+                   for name in selected}
+    finally:
+        cleanup()
+
+    print(f"{'endpoint':<22}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL':>6}")
+    for name, r in results.items():
+        print(f"{name:<22}{r['p50_ms']:>7.2f}ms{r['p95_ms']:>7.2f}ms{r['p99_ms']:>7.2f}ms"
+              f"{r['statements']:>6}")
+
+    if args.update_baseline:
+        baseline = {"endpoints": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline["endpoints"].update(results)
+        baseline["meta"] = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "iterations": args.iterations,
+            "dataset": {"doctors": DOCTORS, "patients": PATIENTS,
+                        "appointments": PATIENTS * APPOINTMENTS_PER_PATIENT},
+            "updated": datetime.utcnow().strftime("%Y-%m-%d"),
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        raise SystemExit(f"no baseline at {args.baseline}; run with --update-baseline first")
+    with open(args.baseline) as f:
+        baseline = json.load(f)["endpoints"]
+    problems = []
+    for name, r in results.items():
+        if name not in baseline:
+            print(f"{name}: no baseline entry, skipped")
+            continue
+        problems.extend(compare(name, r, baseline[name], args))
+    if problems:
+        print("REGRESSION")
+        for p in problems:
+            print("  " + p)
+        sys.exit(1)
+    print("OK: within baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Login throughput benchmark.
+#
+# Hammers POST /api/auth/login from many threads while a second set of threads
+# polls a cheap endpoint, so you can see both how many logins/s a worker
+# sustains and how much hashing work delays unrelated requests. Use it to size
+# PASSWORD_HASH_WORKERS / PASSWORD_HASH_MAX_PENDING per gunicorn worker:
+#
+#   python -m benchmarks.bench_login --hash-workers 0    # inline hashing
+#   python -m benchmarks.bench_login --hash-workers 4 --threads 32
+import argparse
+import threading
+import time
+
+from benchmarks.harness import make_app, summarize
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16, help="concurrent login clients")
+    parser.add_argument("--pollers", type=int, default=2, help="concurrent clients hitting GET /")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--hash-workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=29000)
+    args = parser.parse_args(argv)
+
+    app, cleanup = make_app(
+        PASSWORD_HASH_WORKERS=args.hash_workers,
+        PASSWORD_HASH_MAX_PENDING=args.max_pending,
+        PASSWORD_HASH_ROUNDS=args.rounds,
+    )
+    try:
+        setup = app.test_client()
+        for i in range(args.users):
+            setup.post("/api/auth/register", json={
+                "name": f"Bench User {i}", "email": f"bench{i}@example.com",
+                "password": "password", "role": "patient",
+            })
+
+        stop = threading.Event()
+        login_ok, login_shed, poll = [], [], []
+        lock = threading.Lock()
+
+        def login_client(n):
+            client = app.test_client()
+            i = n
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                r = client.post("/api/auth/login", json={
+                    "email": f"bench{i % args.users}@example.com", "password": "password",
+                })
+                dt = time.perf_counter() - t0
+                with lock:
+                    (login_ok if r.status_code == 200 else login_shed).append(dt)
+                i += args.threads
+
+        def poll_client():
+            client = app.test_client()
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                client.get("/")
+                with lock:
+                    poll.append(time.perf_counter() - t0)
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=login_client, args=(n,)) for n in range(args.threads)]
+        threads += [threading.Thread(target=poll_client) for _ in range(args.pollers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        print(f"hash workers={args.hash_workers} max_pending={args.max_pending} "
+              f"rounds={args.rounds} login threads={args.threads} duration={elapsed:.1f}s")
+        summarize("login (200)", login_ok, elapsed)
+        summarize("login (shed/failed)", login_shed, elapsed)
+        summarize("GET / while logging in", poll, elapsed)
+    finally:
+        from services import password_service
+        password_service.shutdown()
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
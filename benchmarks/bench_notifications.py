@@ -0,0 +1,100 @@
+# Notification outbox benchmark.
+#
+# Books appointments through the API against a local SMTP sink that rejects a
+# fraction of messages, then waits for the dispatcher to deliver everything.
+# Reports booking latency (which must not include delivery), delivery
+# throughput, and checks that every confirmation arrived exactly once.
+#
+#   python -m benchmarks.bench_notifications --bookings 500 --fail-rate 0.2
+import argparse
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from benchmarks.harness import make_app, summarize
+from benchmarks.smtp_sink import SMTPSink
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bookings", type=int, default=500)
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--doctors", type=int, default=10,
+                        help="a patient books each doctor at most once, so bookings <= patients * doctors")
+    parser.add_argument("--fail-rate", type=float, default=0.2, help="fraction of 451 replies")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for delivery")
+    args = parser.parse_args(argv)
+
+    sink = SMTPSink(fail_rate=args.fail_rate, seed=1).start()
+    app, cleanup = make_app(
+        PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_ROUNDS=1000,
+        NOTIFY_EMAIL_TRANSPORT="smtp", SMTP_HOST=sink.host, SMTP_PORT=sink.port,
+        NOTIFY_POLL_INTERVAL=0.2, NOTIFY_BATCH_SIZE=args.batch_size,
+        NOTIFY_BACKOFF_BASE=0.05, NOTIFY_BACKOFF_MAX=0.5, NOTIFY_MAX_ATTEMPTS=20,
+    )
+    try:
+        from database import db
+        from models import NotificationOutbox
+        from services.notification_service import dispatcher, outbox_counts
+
+        client = app.test_client()
+
+        def register(name, role, **extra):
+            client.post("/api/auth/register", json=dict(
+                name=name, email=f"{name}@example.com", password="password", role=role, **extra))
+            r = client.post("/api/auth/login", json={"email": f"{name}@example.com",
+                                                     "password": "password"})
+            return r.json["user_id"], {"Authorization": "Bearer " + r.json["access_token"]}
+
+        if args.bookings > args.patients * args.doctors:
+            raise SystemExit("--bookings must not exceed --patients * --doctors")
+        doctors = [register(f"benchdoctor{i}", "doctor", specialty="General")[0]
+                   for i in range(args.doctors)]
+        patients = [register(f"benchpatient{i}", "patient")[1] for i in range(args.patients)]
+
+        base = datetime.utcnow() + timedelta(days=2)
+        latencies = []
+        start = time.perf_counter()
+        for i in range(args.bookings):
+            when = (base + timedelta(minutes=30 * i)).strftime("%Y-%m-%dT%H:%M")
+            t0 = time.perf_counter()
+            r = client.post("/api/patient/book_appointment", json={
+                "doctor_id": doctors[i // len(patients)], "hospital_id": 1, "date_time": when,
+            }, headers=patients[i % len(patients)])
+            latencies.append(time.perf_counter() - t0)
+            if r.status_code != 201:
+                raise SystemExit(f"booking failed: {r.status_code} {r.get_json()}")
+        booked = time.perf_counter() - start
+
+        with app.app_context():
+            expected = NotificationOutbox.query.count()
+            while time.perf_counter() - start < args.timeout:
+                counts = outbox_counts()
+                if counts.get("sent", 0) + counts.get("failed", 0) >= expected:
+                    break
+                dispatcher.wake()
+                time.sleep(0.1)
+                db.session.rollback()
+            counts = outbox_counts()
+        delivered_in = time.perf_counter() - start
+
+        summarize("book_appointment", latencies, booked)
+        print(f"outbox rows: {expected}  status: {counts}")
+        print(f"sink accepted: {len(sink.messages)}  rejected (451): {sink.rejected}  "
+              f"delivered in {delivered_in:.1f}s "
+              f"({len(sink.messages) / delivered_in:.1f} msg/s incl. booking)")
+        print("dispatcher:", dispatcher.stats()["channels"])
+        duplicates = {k: v for k, v in Counter(m["Message-ID"] for _, _, m in sink.messages).items()
+                      if v > 1}
+        if duplicates or counts.get("sent", 0) != expected or len(sink.messages) != expected:
+            raise SystemExit(f"FAIL: {len(duplicates)} duplicated, "
+                             f"{expected - counts.get('sent', 0)} undelivered")
+        print("OK: every confirmation delivered exactly once")
+    finally:
+        sink.stop()
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
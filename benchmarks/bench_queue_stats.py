@@ -0,0 +1,92 @@
+# Concurrent queue-stats sync benchmark.
+#
+# One thread ingests queue reports, alternating bulk batches (which force a
+# sync) with single reports fed through record(), while several threads call
+# sync(force=True) in a loop, the way request reads, the bulk endpoint and the
+# live-update poller do in a real worker. At the end every report must have
+# been folded into the rolling buffers exactly once.
+#
+#   python -m benchmarks.bench_queue_stats --threads 8 --reports 4000
+import argparse
+import threading
+import time
+
+from benchmarks.harness import make_app, summarize
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8, help="threads calling sync(force=True)")
+    parser.add_argument("--reports", type=int, default=4000, help="reports to ingest")
+    parser.add_argument("--batch", type=int, default=50, help="reports per bulk ingest")
+    args = parser.parse_args(argv)
+
+    app, cleanup = make_app(QUEUE_STATS_SYNC_INTERVAL=3600)
+    try:
+        from database import db
+        from models import Hospital, QueueReport
+        from services.queue_service import ingest_queue_reports
+        from services.queue_stats import engine as queue_stats
+
+        with app.app_context():
+            db.session.add(Hospital(hospital_id="HOSP-BENCH", name="Bench Hospital"))
+            db.session.commit()
+            hospital_pk = Hospital.query.filter_by(hospital_id="HOSP-BENCH").first().id
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        syncs = []
+
+        def sync_loop():
+            with app.app_context():
+                while not stop.is_set():
+                    t0 = time.perf_counter()
+                    queue_stats.sync(force=True)
+                    db.session.rollback()   # end the read transaction, see new rows
+                    with lock:
+                        syncs.append(time.perf_counter() - t0)
+
+        def report(i):
+            return {"hospital_id": hospital_pk, "department": "emergency",
+                    "queue_length": i % 20, "wait_time_reported": i % 60}
+
+        threads = [threading.Thread(target=sync_loop) for _ in range(args.threads)]
+        for t in threads:
+            t.start()
+        start = time.perf_counter()
+        with app.app_context():
+            sent = 0
+            while sent < args.reports:
+                if (sent // args.batch) % 2 == 0:
+                    n = min(args.batch, args.reports - sent)
+                    ingest_queue_reports([report(sent + i) for i in range(n)])
+                else:
+                    n = 1
+                    qr = QueueReport(report_id=f"QR-BENCH-{sent}", **report(sent))
+                    db.session.add(qr)
+                    db.session.commit()
+                    queue_stats.record(qr)
+                sent += n
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for t in threads:
+            t.join()
+
+        with app.app_context():
+            queue_stats.sync(force=True)
+            summary = queue_stats.summary(hospital_pk) or {}
+            stored = db.session.query(db.func.count(QueueReport.id)).scalar()
+
+        counted = summary.get("report_count", 0)
+        print(f"threads={args.threads} reports={args.reports} duration={elapsed:.1f}s")
+        summarize("sync(force=True)", syncs, elapsed)
+        print(f"stored: {stored}  counted by queue_stats: {counted}")
+        if counted != stored:
+            raise SystemExit("FAIL: queue reports counted more or less than once")
+        print("OK: every report counted once")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
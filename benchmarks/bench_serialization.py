@@ -0,0 +1,110 @@
+# Serialization benchmark.
+#
+# Builds a large appointment list the way GET /api/patient/appointments did
+# before the serializer registry (ORM objects with joinedload, a hand-built
+# dict per row, Flask's stdlib JSON encoder) and the way it does now (Core
+# select of the registered projection, rows straight to dicts, the app's JSON
+# provider), and times the query/build and encode stages separately.
+#
+#   python -m benchmarks.bench_serialization --rows 100000
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.harness import make_app
+
+
+def best_of(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    app, cleanup = make_app(PASSWORD_HASH_WORKERS=0, REMINDER_OFFSETS="")
+    try:
+        from sqlalchemy.orm import joinedload
+        from database import db
+        from models import Appointment, Doctor, Hospital, Patient
+        from serialization import dumps_bytes, orjson, registry
+
+        with app.app_context():
+            db.session.add(Hospital(hospital_id="HOSP-BENCH", name="Bench Hospital"))
+            db.session.add(Patient(name="bench patient", email="p@example.com", patient_id="P-BENCH"))
+            db.session.add(Doctor(name="bench doctor", email="d@example.com", doctor_id="D-BENCH"))
+            db.session.commit()
+            hospital_pk = Hospital.query.first().id
+            patient_pk = Patient.query.first().id
+            doctor_pk = Doctor.query.first().id
+            start = datetime(2030, 1, 1, 8)
+            db.session.execute(Appointment.__table__.insert(), [{
+                "appointment_id": f"APPT-BENCH-{i}",
+                "patient_id": patient_pk, "doctor_id": doctor_pk, "hospital_id": hospital_pk,
+                "scheduled_at": start + timedelta(minutes=15 * i),
+                # one active appointment per patient and doctor (unique index);
+                # the rest is history
+                "status": "Scheduled" if i == 0 else ("Completed", "Cancelled")[i % 2],
+                "notes": "bench" if i % 3 else None,
+            } for i in range(args.rows)])
+            db.session.commit()
+
+            def legacy_build():
+                q = Appointment.query.options(joinedload(Appointment.doctor),
+                                              joinedload(Appointment.hospital)) \
+                    .filter_by(patient_id=patient_pk)
+                data = []
+                for a in q.all():
+                    data.append({
+                        "appointment_id": a.appointment_id,
+                        "doctor_id": a.doctor_id,
+                        "doctor_name": a.doctor.name if a.doctor else "Unknown Doctor",
+                        "hospital_id": a.hospital_id,
+                        "hospital_name": a.hospital.name if a.hospital else "Unknown Hospital",
+                        "date_time": a.scheduled_at.isoformat() if a.scheduled_at else None,
+                        "status": a.status,
+                        "notes": a.notes,
+                    })
+                db.session.expunge_all()
+                return data
+
+            serializer = registry["patient_appointment"]
+
+            def registry_build():
+                stmt = serializer.select().where(Appointment.patient_id == patient_pk)
+                return serializer.rows(db.session.execute(stmt))
+
+            legacy_t, legacy_data = best_of(legacy_build, args.repeat)
+            new_t, new_data = best_of(registry_build, args.repeat)
+            stdlib_t, stdlib_out = best_of(
+                lambda: json.dumps(legacy_data, sort_keys=True).encode(), args.repeat)
+            provider_t, provider_out = best_of(
+                lambda: dumps_bytes(new_data, sort_keys=True), args.repeat)
+
+        assert len(legacy_data) == len(new_data) == args.rows
+        assert json.loads(stdlib_out) == json.loads(provider_out), "outputs differ"
+
+        encoder = "orjson" if orjson is not None else "stdlib json (orjson not installed)"
+        print(f"rows={args.rows}  encoder={encoder}  best of {args.repeat}")
+        print(f"{'':<26}{'build':>10}{'encode':>10}{'total':>10}")
+        print(f"{'before (ORM + stdlib)':<26}{legacy_t * 1000:>8.0f}ms{stdlib_t * 1000:>8.0f}ms"
+              f"{(legacy_t + stdlib_t) * 1000:>8.0f}ms")
+        print(f"{'after (Core + registry)':<26}{new_t * 1000:>8.0f}ms{provider_t * 1000:>8.0f}ms"
+              f"{(new_t + provider_t) * 1000:>8.0f}ms")
+        print(f"speedup: build {legacy_t / new_t:.1f}x  encode {stdlib_t / provider_t:.1f}x  "
+              f"total {(legacy_t + stdlib_t) / (new_t + provider_t):.1f}x  "
+              f"({len(provider_out) / 1e6:.1f} MB)")
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
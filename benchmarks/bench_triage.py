@@ -0,0 +1,101 @@
+# Symptom triage benchmark.
+#
+# Times the compiled rule engine against a per-phrase substring scan (what the
+# old keyword classifier did) for growing rule tables and text lengths. The
+# engine's cost should follow the text length and stay flat as rules are
+# added; the scan grows with both. Before timing, the shipped rules are run
+# against the negation cases in CASES and the run fails on any mismatch.
+#
+#   python -m benchmarks.bench_triage --rules 177 1000 5000 --words 20 200 2000
+import argparse
+import json
+import random
+import time
+
+from services.symptom_service import DEFAULT_RULES_PATH, RuleSet
+
+# text -> expected urgency with the shipped rules
+CASES = {
+    "chest pain": "High",
+    "no chest pain": "Low",
+    "chest-pain": "High",
+    "no appetite and chest pain": "High",
+    "nausea no vomiting chest pain": "High",
+    "denies fever, chest pain": "High",
+    "no fever but chest pain": "High",
+}
+
+
+def check_cases(rules):
+    failed = [(text, want, got) for text, want in CASES.items()
+              if (got := rules.analyze(text)["urgency"]) != want]
+    for text, want, got in failed:
+        print(f"case {text!r}: expected {want}, got {got}")
+    if failed:
+        raise SystemExit("FAIL: triage cases")
+    print(f"OK: {len(CASES)} triage cases")
+
+
+def synthetic_rules(base, count, rng):
+    """The shipped rules padded with made-up phrases up to `count`."""
+    data = dict(base, rules=list(base["rules"]))
+    categories = list(base["categories"])
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    while len(data["rules"]) < count:
+        words = ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9)))
+                 for _ in range(rng.randint(1, 3))]
+        data["rules"].append({"phrase": " ".join(words), "weight": 1,
+                              "category": rng.choice(categories), "lang": "en"})
+    return data
+
+
+def sample_text(base, words, rng):
+    vocabulary = ["patient", "reports", "since", "yesterday", "and", "mild", "no", "the", "with"]
+    phrases = [r["phrase"] for r in base["rules"] if r.get("lang") == "en"]
+    out = []
+    while len(out) < words:
+        out.extend(rng.choice(phrases).split() if rng.random() < 0.2 else [rng.choice(vocabulary)])
+    return " ".join(out[:words])
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", type=int, nargs="+", default=[177, 1000, 5000])
+    parser.add_argument("--words", type=int, nargs="+", default=[20, 200, 2000])
+    parser.add_argument("--texts", type=int, default=50, help="texts per measurement")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    with open(DEFAULT_RULES_PATH, encoding="utf-8") as f:
+        base = json.load(f)
+    check_cases(RuleSet(base))
+
+    print(f"{'rules':>6} {'words':>6} {'compile':>9} {'engine/text':>12} {'scan/text':>10}")
+    for count in args.rules:
+        data = synthetic_rules(base, count, rng)
+        t0 = time.perf_counter()
+        rules = RuleSet(data)
+        compile_s = time.perf_counter() - t0
+        phrases = [r["phrase"].casefold() for r in data["rules"]]
+        for words in args.words:
+            texts = [sample_text(base, words, rng) for _ in range(args.texts)]
+            engine_s = timed(lambda: [rules.analyze(t) for t in texts], args.repeat)
+            scan_s = timed(lambda: [[p for p in phrases if p in t.casefold()] for t in texts],
+                           args.repeat)
+            print(f"{count:>6} {words:>6} {compile_s * 1000:>7.1f}ms "
+                  f"{engine_s / args.texts * 1000:>10.3f}ms {scan_s / args.texts * 1000:>8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
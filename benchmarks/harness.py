@@ -0,0 +1,50 @@
+# Shared setup for the benchmark scripts: builds the real app against a
+# throwaway SQLite database so runs never touch instance/database.db.
+#
+# Run benchmarks from the repository root, e.g.
+#   python -m benchmarks.bench_login --threads 16
+import os
+import shutil
+import tempfile
+
+
+def make_app(**env):
+    """
+    Create the app against a fresh temporary database. Extra keyword arguments
+    are exported as environment variables before create_app reads them.
+    Returns (app, cleanup).
+    """
+    workdir = tempfile.mkdtemp(prefix="mediq-bench-")
+    os.environ["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    for key, value in env.items():
+        os.environ[key] = str(value)
+
+    from app import create_app
+    app = create_app()
+
+    def cleanup():
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return app, cleanup
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(label, samples, elapsed=None):
+    """Print count, throughput and latency percentiles (samples in seconds)."""
+    line = f"{label:<28} n={len(samples):<7}"
+    if elapsed:
+        line += f" {len(samples) / elapsed:9.1f} req/s"
+    line += "  p50={:.1f}ms p95={:.1f}ms p99={:.1f}ms".format(
+        percentile(samples, 50) * 1000,
+        percentile(samples, 95) * 1000,
+        percentile(samples, 99) * 1000,
+    )
+    print(line)
+
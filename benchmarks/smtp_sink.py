@@ -0,0 +1,111 @@
+# Local SMTP stand-in.
+#
+# Accepts mail on a local port, keeps every message in memory and can reject a
+# fraction of them with a temporary 451 to exercise the dispatcher's retries.
+# Point the app at it with NOTIFY_EMAIL_TRANSPORT=smtp SMTP_HOST=127.0.0.1
+# SMTP_PORT=<port>.
+#
+#   python -m benchmarks.smtp_sink --port 2525 --fail-rate 0.1
+import argparse
+import random
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+
+
+class SMTPSink:
+    def __init__(self, host="127.0.0.1", port=0, fail_rate=0.0, seed=None, verbose=False):
+        self.messages = []          # (mail_from, rcpt_to list, email.message.Message)
+        self.rejected = 0
+        self.fail_rate = fail_rate
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                self.reply("220 mediq-smtp-sink ready")
+                mail_from, rcpt = None, []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    verb = line.decode(errors="replace").strip().split(" ", 1)[0].upper()
+                    if verb in ("HELO", "EHLO"):
+                        self.reply("250 mediq-smtp-sink")
+                    elif verb == "MAIL":
+                        mail_from, rcpt = line.decode(errors="replace").strip()[10:], []
+                        self.reply("250 OK")
+                    elif verb == "RCPT":
+                        rcpt.append(line.decode(errors="replace").strip()[8:])
+                        self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        chunks = []
+                        while True:
+                            chunk = self.rfile.readline()
+                            if not chunk or chunk in (b".\r\n", b".\n"):
+                                break
+                            chunks.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                        self.reply(sink._accept(mail_from, rcpt, b"".join(chunks)))
+                        mail_from, rcpt = None, []
+                    elif verb == "RSET":
+                        mail_from, rcpt = None, []
+                        self.reply("250 OK")
+                    elif verb == "NOOP":
+                        self.reply("250 OK")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server((host, port), Handler)
+        self.host, self.port = self.server.server_address[:2]
+
+    def _accept(self, mail_from, rcpt, data):
+        with self._lock:
+            if self.fail_rate and self._rng.random() < self.fail_rate:
+                self.rejected += 1
+                return "451 Temporary failure, try again later"
+            msg = message_from_bytes(data)
+            self.messages.append((mail_from, rcpt, msg))
+        if self.verbose:
+            print(f"{mail_from} -> {', '.join(rcpt)}: {msg['Subject']}")
+        return "250 OK queued"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="smtp-sink", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    sink = SMTPSink(args.host, args.port, args.fail_rate, verbose=True).start()
+    print(f"SMTP sink listening on {sink.host}:{sink.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# gunicorn.conf.py
+#
+# Read automatically by `gunicorn app:app` when started from the repository
+# root.
+#
+# The live-update streams (/api/patient/queue_stream,
+# /api/hospital/congestion_stream) stay open for minutes, so workers are
+# gevent by default: an open stream costs one greenlet, not an OS thread, and
+# each worker holds up to GUNICORN_WORKER_CONNECTIONS connections.
+# GUNICORN_WORKER_CLASS=gthread works too, at one thread per stream. Under the
+# sync worker the stream endpoints answer 503.
+#
+# LIVE_MAX_SUBSCRIBERS is derived from the worker's real capacity unless set
+# explicitly: 90% of a gevent worker's connections, so ordinary requests keep
+# the rest, or half the threads of a gthread worker.
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+if worker_class in ('gevent', 'eventlet'):
+    _live_capacity = worker_connections * 9 // 10
+elif worker_class == 'gthread':
+    _live_capacity = threads // 2
+else:
+    _live_capacity = 0      # sync workers refuse streams anyway
+os.environ.setdefault('LIVE_MAX_SUBSCRIBERS', str(_live_capacity))
@@ -0,0 +1,254 @@
+# log_config.py
+#
+# Structured, non-blocking logging.
+#
+# Modules log through the standard library (`log = logging.getLogger(__name__)`)
+# and never print. configure() attaches one handler to the root logger: a
+# QueueHandler that formats nothing and only puts the record on a bounded
+# in-memory queue. A QueueListener thread takes records off the queue and
+# writes them to stderr, one JSON object per line. A request thread therefore
+# never waits on the output stream; if the queue is full (the stream is
+# stuck), records are dropped and counted instead of blocking the request.
+#
+# Every record carries the id of the request that produced it. The id is taken
+# from an incoming X-Request-ID header (or generated), kept in a contextvar for
+# the duration of the request and echoed back in the response header.
+#
+# Levels: LOG_LEVEL is the root level; LOG_LEVELS overrides it per module
+# ("auth=WARNING,services.queue_service=DEBUG"). Disabled levels cost one
+# integer comparison at the call site. DEBUG records that are enabled can
+# still be sampled with LOG_DEBUG_SAMPLE_RATE (0.01 keeps one in a hundred),
+# so a hot path can be traced in production without flooding the output.
+import atexit
+import contextvars
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from serialization import dumps
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# attributes every LogRecord has; anything else came in through `extra=`
+_RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps the current request id on the record in the thread that logged it."""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Keeps a `rate` fraction of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and key != 'request_id' and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        try:
+            return dumps(entry)
+        except TypeError:
+            # an `extra` value the encoder does not know; log it as text
+            return dumps({key: value if isinstance(value, (str, int, float, bool, type(None)))
+                          else str(value) for key, value in entry.items()})
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of waiting when the queue is full."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # formatting happens on the listener thread; only make the record
+        # safe to hand over (args resolved, traceback rendered)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.handler = None
+        self.listener = None
+        self.sampler = None
+        self.levels = {}
+        self._queue = None
+        self._target = None
+        self._pid = None
+
+    def configure(self, level='INFO', levels='', fmt='json', debug_sample_rate=1.0,
+                  queue_size=10000, stream=None):
+        root = logging.getLogger()
+        with self._lock:
+            self._stop()
+            if self.handler is not None:
+                root.removeHandler(self.handler)
+
+            self._target = logging.StreamHandler(stream or sys.stderr)
+            self._target.setFormatter(TextFormatter() if fmt == 'text' else JSONFormatter())
+            self._queue = queue.Queue(maxsize=int(queue_size))
+            self.handler = NonBlockingQueueHandler(self._queue)
+            self.handler.addFilter(RequestContextFilter())
+            self.sampler = DebugSampler(debug_sample_rate)
+            self.handler.addFilter(self.sampler)
+
+            root.addHandler(self.handler)
+            root.setLevel(_level(level))
+            for name in self.levels:
+                logging.getLogger(name).setLevel(logging.NOTSET)
+            self.levels = parse_levels(levels)
+            for name, value in self.levels.items():
+                logging.getLogger(name).setLevel(value)
+            self._start()
+
+    def _start(self):
+        self.listener = logging.handlers.QueueListener(
+            self._queue, self._target, respect_handler_level=True)
+        self.listener.start()
+        self._pid = os.getpid()
+
+    def _stop(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()   # flushes what is already queued
+        self.listener = None
+
+    def after_fork(self):
+        # the listener thread does not survive a fork; each worker starts its own.
+        # the lock may have been held by another thread at fork time
+        self._lock = threading.Lock()
+        with self._lock:
+            if self._queue is not None and self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self.handler.queue = self._queue
+                self._start()
+
+    def shutdown(self):
+        with self._lock:
+            self._stop()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "dropped": self.handler.dropped if self.handler is not None else 0,
+            "debug_sample_rate": self.sampler.rate if self.sampler is not None else 1.0,
+            "levels": {name: logging.getLevelName(value) for name, value in self.levels.items()},
+        }
+
+
+def _level(value):
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().upper()
+    return int(value) if value.isdigit() else logging.getLevelName(value)
+
+
+def parse_levels(value):
+    """"auth=WARNING, services.queue_service=DEBUG" -> {"auth": 30, ...}."""
+    levels = {}
+    for part in (value or '').split(','):
+        if '=' not in part:
+            continue
+        name, level = part.split('=', 1)
+        level = _level(level)
+        if not isinstance(level, int):
+            raise ValueError(f"unknown log level in LOG_LEVELS: {part.strip()!r}")
+        levels[name.strip()] = level
+    return levels
+
+
+pipeline = LogPipeline()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=pipeline.after_fork)
+atexit.register(pipeline.shutdown)
+
+
+# ===================== Flask wiring =====================
+
+def init_app(app):
+    """Request ids on every record and on every response; access log at DEBUG."""
+    from flask import g, request
+
+    access = logging.getLogger('access')
+
+    @app.before_request
+    def _bind_request_id():
+        rid = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_id = rid[:128]
+        g.request_started = time.perf_counter()
+        g.request_id_token = request_id_var.set(g.request_id)
+
+    @app.after_request
+    def _tag_response(response):
+        rid = g.get('request_id')
+        if rid:
+            response.headers[REQUEST_ID_HEADER] = rid
+            if access.isEnabledFor(logging.DEBUG):
+                access.debug("%s %s %s", request.method, request.path, response.status_code,
+                             extra={"duration_ms": round((time.perf_counter() - g.request_started) * 1000, 2)})
+        return response
+
+    @app.teardown_request
+    def _unbind_request_id(exc=None):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            try:
+                request_id_var.reset(token)
+            except ValueError:
+                pass    # torn down in a different context (streamed response)
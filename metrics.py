@@ -0,0 +1,349 @@
+# metrics.py
+#
+# Request and database instrumentation, exposed in the Prometheus text format
+# on GET /metrics.
+#
+# init_app() hooks every request: latency, status and response size per route
+# (the URL rule, e.g. /api/admin/appointments, so ids do not explode the label
+# set), and the number and total time of the SQL statements the request ran.
+# Statements are counted with SQLAlchemy before/after_cursor_execute events
+# and attributed to the request through a contextvar; statements issued by
+# background threads only reach the global counters. Time spent waiting for a
+# pooled connection is measured around the engine pool's connect().
+#
+# A request slower than `slow_ms` is logged at WARNING by the "metrics.slow"
+# logger together with the statements it ran (SQL text only, never
+# parameters), which is usually enough to spot an N+1 loop.
+#
+# Metrics are per process. Under gunicorn each worker keeps its own registry
+# and a scrape is answered by whichever worker takes it; scrape the workers
+# individually or run a single worker per metrics port.
+import contextvars
+import hmac
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+slow_log = logging.getLogger('metrics.slow')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+_WS = re.compile(r'\s+')
+
+
+# ===================== Metric types =====================
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += n
+                yield (self.name + '_bucket',
+                       _labels(self.label_names, labels, f'le="{_number(bound)}"'), cumulative)
+            yield self.name + '_sum', _labels(self.label_names, labels), series[-1]
+            yield self.name + '_count', _labels(self.label_names, labels), cumulative
+
+
+class Gauge:
+    """Read at scrape time from a callable returning {label tuple: value}."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, read, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.read = read
+
+    def samples(self):
+        for labels, value in sorted(self.read().items()):
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def add(self, metric):
+        # re-registering a name (create_app called again) replaces the old metric
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+# ===================== MediQ metrics =====================
+
+registry = Registry()
+
+requests_total = registry.add(Counter(
+    'mediq_http_requests_total', 'Requests handled, by route, method and status.',
+    ('route', 'method', 'status')))
+request_seconds = registry.add(Histogram(
+    'mediq_http_request_duration_seconds', 'Time to produce the response (headers for streams).',
+    ('route', 'method'), LATENCY_BUCKETS))
+response_bytes = registry.add(Histogram(
+    'mediq_http_response_size_bytes', 'Response body size; streamed responses are not counted.',
+    ('route', 'method'), SIZE_BUCKETS))
+request_statements = registry.add(Histogram(
+    'mediq_db_statements_per_request', 'SQL statements executed while handling one request.',
+    ('route', 'method'), COUNT_BUCKETS))
+request_sql_seconds = registry.add(Histogram(
+    'mediq_db_time_per_request_seconds', 'Total SQL execution time of one request.',
+    ('route', 'method'), LATENCY_BUCKETS))
+statements_total = registry.add(Counter(
+    'mediq_db_statements_total', 'SQL statements executed, in requests and background threads.'))
+statement_errors = registry.add(Counter(
+    'mediq_db_statement_errors_total', 'SQL statements that raised.'))
+pool_wait_seconds = registry.add(Histogram(
+    'mediq_db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.',
+    (), WAIT_BUCKETS))
+slow_requests = registry.add(Counter(
+    'mediq_http_slow_requests_total', 'Requests slower than the slow-request threshold.',
+    ('route', 'method')))
+
+
+class _RequestState:
+    __slots__ = ('started', 'statements', 'sql_seconds', 'recorded')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.recorded = []      # (sql, seconds) kept for the slow-request log
+
+
+_current = contextvars.ContextVar('metrics_request', default=None)
+
+
+class Instrumentation:
+    def __init__(self, slow_ms=500.0, max_recorded=50):
+        self.configure(slow_ms, max_recorded)
+        self._engines = set()
+
+    def configure(self, slow_ms=None, max_recorded=None):
+        if slow_ms is not None:
+            self.slow_ms = float(slow_ms)
+        if max_recorded is not None:
+            self.max_recorded = int(max_recorded)
+
+    # -------- SQL --------
+
+    def instrument_engine(self, engine):
+        if id(engine) in self._engines:
+            return
+        self._engines.add(id(engine))
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._on_error)
+        self._time_pool(engine)
+        # dispose() swaps in a fresh pool
+        event.listen(engine, 'engine_disposed', lambda *_: self._time_pool(engine))
+
+    def _time_pool(self, engine):
+        pool = engine.pool
+        if getattr(pool.connect, '_metrics_timed', False):
+            return
+        connect = pool.connect
+
+        def timed_connect():
+            started = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                pool_wait_seconds.observe(time.perf_counter() - started)
+        timed_connect._metrics_timed = True
+        pool.connect = timed_connect
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        statements_total.inc()
+        state = _current.get()
+        if state is not None:
+            state.statements += 1
+            state.sql_seconds += elapsed
+            if len(state.recorded) < self.max_recorded:
+                state.recorded.append((statement, elapsed))
+
+    def _on_error(self, exception_context):
+        statement_errors.inc()
+
+    # -------- requests --------
+
+    def start_request(self):
+        return _current.set(_RequestState())
+
+    def finish_request(self, route, method, status, size):
+        state = _current.get()
+        if state is None:
+            return
+        elapsed = time.perf_counter() - state.started
+        requests_total.inc(route, method, str(status))
+        request_seconds.observe(elapsed, route, method)
+        request_statements.observe(state.statements, route, method)
+        request_sql_seconds.observe(state.sql_seconds, route, method)
+        if size is not None:
+            response_bytes.observe(size, route, method)
+        if self.slow_ms > 0 and elapsed * 1000 >= self.slow_ms:
+            slow_requests.inc(route, method)
+            slow_log.warning(
+                "slow request %s %s: %.0f ms, %d statements (%.0f ms SQL)",
+                method, route, elapsed * 1000, state.statements, state.sql_seconds * 1000,
+                extra={
+                    "route": route, "status": status,
+                    "duration_ms": round(elapsed * 1000, 2),
+                    "statement_count": state.statements,
+                    "sql_ms": round(state.sql_seconds * 1000, 2),
+                    "statements": [{"sql": _WS.sub(' ', sql).strip()[:500], "ms": round(s * 1000, 3)}
+                                   for sql, s in state.recorded],
+                })
+        state.recorded = []
+
+    def end_request(self, token):
+        try:
+            _current.reset(token)
+        except ValueError:
+            _current.set(None)   # torn down in a different context (streamed response)
+
+
+instrumentation = Instrumentation()
+
+
+def add_gauge(name, help, read, labels=()):
+    """Expose a value read at scrape time; `read` returns {label tuple: value}."""
+    return registry.add(Gauge(name, help, read, labels))
+
+
+# ===================== Flask wiring =====================
+
+def init_app(app, token=None):
+    """Instrument requests and the app's engine, and serve GET /metrics."""
+    from flask import Response, g, request
+    from database import db
+
+    with app.app_context():
+        instrumentation.instrument_engine(db.engine)
+
+    import log_config
+    from services.live_updates import broker as live_broker
+    from services.triage_pipeline import pipeline as triage_pipeline
+    add_gauge('mediq_log_records_dropped', 'Log records dropped because the log queue was full.',
+              lambda: {(): log_config.pipeline.stats()['dropped']})
+    add_gauge('mediq_triage_queue_depth', 'Symptom reports waiting for a triage worker.',
+              lambda: {(lane,): s['depth'] for lane, s in triage_pipeline.stats()['lanes'].items()},
+              ('lane',))
+    add_gauge('mediq_live_subscribers', 'Open live-update streams.',
+              lambda: {(): live_broker.subscriber_count()})
+
+    @app.before_request
+    def _start_metrics():
+        if request.endpoint != 'metrics':
+            g.metrics_token = instrumentation.start_request()
+
+    @app.after_request
+    def _record_metrics(response):
+        if 'metrics_token' in g:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            size = None if response.is_streamed else response.calculate_content_length()
+            instrumentation.finish_request(route, request.method, response.status_code, size)
+        return response
+
+    @app.teardown_request
+    def _end_metrics(exc=None):
+        metrics_token = g.pop('metrics_token', None)
+        if metrics_token is not None:
+            instrumentation.end_request(metrics_token)
+
+    @app.route('/metrics', endpoint='metrics')
+    def metrics_endpoint():
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                             f"Bearer {token}"):
+            return Response("unauthorized\n", status=401, mimetype='text/plain')
+        return Response(registry.render(), content_type=CONTENT_TYPE)
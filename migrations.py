@@ -0,0 +1,239 @@
+# migrations.py
+#
+# Versioned, in-repo schema migrations.
+#
+# db.create_all() only creates missing tables; it never alters a table that
+# already exists. Anything that has to reach a live database (new indexes,
+# new columns, backfills) is added here as a numbered migration:
+#
+#     @migration(2, "what it does")
+#     def _my_change(conn):
+#         ...
+#
+# Migrations run in version order at startup (and via `flask db-upgrade`),
+# each in its own transaction together with its schema_migration row, and must
+# be idempotent: a fresh database has already been given the current schema by
+# create_all() when they run.
+#
+# A migration describes the schema as it was when it was written: it declares
+# the tables and helpers it needs itself instead of importing models or
+# service code that may change later.
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    Column, DateTime, Index, Integer, MetaData, String, Table, bindparam, func, inspect, select
+)
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.schema import CreateIndex
+
+log = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(fn):
+        if any(m[0] == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+# -------- helpers for migration bodies --------
+
+def create_index(conn, name, table, *columns):
+    """CREATE INDEX IF NOT EXISTS, safe to race with another worker."""
+    idx = Index(name, *(table.c[c] for c in columns))
+    conn.execute(CreateIndex(idx, if_not_exists=True))
+
+
+def add_column(conn, table, column):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there."""
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    if column.name in existing:
+        return False
+    col_type = column.type.compile(dialect=conn.dialect)
+    conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}')
+    return True
+
+
+# -------- runner --------
+
+def applied_versions(conn):
+    from models import SchemaMigration
+    table = SchemaMigration.__table__
+    return {row[0] for row in conn.execute(table.select().with_only_columns(table.c.version))}
+
+
+class _AlreadyApplied(Exception):
+    """Another process claimed the version first; leaves its transaction."""
+
+
+def run_migrations(engine):
+    """Apply every pending migration. Returns the versions applied."""
+    from models import SchemaMigration
+    table = SchemaMigration.__table__
+    table.create(engine, checkfirst=True)
+
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                if version in applied_versions(conn):
+                    raise _AlreadyApplied()
+                # claiming the version takes the write lock; only a duplicate
+                # claim means another process got here first. Errors from the
+                # migration body itself propagate.
+                try:
+                    conn.execute(table.insert().values(
+                        version=version, description=description, applied_at=datetime.utcnow()
+                    ))
+                except IntegrityError:
+                    raise _AlreadyApplied()
+                fn(conn)
+        except _AlreadyApplied:
+            continue
+        except SQLAlchemyError as e:
+            raise RuntimeError(f"Migration {version} ({description}) failed: {e}") from e
+        log.info("applied migration %s: %s", version, description)
+        applied.append(version)
+    return applied
+
+
+# ===================== Migrations =====================
+
+@migration(1, "hot-path composite indexes")
+def _hot_path_indexes(conn):
+    from models import Appointment, QueueReport, TimeSlot, Room
+    appt = Appointment.__table__
+    create_index(conn, 'ix_appointment_patient_doctor_status', appt, 'patient_id', 'doctor_id', 'status')
+    create_index(conn, 'ix_appointment_doctor_patient', appt, 'doctor_id', 'patient_id')
+    create_index(conn, 'ix_appointment_hospital_status', appt, 'hospital_id', 'status')
+    create_index(conn, 'ix_queue_report_hospital_department_timestamp', QueueReport.__table__,
+                 'hospital_id', 'department', 'timestamp')
+    create_index(conn, 'ix_time_slot_doctor_available_start', TimeSlot.__table__,
+                 'doctor_id', 'is_available', 'start_time')
+    create_index(conn, 'ix_room_status', Room.__table__, 'status')
+
+
+# appointment as migration 2 found it: date_time held free-text strings
+_appointment_v2 = Table(
+    'appointment', MetaData(),
+    Column('id', Integer, primary_key=True),
+    Column('doctor_id', Integer),
+    Column('date_time', String(50)),
+    Column('scheduled_at', DateTime),
+)
+
+
+def _parse_legacy_datetime(value):
+    """
+    The date_time strings clients stored before migration 2, as naive UTC:
+    ISO with a space or 'T', a trailing 'Z' or offset, bare dates, and the
+    duplicated "2025-10-31 2025-10-31T11:00:00" form. None if unparseable.
+    """
+    raw = str(value).strip()
+    if not raw:
+        return None
+    parts = raw.split()
+    if len(parts) > 1 and any("T" in p for p in parts):
+        raw = next(p for p in reversed(parts) if "T" in p)
+    if raw.endswith("Z"):
+        raw = raw[:-1] + "+00:00"
+    try:
+        dt = datetime.fromisoformat(raw)
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def backfill_scheduled_at(conn, batch_size=1000):
+    """
+    Copy legacy date_time strings into scheduled_at for rows that do not have
+    it yet, walking the table by primary key in batches. Returns
+    (converted, unparseable); unparseable rows are left NULL. Also run by
+    `flask normalize-appointment-dates`.
+    """
+    if 'date_time' not in {c['name'] for c in inspect(conn).get_columns('appointment')}:
+        return 0, 0     # schema created after the legacy column was dropped
+    table = _appointment_v2
+    update_stmt = (
+        table.update()
+        .where(table.c.id == bindparam('row_id'))
+        .values(scheduled_at=bindparam('parsed'))
+    )
+    converted = unparseable = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.date_time)
+            .where(table.c.id > last_id,
+                   table.c.scheduled_at.is_(None),
+                   table.c.date_time.is_not(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, raw in rows:
+            parsed = _parse_legacy_datetime(raw)
+            if parsed is None:
+                unparseable += 1
+            else:
+                updates.append({'row_id': row_id, 'parsed': parsed})
+        if updates:
+            conn.execute(update_stmt, updates)
+            converted += len(updates)
+    return converted, unparseable
+
+
+@migration(2, "native appointment.scheduled_at with backfill from date_time strings")
+def _appointment_scheduled_at(conn):
+    appt = _appointment_v2
+    add_column(conn, appt, appt.c.scheduled_at)
+    create_index(conn, 'ix_appointment_doctor_scheduled_at', appt, 'doctor_id', 'scheduled_at')
+    create_index(conn, 'ix_appointment_scheduled_at', appt, 'scheduled_at')
+    converted, unparseable = backfill_scheduled_at(conn)
+    log.info("appointment.scheduled_at backfill: %d converted, %d unparseable", converted, unparseable)
+
+
+@migration(3, "appointment.time_slot_id for atomic slot reservation")
+def _appointment_time_slot(conn):
+    from models import Appointment
+    appt = Appointment.__table__
+    add_column(conn, appt, appt.c.time_slot_id)
+    create_index(conn, 'ix_appointment_time_slot', appt, 'time_slot_id')
+
+
+@migration(4, "unique active appointment per patient and doctor")
+def _unique_active_appointment(conn):
+    from models import Appointment
+    appt = Appointment.__table__
+    duplicates = conn.execute(
+        select(func.count()).select_from(
+            select(appt.c.patient_id, appt.c.doctor_id)
+            .where(appt.c.status == 'Scheduled')
+            .group_by(appt.c.patient_id, appt.c.doctor_id)
+            .having(func.count() > 1)
+            .subquery()
+        )
+    ).scalar()
+    if duplicates:
+        # which of the duplicates is real is a decision for a person, not a migration
+        raise RuntimeError(
+            f"{duplicates} patient/doctor pairs have more than one Scheduled appointment; "
+            "cancel or complete the extras, then restart")
+    index = next(i for i in appt.indexes if i.name == 'uq_appointment_patient_doctor_scheduled')
+    conn.execute(CreateIndex(index, if_not_exists=True))
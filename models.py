@@ -1,6 +1,7 @@
 from database import db
 from datetime import datetime
 from sqlalchemy.orm import validates
+from serialization import dump
 
 class User(db.Model):
     __tablename__ = 'user'
@@ -66,16 +67,12 @@ class Room(db.Model):
     department = db.Column(db.String(100), default='General Medicine')
     floor = db.Column(db.Integer)
 
+    __table_args__ = (
+        db.Index('ix_room_status', 'status'),
+    )
+
     def to_dict(self):
-        return {
-            "room_id": self.room_id,
-            "room_number": self.room_number,
-            "status": self.status,
-            "patient_id": self.patient_id,
-            "patient_name": self.patient_name,
-            "department": self.department,
-            "floor": self.floor
-        }
+        return dump(self)
 # ===================== Nurse Tasks =====================
 
 class Task(db.Model):
@@ -90,14 +87,7 @@ class Task(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
-        return {
-            "task_id": self.task_id,
-            "nurse_id": self.nurse_id,
-            "room_id": self.room_id,
-            "description": self.description,
-            "status": self.status,
-            "created_at": str(self.created_at)
-        }
+        return dump(self)
 
 class HospitalAdministrator(User):
     __tablename__ = 'hospital_admin'
@@ -134,6 +124,10 @@ class TimeSlot(db.Model):
     is_available = db.Column(db.Boolean, default=True)
     slot_type = db.Column(db.String(50), default='consult')
 
+    __table_args__ = (
+        db.Index('ix_time_slot_doctor_available_start', 'doctor_id', 'is_available', 'start_time'),
+    )
+
     def get_duration_minutes(self):
         # naive duration — in real app, parse times
         return 30
@@ -150,7 +144,11 @@ class Appointment(db.Model):
     patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'))
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor.id'))
     hospital_id = db.Column(db.Integer, db.ForeignKey('hospital.id'))
-    date_time = db.Column(db.String(50))
+    # Databases created before migration 2 still carry the free-text
+    # `date_time` column it backfills from; fresh schemas do not have it.
+    scheduled_at = db.Column(db.DateTime)
+    # slot reserved by this appointment; released again on cancellation
+    time_slot_id = db.Column(db.Integer, db.ForeignKey('time_slot.id'))
     status = db.Column(db.String(50), default='Scheduled')  # Scheduled, Completed, Cancelled
     appointment_type = db.Column(db.String(50), default='OPD')
     notes = db.Column(db.Text)
@@ -158,6 +156,19 @@ class Appointment(db.Model):
     doctor = db.relationship('Doctor', backref='appointments', lazy=True)
     hospital = db.relationship('Hospital', backref='appointments', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_appointment_patient_doctor_status', 'patient_id', 'doctor_id', 'status'),
+        db.Index('ix_appointment_doctor_patient', 'doctor_id', 'patient_id'),
+        db.Index('ix_appointment_hospital_status', 'hospital_id', 'status'),
+        db.Index('ix_appointment_doctor_scheduled_at', 'doctor_id', 'scheduled_at'),
+        db.Index('ix_appointment_scheduled_at', 'scheduled_at'),
+        db.Index('ix_appointment_time_slot', 'time_slot_id'),
+        # at most one active appointment per patient and doctor (migration 4)
+        db.Index('uq_appointment_patient_doctor_scheduled', 'patient_id', 'doctor_id', unique=True,
+                 sqlite_where=db.text("status = 'Scheduled'"),
+                 postgresql_where=db.text("status = 'Scheduled'")),
+    )
+
 class SymptomReport(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     report_id = db.Column(db.String(50), unique=True)
@@ -182,6 +193,10 @@ class QueueReport(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_validated = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        db.Index('ix_queue_report_hospital_department_timestamp', 'hospital_id', 'department', 'timestamp'),
+    )
+
     def is_expired(self):
         # expired after 30 minutes
         from datetime import datetime, timedelta
@@ -189,3 +204,68 @@ class QueueReport(db.Model):
 
     def mark_as_validated(self):
         self.is_validated = True
+
+# ===================== Analytics =====================
+# Maintained incrementally by services/analytics_service from the write paths
+# so the admin dashboard never has to scan appointments or queue reports.
+
+class HospitalStats(db.Model):
+    __tablename__ = 'hospital_stats'
+
+    hospital_id = db.Column(db.Integer, db.ForeignKey('hospital.id'), primary_key=True)
+    appointments_total = db.Column(db.Integer, nullable=False, default=0)
+    appointments_scheduled = db.Column(db.Integer, nullable=False, default=0)
+    appointments_completed = db.Column(db.Integer, nullable=False, default=0)
+    appointments_cancelled = db.Column(db.Integer, nullable=False, default=0)
+    appointments_other = db.Column(db.Integer, nullable=False, default=0)
+    wait_time_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    wait_time_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def average_wait_time(self):
+        if not self.wait_time_count:
+            return 0
+        return self.wait_time_sum / self.wait_time_count
+
+class GlobalCounter(db.Model):
+    __tablename__ = 'global_counter'
+
+    name = db.Column(db.String(50), primary_key=True)  # users, hospitals, appointments
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+# ===================== Schema Migrations =====================
+
+class SchemaMigration(db.Model):
+    """One row per migration in migrations.py that has been applied."""
+    __tablename__ = 'schema_migration'
+
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(255))
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# ===================== Notification Outbox =====================
+# Written in the same transaction as the change that causes the notification;
+# services/notification_service delivers the rows in the background.
+
+class NotificationOutbox(db.Model):
+    __tablename__ = 'notification_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)        # booking_confirmation, reminder, emergency_alert
+    channel = db.Column(db.String(20), nullable=False)     # email, sms
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255))
+    body = db.Column(db.Text)
+    dedupe_key = db.Column(db.String(200), unique=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_notification_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('ix_notification_outbox_claim_token', 'claim_token'),
+    )
@@ -0,0 +1,249 @@
+# profiling.py
+#
+# On-demand profiling of real requests.
+#
+# Off unless PROFILE_ENABLED=1. When enabled, a request is profiled if it
+# carries "X-Profile: 1" and its bearer token belongs to an admin, or at random
+# with probability PROFILE_SAMPLE_RATE. Everything else pays one dict lookup.
+#
+# A profiled request is watched by a sampling profiler: one background thread
+# per process that, every `interval` seconds, reads the stack of each thread
+# currently being profiled (sys._current_frames) and counts it. The request
+# itself runs unmodified, so the overhead is the sampler's share of the GIL
+# and does not grow with how deep or how busy the view is. With
+# PROFILE_CPROFILE=1 the request also runs under cProfile for exact call
+# counts, at the usual cProfile cost.
+#
+# Each profile is written, off the request thread, to PROFILE_DIR as
+#   <time>_<request id>_<endpoint>.collapsed  stacks in collapsed format, one
+#                                             "frame;frame;... count" per line,
+#                                             for flamegraph.pl / speedscope
+#   <time>_<request id>_<endpoint>.json       blueprint, route, role, status,
+#                                             duration, sample count
+#   <time>_<request id>_<endpoint>.prof       pstats dump (PROFILE_CPROFILE=1)
+# The root frame of every stack is "<blueprint>:<route> [<role>]", so the
+# collapsed files of many requests can be concatenated into one flamegraph.
+# Only the newest PROFILE_MAX_FILES profiles are kept.
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from serialization import dumps
+
+log = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ROLE = 'admin'
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class _Session:
+    __slots__ = ('thread_id', 'started', 'stacks', 'samples', 'cprofile')
+
+    def __init__(self, thread_id, cprofile=None):
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self.cprofile = cprofile
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._sessions = {}     # thread id -> _Session
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self, cprofile=False):
+        session = _Session(threading.get_ident(), cProfile.Profile() if cprofile else None)
+        with self._lock:
+            self._sessions[session.thread_id] = session
+        self._ensure_thread()
+        self._wakeup.set()
+        if session.cprofile is not None:
+            session.cprofile.enable()
+        return session
+
+    def stop(self, session):
+        if session.cprofile is not None:
+            session.cprofile.disable()
+        with self._lock:
+            self._sessions.pop(session.thread_id, None)
+        return time.perf_counter() - session.started
+
+    def _ensure_thread(self):
+        # threads do not survive a fork; each worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='request-profiler', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                active = list(self._sessions.values())
+            if not active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            for session in active:
+                frame = frames.get(session.thread_id)
+                if frame is None or session.thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                with self._lock:
+                    # a session stopped meanwhile may already be being written
+                    if session.thread_id in self._sessions:
+                        session.stacks[tuple(stack)] += 1
+                        session.samples += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.directory = None
+        self.max_files = 500
+        self.cprofile = False
+        self.sampler = SamplingProfiler()
+        self._writer = None
+        self._writer_pid = None
+
+    def configure(self, enabled=None, sample_rate=None, directory=None, interval=None,
+                  max_files=None, cprofile=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if sample_rate is not None:
+            self.sample_rate = float(sample_rate)
+        if directory is not None:
+            self.directory = directory
+        if interval is not None:
+            self.sampler.interval = float(interval)
+        if max_files is not None:
+            self.max_files = int(max_files)
+        if cprofile is not None:
+            self.cprofile = bool(cprofile)
+
+    def wants(self, headers):
+        """Whether to profile a request with these headers."""
+        if not self.enabled:
+            return False
+        if headers.get(PROFILE_HEADER) == '1':
+            from auth import get_current_user
+            user = get_current_user()
+            if user is not None and user.role == PROFILE_ROLE:
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        return self.sampler.start(self.cprofile)
+
+    def finish(self, session, tags):
+        duration = self.sampler.stop(session)
+        tags = dict(tags, duration_ms=round(duration * 1000, 2), samples=session.samples,
+                    interval_ms=self.sampler.interval * 1000)
+        if self._writer is None or self._writer_pid != os.getpid():
+            # an executor inherited through fork has no threads; start one per worker
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='profile-writer')
+            self._writer_pid = os.getpid()
+        self._writer.submit(self._write, session, tags)
+
+    def _write(self, session, tags):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+            name = _UNSAFE.sub('_', f"{stamp}_{tags.get('request_id') or 'req'}_{tags.get('endpoint')}")
+            base = os.path.join(self.directory, name)
+            root = f"{tags.get('blueprint') or 'app'}:{tags.get('route')} [{tags.get('role') or 'anonymous'}]"
+            with open(base + '.collapsed', 'w') as f:
+                for stack, count in session.stacks.most_common():
+                    line = ';'.join(frame.replace(';', ',') for frame in (root,) + stack)
+                    f.write(f"{line} {count}\n")
+            if session.cprofile is not None:
+                session.cprofile.dump_stats(base + '.prof')
+            with open(base + '.json', 'w') as f:
+                f.write(dumps(tags))
+            log.info("request profiled", extra={"profile": base, **{
+                k: tags[k] for k in ('route', 'duration_ms', 'samples')}})
+            self._prune()
+        except Exception:
+            log.exception("writing request profile failed")
+
+    def _prune(self):
+        profiles = sorted(f for f in os.listdir(self.directory) if f.endswith('.json'))
+        for stale in profiles[:max(0, len(profiles) - self.max_files)]:
+            stem = stale[:-len('.json')]
+            for ext in ('.json', '.collapsed', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, stem + ext))
+                except FileNotFoundError:
+                    pass
+
+
+profiler = RequestProfiler()
+
+
+# ===================== Flask wiring =====================
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def _start_profile():
+        if profiler.enabled and request.endpoint != 'metrics' and profiler.wants(request.headers):
+            g.profile_session = profiler.start()
+
+    @app.teardown_request
+    def _finish_profile(exc=None):
+        session = g.pop('profile_session', None)
+        if session is None:
+            return
+        principal = g.get('principal')
+        rule = request.url_rule
+        profiler.finish(session, {
+            "request_id": g.get('request_id'),
+            "method": request.method,
+            "path": request.path,
+            "route": rule.rule if rule is not None else 'unmatched',
+            "endpoint": request.endpoint,
+            "blueprint": request.blueprint,
+            "role": principal.role if principal is not None else None,
+            "user_id": principal.id if principal is not None else None,
+            "status": g.get('profile_status'),
+            "error": type(exc).__name__ if exc is not None else None,
+        })
+
+    @app.after_request
+    def _profile_status(response):
+        if 'profile_session' in g:
+            g.profile_status = response.status_code
+            response.headers['X-Profile-Id'] = g.get('request_id') or ''
+        return response
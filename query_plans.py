@@ -0,0 +1,206 @@
+# query_plans.py
+#
+# EXPLAIN-based guard for the hot queries issued by services and routes.
+#
+# Each entry in HOT_QUERIES calls the statement builder the application
+# itself executes (the *_stmt functions next to each query), with sample
+# arguments, so what is checked cannot drift from what runs. `flask
+# check-query-plans` asks SQLite for the plan of each one and fails if any of
+# them has to scan a whole table, which is how a dropped index or an
+# un-indexable filter shows up long before it shows up in latency. When
+# adding a new hot query to a route or service, build it in a *_stmt function
+# and register that here too.
+from datetime import datetime, timedelta
+
+HOT_QUERIES = []
+
+
+def hot_query(name):
+    def decorator(fn):
+        HOT_QUERIES.append((name, fn))
+        return fn
+    return decorator
+
+
+# -------- appointment_service --------
+
+@hot_query("appointment_service.validate_booking_rules")
+def _q_booking_rules():
+    from services.appointment_service import active_appointment_stmt
+    return active_appointment_stmt(1, 1)
+
+
+@hot_query("appointment_service.book_appointment (slot by id)")
+def _q_slot_by_id():
+    from services.appointment_service import slot_lookup_stmt
+    return slot_lookup_stmt(1, slot_id='TS-1')
+
+
+@hot_query("appointment_service.book_appointment (slot by start time)")
+def _q_slot_by_start():
+    from services.appointment_service import slot_lookup_stmt
+    return slot_lookup_stmt(1, scheduled_at=datetime(2025, 1, 1, 10))
+
+
+@hot_query("appointment_service.book_appointment (doctor publishes slots)")
+def _q_doctor_has_slots():
+    from services.appointment_service import doctor_has_slots_stmt
+    return doctor_has_slots_stmt(1)
+
+
+# -------- availability_index --------
+
+@hot_query("availability_index._verified")
+def _q_verify_free_slots():
+    from services.availability_index import free_slots_stmt
+    return free_slots_stmt([1, 2, 3])
+
+
+@hot_query("availability_index.sync (new slots)")
+def _q_new_slots():
+    from services.availability_index import new_slots_stmt
+    return new_slots_stmt(100)
+
+
+# -------- queue_service / queue_stats --------
+
+@hot_query("queue_service.predict_wait_time (scheduled count)")
+def _q_scheduled_count():
+    from services.queue_service import scheduled_count_stmt
+    return scheduled_count_stmt(1)
+
+
+@hot_query("queue_stats.sync (new reports)")
+def _q_new_reports():
+    from services.queue_stats import new_reports_stmt
+    return new_reports_stmt(100)
+
+
+# -------- routes --------
+
+@hot_query("patient_routes.list_patient_appointments")
+def _q_patient_appointments():
+    from routes.patient_routes import patient_appointments_stmt
+    return patient_appointments_stmt(1)
+
+
+@hot_query("patient_routes.queue_status (active appointment)")
+def _q_active_appointment():
+    from routes.patient_routes import active_appointment_stmt
+    return active_appointment_stmt(1)
+
+
+@hot_query("doctor_routes.get_appointments")
+def _q_doctor_appointments():
+    from routes.doctor_routes import doctor_appointments_stmt
+    return doctor_appointments_stmt(1)
+
+
+@hot_query("doctor_routes.get_appointments (date window)")
+def _q_doctor_appointments_window():
+    from routes.doctor_routes import doctor_appointments_stmt
+    day = datetime(2025, 1, 1)
+    return doctor_appointments_stmt(1, day, day + timedelta(days=1))
+
+
+@hot_query("doctor_routes.get_doctor_patients")
+def _q_doctor_patients():
+    from routes.doctor_routes import doctor_visits_stmt
+    return doctor_visits_stmt(1)
+
+
+@hot_query("nurse_routes.get_queue")
+def _q_nurse_queue():
+    from routes.nurse_routes import hospital_queue_stmt
+    return hospital_queue_stmt(1)
+
+
+@hot_query("admin_routes.get_all_appointments (keyset page)")
+def _q_admin_appointments_page():
+    from routes.admin_routes import appointment_rows_stmt
+    return appointment_rows_stmt(after_id=100).limit(101)
+
+
+@hot_query("auth_routes.login")
+def _q_login():
+    from routes.auth_routes import user_by_email_stmt
+    return user_by_email_stmt('someone@example.com')
+
+
+# -------- notification_service --------
+
+@hot_query("notification_service.dispatcher (claim due rows)")
+def _q_outbox_due():
+    from services.notification_service import dispatcher
+    return dispatcher.due_stmt(datetime(2025, 1, 1, 10))
+
+
+@hot_query("notification_service.dispatcher (claimed rows)")
+def _q_outbox_claimed():
+    from services.notification_service import claimed_stmt
+    return claimed_stmt('x')
+
+
+@hot_query("notification_service.enqueue (dedupe)")
+def _q_outbox_dedupe():
+    from services.notification_service import dedupe_stmt
+    return dedupe_stmt('x')
+
+
+# -------- reminder_scheduler --------
+
+@hot_query("reminder_scheduler._load (window)")
+def _q_reminder_window():
+    from services.reminder_scheduler import window_stmt
+    start = datetime(2025, 1, 1, 10)
+    return window_stmt(start, start + timedelta(hours=1))
+
+
+# -------- checker --------
+
+def explain(conn, stmt):
+    """Return SQLite's EXPLAIN QUERY PLAN detail lines for a statement."""
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(params[name] for name in compiled.positiontup)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan, table_names):
+    """
+    Plan lines that walk a whole table. A SCAN through a covering index still
+    reads every entry, so only SEARCH counts as indexed access; SCANs of
+    subqueries and temp b-trees are fine.
+    """
+    bad = []
+    for line in plan:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0] == 'SCAN' and parts[1] in table_names:
+            bad.append(line)
+    return bad
+
+
+def check_query_plans(engine):
+    """
+    Returns (ok, report_lines). Only meaningful on SQLite; other dialects
+    are reported as skipped.
+    """
+    from database import db
+    if engine.dialect.name != 'sqlite':
+        return True, [f"skipped: query plan check only supports sqlite, not {engine.dialect.name}"]
+
+    table_names = set(db.metadata.tables)
+    ok = True
+    report = []
+    with engine.connect() as conn:
+        for name, build in HOT_QUERIES:
+            plan = explain(conn, build())
+            bad = full_scans(plan, table_names)
+            if bad:
+                ok = False
+                report.append(f"FAIL {name}: " + "; ".join(bad))
+            else:
+                report.append(f"ok   {name}: " + "; ".join(plan))
+    return ok, report
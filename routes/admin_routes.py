@@ -1,42 +1,29 @@
-from flask import Blueprint, request, jsonify
-from auth import role_required
+import logging
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from auth import role_required, invalidate_principal
 from models import User, Hospital, Appointment, QueueReport,Patient,Doctor
 from database import db
 from sqlalchemy import func
+from services.password_service import hash_password, PasswordPoolBusy, busy_response
+from services import analytics_service
+from services.prediction_cache import prediction_cache
+from services.triage_pipeline import pipeline as triage_pipeline
+from services import notification_service
+from services.reminder_scheduler import scheduler as reminders
+from serialization import dumps, registry as serializers
 from datetime import datetime
 
 admin_bp = Blueprint('admin_bp', __name__)
+log = logging.getLogger(__name__)
 
 # ========================= Analytics =========================
 
 @admin_bp.route('/view_analytics', methods=['GET'])
 @role_required('admin')
 def view_analytics(user):
-    hospitals = Hospital.query.all()
-    data = []
-
-    for h in hospitals:
-        
-        appt_count = Appointment.query.filter_by(hospital_id=h.id).count()
-
-        
-        avg_wait = (
-            db.session.query(func.avg(QueueReport.wait_time_reported))
-            .filter_by(hospital_id=h.id)
-            .scalar()
-        ) or 0
-
-        
-        congestion = getattr(h, "current_congestion_level", 0)
-
-        data.append({
-            "hospital_id": h.hospital_id,
-            "name": h.name,
-            "appointment_count": appt_count,
-            "average_wait_time": round(avg_wait, 2),
-            "congestion": congestion
-        })
-
+    # one join over hospital + hospital_stats; counters are kept current by the write paths
+    data = analytics_service.get_hospital_analytics()
     return jsonify({"analytics": data}), 200
 
 
@@ -44,63 +31,107 @@ def view_analytics(user):
 @admin_bp.route('/stats', methods=['GET'])
 @role_required('admin')
 def admin_stats(user):
-    user_count = User.query.count()
-    hospital_count = Hospital.query.count()
-    appointment_count = Appointment.query.count()
+    counts = analytics_service.get_global_counts()
 
     return jsonify({
-        "total_users": user_count,
-        "total_hospitals": hospital_count,
-        "total_appointments": appointment_count
+        "total_users": counts['users'],
+        "total_hospitals": counts['hospitals'],
+        "total_appointments": counts['appointments']
     }), 200
 
-#==========================Get Appointments=========================@admin_bp.route("/appointments", methods=["GET"])
+
+@admin_bp.route('/triage_pipeline', methods=['GET'])
+@role_required('admin')
+def triage_pipeline_stats(user):
+    # per-process: each gunicorn worker runs its own triage queue
+    return jsonify(triage_pipeline.stats()), 200
+
+
+@admin_bp.route('/notifications', methods=['GET'])
+@role_required('admin')
+def notification_stats(user):
+    # outbox counts are global; dispatcher and reminder counters are for this worker process
+    return jsonify({
+        "outbox": notification_service.outbox_counts(),
+        "dispatcher": notification_service.dispatcher.stats(),
+        "reminders": reminders.stats(),
+    }), 200
+
+#==========================Get Appointments=========================
+APPOINTMENTS_PAGE_DEFAULT = 100
+APPOINTMENTS_PAGE_MAX = 1000
+APPOINTMENTS_STREAM_BATCH = 1000
+
+
+def appointment_rows_stmt(after_id=None):
+    """
+    Appointments with patient/doctor/hospital names resolved in one joined
+    query, ordered by id so the id doubles as a keyset cursor.
+    """
+    stmt = serializers['admin_appointment'].select().order_by(Appointment.id)
+    if after_id is not None:
+        stmt = stmt.where(Appointment.id > after_id)
+    return stmt
+
+
 @admin_bp.route("/appointments", methods=["GET"])
 @role_required("admin")
 def get_all_appointments(user):
     """
-    Returns all appointments with doctor, patient, and hospital info.
+    Returns appointments with doctor, patient, and hospital info.
+
+    Paged by keyset: ?limit=N (default 100, max 1000) and ?cursor=<next_cursor
+    from the previous page>. ?stream=ndjson or ?stream=json instead streams
+    every appointment after the cursor, one row at a time, in constant memory.
     """
     try:
-        appointments = Appointment.query.all()
-        data = []
-
-        for a in appointments:
-            patient = Patient.query.get(a.patient_id)
-            doctor = Doctor.query.get(a.doctor_id)
-            hospital = Hospital.query.get(a.hospital_id)
-
-            # handle both datetime and string
-            date_str = "N/A"
-            time_str = "N/A"
-            if a.date_time:
-                if isinstance(a.date_time, str):
-                    try:
-                        parsed_dt = datetime.fromisoformat(a.date_time)
-                        date_str = parsed_dt.strftime("%Y-%m-%d")
-                        time_str = parsed_dt.strftime("%H:%M")
-                    except ValueError:
-                        date_str = a.date_time[:10]
-                        time_str = a.date_time[11:16] if "T" in a.date_time else "N/A"
-                else:
-                    date_str = a.date_time.strftime("%Y-%m-%d")
-                    time_str = a.date_time.strftime("%H:%M")
-
-            data.append({
-                "id": a.id,
-                "patient": patient.name if patient else "Unknown",
-                "doctor": doctor.name if doctor else "Unknown",
-                "hospital": hospital.name if hospital else "Unknown",
-                "date": date_str,
-                "time": time_str,
-                "status": a.status or "Scheduled"
-            })
-
-        return jsonify({"appointments": data}), 200
+        cursor = request.args.get("cursor", type=int)
+        stream = request.args.get("stream")
+        stmt = appointment_rows_stmt(after_id=cursor)
+
+        if stream in ("ndjson", "json"):
+            return _stream_appointments(stmt, stream)
+        if stream:
+            return jsonify({"error": "stream must be 'ndjson' or 'json'"}), 400
+
+        limit = request.args.get("limit", APPOINTMENTS_PAGE_DEFAULT, type=int)
+        limit = max(1, min(limit, APPOINTMENTS_PAGE_MAX))
+
+        # fetch one extra row to learn whether another page exists
+        rows = db.session.execute(stmt.limit(limit + 1)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        data = serializers['admin_appointment'].rows(rows)
+
+        return jsonify({
+            "appointments": data,
+            "next_cursor": str(rows[-1][0]) if has_more else None,
+            "limit": limit
+        }), 200
 
     except Exception as e:
-        print("Error fetching appointments:", e)
+        log.exception("fetching appointments failed")
         return jsonify({"error": str(e)}), 500
+
+
+def _stream_appointments(stmt, fmt):
+    to_dict = serializers['admin_appointment'].from_row
+
+    def generate():
+        result = db.session.execute(stmt.execution_options(yield_per=APPOINTMENTS_STREAM_BATCH))
+        if fmt == "ndjson":
+            for row in result:
+                yield dumps(to_dict(row)) + "\n"
+            return
+        yield '{"appointments": ['
+        first = True
+        for row in result:
+            yield ("" if first else ",") + dumps(to_dict(row))
+            first = False
+        yield "]}"
+
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
     
 # ========================= User Management =========================
 @admin_bp.route('/users', methods=['GET'])
@@ -130,13 +161,19 @@ def create_user(user):
     if User.query.filter_by(email=data['email']).first():
         return jsonify({"error": "User already exists"}), 400
 
+    try:
+        password_hash = hash_password(data['password'])
+    except PasswordPoolBusy:
+        return busy_response()
+
     new_user = User(
         name=data['name'],
         email=data['email'],
         role=data['role'],
+        password_hash=password_hash,
     )
-    new_user.set_password(data['password'])
     db.session.add(new_user)
+    analytics_service.bump_counter('users')
     db.session.commit()
 
     return jsonify({"message": "User created successfully"}), 201
@@ -160,6 +197,8 @@ def delete_user(user, user_id):
                 doctor = Doctor.query.filter_by(name=u.name).first()
 
             if doctor:
+                analytics_service.forget_appointments(Appointment.doctor_id == doctor.id)
+                analytics_service.forget_queue_reports(QueueReport.submitted_by == u.name)
                 Appointment.query.filter_by(doctor_id=doctor.id).delete()
                 QueueReport.query.filter_by(submitted_by=u.name).delete()
                 db.session.delete(doctor)
@@ -172,6 +211,8 @@ def delete_user(user, user_id):
                 patient = Patient.query.filter_by(name=u.name).first()
 
             if patient:
+                analytics_service.forget_appointments(Appointment.patient_id == patient.id)
+                analytics_service.forget_queue_reports(QueueReport.submitted_by == u.name)
                 Appointment.query.filter_by(patient_id=patient.id).delete()
                 Room.query.filter_by(patient_id=patient.id).update({
                     "status": "available",
@@ -183,17 +224,21 @@ def delete_user(user, user_id):
 
         
         elif u.role == "nurse":
+            analytics_service.forget_queue_reports(QueueReport.submitted_by == u.name)
             QueueReport.query.filter_by(submitted_by=u.name).delete()
 
        
         db.session.delete(u)
+        analytics_service.bump_counter('users', -1)
         db.session.commit()
+        invalidate_principal(user_id)
+        prediction_cache.clear()  # bulk-deleted appointments may span hospitals
 
         return jsonify({"message": f"User {u.name} and related records deleted successfully"}), 200
 
     except Exception as e:
         db.session.rollback()
-        print("Error deleting user:", e)
+        log.exception("deleting user failed", extra={"target_user_id": user_id})
         return jsonify({"error": str(e)}), 500
 
 
@@ -211,4 +256,5 @@ def approve_patient(user):
 
     patient.is_registered = True
     db.session.commit()
+    invalidate_principal(patient.id)
     return jsonify({"message": "Patient approved", "patient_id": patient.id}), 200
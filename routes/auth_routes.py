@@ -1,11 +1,20 @@
+import logging
+
 from flask import Blueprint, request, jsonify, current_app
 from database import db
+from sqlalchemy import select
 
 from models import User, Patient, Doctor, HospitalAdministrator,Nurse
-from passlib.hash import pbkdf2_sha256
 from auth import generate_jwt
+from services.password_service import hash_password, verify_and_update, PasswordPoolBusy, busy_response
+from services import analytics_service
 
 auth_bp = Blueprint('auth_bp', __name__)
+log = logging.getLogger(__name__)
+
+def user_by_email_stmt(email):
+    """Also EXPLAINed by query_plans."""
+    return select(User).where(User.email == email)
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -14,24 +23,29 @@ def register():
     if not all(k in data for k in required):
         return jsonify({"error": "Missing fields"}), 400
     role = data.get('role')
+    # reject bad requests before spending a hashing pool slot on them
+    if role not in ('nurse', 'patient', 'doctor', 'admin'):
+        return jsonify({"error": "Unsupported role"}), 400
     existing = User.query.filter_by(email=data.get('email')).first()
     if existing:
         return jsonify({"error": "Email already exists"}), 400
 
+    try:
+        pwd = hash_password(data.get('password'))
+    except PasswordPoolBusy:
+        return busy_response()
     # create based on role
-    pwd = pbkdf2_sha256.hash(data.get('password'))
     if role == 'nurse':
         u = Nurse(name=data.get('name'), email=data.get('email'), phone=data.get('phone'), password_hash=pwd)
     elif role == 'patient':
         u = Patient(name=data.get('name'), email=data.get('email'), phone=data.get('phone'), password_hash=pwd)
     elif role == 'doctor':
         u = Doctor(name=data.get('name'), email=data.get('email'), phone=data.get('phone'), password_hash=pwd, specialty=data.get('specialty'))
-    elif role == 'admin':
-        u = HospitalAdministrator(name=data.get('name'), email=data.get('email'), phone=data.get('phone'), password_hash=pwd)
     else:
-        return jsonify({"error": "Unsupported role"}), 400
+        u = HospitalAdministrator(name=data.get('name'), email=data.get('email'), phone=data.get('phone'), password_hash=pwd)
 
     db.session.add(u)
+    analytics_service.bump_counter('users')
     db.session.commit()
     return jsonify({"message": "User registered", "user_id": u.id}), 201
 
@@ -40,16 +54,21 @@ def login():
     data = request.json
     if not data or 'email' not in data or 'password' not in data:
         return jsonify({"error": "Missing credentials"}), 400
-    user = User.query.filter_by(email=data.get('email')).first()
-    user = User.query.filter_by(email=data.get('email')).first()
-    print("Login attempt:", data.get('email'))
-    print("User found:", user)
+    user = db.session.scalars(user_by_email_stmt(data.get('email'))).first()
     if not user:
-        print("No such user in DB")
+        log.info("login failed: unknown email")
         return jsonify({"error": "Invalid credentials"}), 401
-    if not pbkdf2_sha256.verify(data.get('password'), user.password_hash):
-        print("Password mismatch")
+    try:
+        ok, new_hash = verify_and_update(data.get('password'), user.password_hash)
+    except PasswordPoolBusy:
+        return busy_response()
+    if not ok:
+        log.info("login failed: wrong password", extra={"user_id": user.id})
         return jsonify({"error": "Invalid credentials"}), 401
+    if new_hash:
+        # rounds policy changed since this hash was made; upgrade it transparently
+        user.password_hash = new_hash
+        db.session.commit()
     payload = {"user_id": user.id, "role": user.role, "name": user.name}
     token = generate_jwt(payload)
     return jsonify({"access_token": token, "user_id": user.id, "role": user.role})
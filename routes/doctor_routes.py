@@ -2,42 +2,56 @@ from flask import Blueprint, request, jsonify
 from auth import role_required
 from models import Appointment, Doctor, Patient, TimeSlot
 from database import db
-import time
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from services.appointment_service import parse_date_window, apply_date_window, release_slot, reserve_slot
+from services import analytics_service
+from services.prediction_cache import invalidate_predictions
+from services import live_updates
+from services.id_generator import new_id
+from services.availability_index import index as availability
+from services.schedule_service import apply_template
+from services.reminder_scheduler import scheduler as reminders
 from datetime import datetime
+from serialization import registry as serializers
 
 doctor_bp = Blueprint('doctor_bp', __name__)
 
+APPOINTMENT_STATUSES = ('Scheduled', 'Completed', 'Cancelled')
+
+# statements shared with query_plans
+
+def doctor_appointments_stmt(doctor_id, start=None, end=None):
+    stmt = serializers['doctor_appointment'].select().where(Appointment.doctor_id == doctor_id)
+    return apply_date_window(stmt, start, end).order_by(Appointment.scheduled_at)
+
+
+def doctor_visits_stmt(doctor_id):
+    """Visit count, last booking and last visit per patient of one doctor."""
+    return (
+        select(
+            Appointment.patient_id.label('patient_id'),
+            func.count(Appointment.id).label('total_appointments'),
+            func.max(Appointment.created_at).label('last_booked_at'),
+            func.max(Appointment.scheduled_at).label('last_visit'),
+        )
+        .where(Appointment.doctor_id == doctor_id)
+        .group_by(Appointment.patient_id)
+    )
+
 # -----------------------------------------------------------
-# GET /doctor/appointments
+# GET /doctor/appointments?date=YYYY-MM-DD | ?from=...&to=...
 # -----------------------------------------------------------
 @doctor_bp.route('/appointments', methods=['GET'])
 @role_required('doctor')
 def get_appointments(user):
-    appts = Appointment.query.filter_by(doctor_id=user.id).all()
-    output = []
-
-    for a in appts:
-       
-        if isinstance(a.date_time, str):
-            raw_time = a.date_time
-        else:
-            raw_time = a.date_time.isoformat() if a.date_time else None
-
-        # Clean malformed values like "2025-10-31 2025-10-31T11:00:00"
-        if raw_time and " " in raw_time and "T" in raw_time:
-            parts = raw_time.split()
-            raw_time = parts[-1] if "T" in parts[-1] else parts[0]
+    try:
+        start, end = parse_date_window(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        
-        clean_time = raw_time.replace(" ", "T") if raw_time else None
-
-        output.append({
-            "appointment_id": a.appointment_id,
-            "patient_id": a.patient_id,
-            "status": a.status,
-            "date_time": clean_time,
-            "notes": a.notes
-        })
+    serializer = serializers['doctor_appointment']
+    output = serializer.rows(db.session.execute(doctor_appointments_stmt(user.id, start, end)))
 
     return jsonify(output), 200
 
@@ -50,11 +64,31 @@ def update_status(user):
     data = request.json
     appointment_id = data.get('appointment_id')
     new_status = data.get('status')
+    if new_status not in APPOINTMENT_STATUSES:
+        return jsonify({"error": f"status must be one of {', '.join(APPOINTMENT_STATUSES)}"}), 400
     a = Appointment.query.filter_by(appointment_id=appointment_id, doctor_id=user.id).first()
     if not a:
         return jsonify({"error": "Appointment not found"}), 404
+    changed_slot = None
+    if new_status == 'Cancelled' and a.status != 'Cancelled':
+        changed_slot = release_slot(a)
+    elif a.status == 'Cancelled' and new_status != 'Cancelled' and a.time_slot_id is not None:
+        # the slot was released on cancellation; take it back in this transaction
+        if not reserve_slot(a.time_slot_id):
+            db.session.rollback()
+            return jsonify({"error": "Slot already booked", "conflict": True}), 409
+        changed_slot = a.time_slot_id
+    analytics_service.record_status_change(a.hospital_id, a.status, new_status)
     a.status = new_status
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Patient already has an active appointment with this doctor"}), 409
+    invalidate_predictions(a.hospital_id)
+    availability.touch([changed_slot])
+    reminders.update(a)
+    live_updates.publish_appointment(a)
     return jsonify({"message": "Status updated", "appointment_id": a.appointment_id, "status": a.status}), 200
 
 # -----------------------------------------------------------
@@ -72,6 +106,15 @@ def update_availability(user):
         return jsonify({"error": "Doctor not found"}), 404
 
     created, skipped = [], []
+    new_slots = []
+
+    # one query for every client-supplied slot_id instead of one per slot
+    requested_ids = [ts.get('slot_id') for ts in timeslots if isinstance(ts, dict) and ts.get('slot_id')]
+    taken_ids = set()
+    if requested_ids:
+        taken_ids = {
+            sid for sid, in db.session.query(TimeSlot.slot_id).filter(TimeSlot.slot_id.in_(requested_ids))
+        }
 
     for ts in timeslots:
         try:
@@ -90,20 +133,15 @@ def update_availability(user):
             end_dt = datetime.strptime(f"{date_str} {end_time_str}", "%Y-%m-%d %H:%M")
 
             
-            slot_id = ts.get('slot_id') or f"TS-{user.id}-{int(time.time())}"
-
-            
-            existing = TimeSlot.query.filter_by(
-                slot_id=slot_id,
-                doctor_id=user.id
-            ).first()
+            slot_id = ts.get('slot_id') or new_id(f"TS-{user.id}-")
 
-            if existing:
+            if slot_id in taken_ids:
                 skipped.append({
                     "slot_id": slot_id,
                     "reason": "Already exists"
                 })
                 continue
+            taken_ids.add(slot_id)
 
             
             slot = TimeSlot(
@@ -117,6 +155,7 @@ def update_availability(user):
             )
 
             db.session.add(slot)
+            new_slots.append(slot)
             created.append(slot.slot_id)
 
         except ValueError as e:
@@ -131,7 +170,10 @@ def update_availability(user):
                 "reason": f"Unexpected error: {str(e)}"
             })
 
+    db.session.flush()
+    new_slot_pks = [s.id for s in new_slots]
     db.session.commit()
+    availability.touch(new_slot_pks)
 
     return jsonify({
         "message": "Availability updated successfully",
@@ -139,6 +181,26 @@ def update_availability(user):
         "skipped_slots": skipped
     }), 201
 
+# -----------------------------------------------------------
+# POST /doctor/schedule_template[?dry_run=1]
+# Expand a recurring weekly template into slots (see schedule_service).
+# -----------------------------------------------------------
+@doctor_bp.route('/schedule_template', methods=['POST'])
+@role_required('doctor')
+def schedule_template(user):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON template"}), 400
+    doctor = Doctor.query.filter_by(id=user.id).first()
+    if not doctor:
+        return jsonify({"error": "Doctor not found"}), 404
+
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes') or bool(data.get('dry_run'))
+    result, error = apply_template(doctor, data, dry_run=dry_run)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify(result), 200 if dry_run else 201
+
 # -----------------------------------------------------------
 # DELETE /doctor/delete_slot
 # -----------------------------------------------------------
@@ -153,8 +215,10 @@ def delete_slot(user):
     if not slot:
         return jsonify({"error": f"Slot {slot_id} not found or not owned by this doctor"}), 404
 
+    slot_pk = slot.id
     db.session.delete(slot)
     db.session.commit()
+    availability.touch([slot_pk])
     return jsonify({"message": f"Slot {slot_id} deleted successfully"}), 200
 
 # -----------------------------------------------------------
@@ -210,32 +274,17 @@ def get_available_slots(doctor_id):
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
     
    
-    start_of_day = datetime.combine(target_date, datetime.min.time())
-    end_of_day = datetime.combine(target_date, datetime.max.time())
-    
-    slots = TimeSlot.query.filter(
-        TimeSlot.doctor_id == doctor_id,
-        TimeSlot.is_available == True,
-        TimeSlot.start_time >= start_of_day,
-        TimeSlot.start_time <= end_of_day
-    ).order_by(TimeSlot.start_time).all()
-    
+    # served from the in-memory availability index
+    slots = availability.day(doctor_id, target_date)
+
     available_slots = []
     for slot in slots:
-       
-        if isinstance(slot.start_time, str):
-            start_dt = datetime.fromisoformat(slot.start_time.replace('Z', '+00:00'))
-            end_dt = datetime.fromisoformat(slot.end_time.replace('Z', '+00:00'))
-        else:
-            start_dt = slot.start_time
-            end_dt = slot.end_time
-        
         available_slots.append({
             "slot_id": slot.slot_id,
-            "start_time": start_dt.isoformat(),  
-            "end_time": end_dt.isoformat(),      
-            "date": start_dt.strftime("%Y-%m-%d"),
-            "is_available": slot.is_available,
+            "start_time": slot.start_time.isoformat(),
+            "end_time": slot.end_time.isoformat() if slot.end_time else None,
+            "date": slot.start_time.strftime("%Y-%m-%d"),
+            "is_available": True,
             "slot_type": slot.slot_type
         })
     
@@ -247,48 +296,75 @@ def get_available_slots(doctor_id):
     }), 200
 
 # -----------------------------------------------------------
-# GET /doctor/patients
+# GET /doctor/patients?sort=last_visit|visits&order=desc&page=1&per_page=100
 # -----------------------------------------------------------
+PATIENTS_PER_PAGE_DEFAULT = 100
+PATIENTS_PER_PAGE_MAX = 500
+
 @doctor_bp.route('/patients', methods=['GET'])
 @role_required('doctor')
 def get_doctor_patients(user):
     """
-    Get all unique patients who have appointments with this doctor
+    Get all unique patients who have appointments with this doctor.
+    One grouped query computes visit count and last visit per patient; paging
+    info is returned in X-Total-Count / X-Page / X-Per-Page headers.
     """
-    from sqlalchemy import distinct
-    
-   
-    patient_ids = db.session.query(distinct(Appointment.patient_id)).filter(
-        Appointment.doctor_id == user.id
-    ).all()
-    
+    sort = request.args.get('sort', 'last_visit')
+    order = request.args.get('order', 'desc')
+    if sort not in ('last_visit', 'visits') or order not in ('asc', 'desc'):
+        return jsonify({"error": "sort must be last_visit|visits and order asc|desc"}), 400
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = request.args.get('per_page', PATIENTS_PER_PAGE_DEFAULT, type=int)
+    per_page = max(1, min(per_page, PATIENTS_PER_PAGE_MAX))
+
+    visits = doctor_visits_stmt(user.id).subquery()
+
+    sort_col = visits.c.last_visit if sort == 'last_visit' else visits.c.total_appointments
+    sort_col = sort_col.desc() if order == 'desc' else sort_col.asc()
+
+    rows = (
+        db.session.query(
+            Patient.patient_id,
+            Patient.name,
+            Patient.email,
+            Patient.phone,
+            Patient.account_status,
+            visits.c.total_appointments,
+            visits.c.last_visit,
+            visits.c.last_booked_at,
+            func.count().over().label('total_count'),
+        )
+        .join(visits, visits.c.patient_id == Patient.id)
+        .order_by(sort_col, Patient.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
+
     patients = []
-    for (patient_id,) in patient_ids:
-        patient = Patient.query.filter_by(id=patient_id).first()
-        if patient:
-            user_info = patient.user 
-            
-           
-            total_appointments = Appointment.query.filter_by(
-                patient_id=patient_id,
-                doctor_id=user.id
-            ).count()
-            
-            
-            last_appointment = Appointment.query.filter_by(
-                patient_id=patient_id,
-                doctor_id=user.id
-            ).order_by(Appointment.created_at.desc()).first()
-            
-            patients.append({
-                "patient_id": patient.patient_id,
-                "patient_name": user_info.name,
-                "name": user_info.name,
-                "email": user_info.email,
-                "phone": user_info.phone,
-                "status": "Active" if patient.account_status == "active" else "Inactive",
-                "total_appointments": total_appointments,
-                "last_visit": last_appointment.date_time if last_appointment else None
-            })
-    
-    return jsonify(patients), 200
+    for r in rows:
+        patients.append({
+            "patient_id": r.patient_id,
+            "patient_name": r.name,
+            "name": r.name,
+            "email": r.email,
+            "phone": r.phone,
+            "status": "Active" if r.account_status == "active" else "Inactive",
+            "total_appointments": r.total_appointments,
+            "last_visit": r.last_visit.isoformat() if r.last_visit else None,
+            "last_booked_at": r.last_booked_at.isoformat() if r.last_booked_at else None
+        })
+
+    if rows:
+        total = rows[0].total_count
+    elif page > 1:
+        # past the last page: the window count is unavailable, count directly
+        total = db.session.query(func.count()).select_from(visits).scalar()
+    else:
+        total = 0
+
+    resp = jsonify(patients)
+    resp.headers['X-Total-Count'] = str(total)
+    resp.headers['X-Page'] = str(page)
+    resp.headers['X-Per-Page'] = str(per_page)
+    return resp, 200
@@ -1,9 +1,17 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app
 from auth import role_required
 from models import Hospital, Doctor, TimeSlot, QueueReport
 from database import db
 from datetime import datetime
-from services.queue_service import predict_wait_time
+import json
+from services.queue_service import predict_wait_time, validate_queue_report, ingest_queue_reports
+from services import analytics_service
+from services.queue_stats import engine as queue_stats
+from services.prediction_cache import prediction_cache, invalidate_predictions
+from services import live_updates
+from services.id_generator import new_id
+from services.availability_index import index as availability, slot_to_dict
+from services.appointment_service import parse_appointment_datetime
 
 hospital_bp = Blueprint('hospital_bp', __name__)
 
@@ -18,6 +26,7 @@ def update_congestion(user):
         return jsonify({"error":"Hospital not found"}), 404
     h.current_congestion_level = congestion
     db.session.commit()
+    live_updates.publish_congestion(h.id, h.current_congestion_level)
     return jsonify({"message":"Congestion updated","hospital_id":h.hospital_id,"congestion":h.current_congestion_level}), 200
 
 @hospital_bp.route('/get_doctors', methods=['GET'])
@@ -51,9 +60,17 @@ def get_doctors():
 def predict_wait():
     hospital_id = request.args.get('hospital_id')
     department = request.args.get('department', 'general')
-    # uses real appointment counts / queue reports inside service
-    eta = predict_wait_time(hospital_id, department)
-    return jsonify({"hospital_id": hospital_id, "department": department, "predicted_wait_minutes": eta}), 200
+    # uses real appointment counts / queue reports inside service, cached with
+    # stale-while-revalidate so polling never waits on a recomputation
+    eta, age, state = prediction_cache.get(
+        prediction_cache.key(hospital_id, department),
+        lambda: predict_wait_time(hospital_id, department),
+        current_app._get_current_object(),
+    )
+    resp = jsonify({"hospital_id": hospital_id, "department": department, "predicted_wait_minutes": eta})
+    resp.headers['Age'] = str(int(age))
+    resp.headers['X-Cache'] = state
+    return resp, 200
 
 @hospital_bp.route('/get_hospitals', methods=['GET'])
 def get_all_hospitals():
@@ -85,6 +102,35 @@ def get_congestion():
         "congestion_level": h.current_congestion_level
     }), 200
 
+@hospital_bp.route('/congestion_stream', methods=['GET'])
+def congestion_stream():
+    """Server-sent events version of /get_congestion, pushed on every change."""
+    hospital_id = request.args.get('hospital_id')
+    if not hospital_id:
+        return jsonify({"error": "hospital_id is required"}), 400
+    h = Hospital.query.filter_by(hospital_id=hospital_id).first()
+    if not h:
+        return jsonify({"error": "Hospital not found"}), 404
+    if not live_updates.streams_supported(request.environ):
+        return jsonify({"error": "Live streams are not served by this worker, poll /get_congestion instead"}), 503
+    if not live_updates.broker.has_capacity():
+        return jsonify({"error": "Too many live connections, poll /get_congestion instead"}), 503
+    sub = live_updates.Subscription(h.id, (live_updates.CONGESTION,))
+
+    state = {"hospital_id": h.hospital_id, "name": h.name,
+             "congestion_level": h.current_congestion_level}
+
+    def render(events):
+        for event in events:
+            state["congestion_level"] = event['congestion_level']
+        return dict(state), False
+
+    return Response(
+        live_updates.event_stream(sub, render, 'congestion', retry_ms=5000),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 @hospital_bp.route('/get_departments', methods=['GET'])
 def get_departments():
     hospital_id = request.args.get('hospital_id')
@@ -109,21 +155,75 @@ def get_available_slots():
     except ValueError:
         return jsonify({"error": "Invalid date format, expected YYYY-MM-DD"}), 400
 
-    slots = TimeSlot.query.filter_by(doctor_id=int(doctor_id), is_available=True).all()
+    try:
+        doctor_pk = int(doctor_id)
+    except ValueError:
+        return jsonify({"error": "doctor_id must be an integer"}), 400
 
     available_slots = []
-    for s in slots:
-        if s.start_time and s.start_time.date() == filter_date:
-            available_slots.append({
-                "slot_id": s.slot_id,
-                "doctor_id": s.doctor_id,
-                "start_time": s.start_time.isoformat(),
-                "end_time": s.end_time.isoformat() if s.end_time else None,
-                "slot_type": s.slot_type
-            })
+    for s in availability.day(doctor_pk, filter_date):
+        available_slots.append({
+            "slot_id": s.slot_id,
+            "doctor_id": s.doctor_id,
+            "start_time": s.start_time.isoformat(),
+            "end_time": s.end_time.isoformat() if s.end_time else None,
+            "slot_type": s.slot_type
+        })
 
     return jsonify({"available_slots": available_slots}), 200
 
+# -----------------------------------------------------------
+# GET /hospital/search_slots?specialty=cardiology&hospital_id=HOSP-1&from=...&to=...&limit=10
+# Earliest free slots across doctors, from the in-memory availability index.
+# -----------------------------------------------------------
+SEARCH_SLOTS_LIMIT_DEFAULT = 10
+SEARCH_SLOTS_LIMIT_MAX = 100
+
+@hospital_bp.route('/search_slots', methods=['GET'])
+def search_slots():
+    args = request.args
+    hospital_pk = None
+    if args.get('hospital_id'):
+        code = args['hospital_id']
+        h = Hospital.query.filter_by(hospital_id=code).first()
+        if h is None and code.isdigit():
+            h = db.session.get(Hospital, int(code))
+        if not h:
+            return jsonify({"error": "Hospital not found"}), 404
+        hospital_pk = h.id
+
+    doctor_pk = None
+    if args.get('doctor_id'):
+        try:
+            doctor_pk = int(args['doctor_id'])
+        except ValueError:
+            return jsonify({"error": "doctor_id must be an integer"}), 400
+
+    window = {}
+    for name in ('from', 'to'):
+        if args.get(name):
+            window[name] = parse_appointment_datetime(args[name])
+            if window[name] is None:
+                return jsonify({"error": f"Invalid '{name}', expected ISO format like 2025-10-24T10:00"}), 400
+    if window.get('from') and window.get('to') and window['to'] <= window['from']:
+        return jsonify({"error": "'to' must be after 'from'"}), 400
+
+    try:
+        limit = int(args.get('limit', SEARCH_SLOTS_LIMIT_DEFAULT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, SEARCH_SLOTS_LIMIT_MAX))
+
+    slots = availability.search(
+        specialty=args.get('specialty'),
+        hospital_id=hospital_pk,
+        doctor_id=doctor_pk,
+        start=window.get('from'),
+        end=window.get('to'),
+        limit=limit,
+    )
+    return jsonify({"slots": [slot_to_dict(s) for s in slots], "count": len(slots)}), 200
+
 @hospital_bp.route('/queue_reports', methods=['GET'])
 def get_queue_reports():
     hospital_id = request.args.get('hospital_id')
@@ -152,14 +252,61 @@ def get_queue_reports():
 @hospital_bp.route('/submit_report', methods=['POST'])
 def submit_report():
     data = request.json
+    row, error = validate_queue_report(data)
+    if error:
+        return jsonify({"error": error}), 400
     qr = QueueReport(
-        report_id = f"QR-{int(__import__('time').time())}",
-        hospital_id = data.get('hospital_id'),
-        submitted_by = data.get('submitted_by'),
-        queue_length = data.get('queue_length'),
-        wait_time_reported = data.get('wait_time_reported'),
-        department = data.get('department')
+        report_id = new_id("QR-"),
+        **row
     )
     db.session.add(qr)
+    analytics_service.record_queue_report(qr.hospital_id, qr.wait_time_reported)
     db.session.commit()
+    queue_stats.record(qr)
+    invalidate_predictions(qr.hospital_id)
+    live_updates.publish_queue(qr.hospital_id)
     return jsonify({"message":"Report submitted", "report_id": qr.report_id}),201
+
+# -----------------------------------------------------------
+# POST /hospital/submit_reports
+# Bulk ingestion for kiosks and waiting-room sensors. Body is a JSON array,
+# {"reports": [...]}, or NDJSON (one report object per line).
+# -----------------------------------------------------------
+MAX_REPORT_BATCH = 5000
+
+@hospital_bp.route('/submit_reports', methods=['POST'])
+def submit_reports():
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        items = []
+        for lineno, line in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                return jsonify({"error": f"Invalid JSON on line {lineno}"}), 400
+    else:
+        body = request.get_json(silent=True)
+        items = body.get('reports') if isinstance(body, dict) else body
+        if not isinstance(items, list):
+            return jsonify({"error": "Expected a JSON array of reports"}), 400
+
+    if not items:
+        return jsonify({"error": "No reports submitted"}), 400
+    if len(items) > MAX_REPORT_BATCH:
+        return jsonify({"error": f"At most {MAX_REPORT_BATCH} reports per request"}), 413
+
+    results = ingest_queue_reports(items)
+    created = sum(1 for r in results if r["status"] == "created")
+    if created == len(results):
+        status = 201
+    elif created:
+        status = 207
+    else:
+        status = 400
+    return jsonify({
+        "message": f"{created} of {len(results)} reports accepted",
+        "created": created,
+        "rejected": len(results) - created,
+        "results": results
+    }), status
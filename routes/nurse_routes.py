@@ -1,12 +1,25 @@
 # routes/nurse_routes.py
+import logging
+
 from flask import Blueprint, request, jsonify
-from auth import role_required
+from auth import role_required, invalidate_principal
 from database import db
 from models import Appointment, Patient, Doctor,Room,QueueReport
 from datetime import datetime
+from services import analytics_service
+from services.queue_stats import engine as queue_stats
+from services.prediction_cache import invalidate_predictions
+from services import live_updates
+from services.queue_service import validate_queue_report
+from services.id_generator import new_id
+from services.symptom_service import analyze_batch
+from serialization import registry as serializers
+
+MAX_TRIAGE_BATCH = 1000
 
 
 nurse_bp = Blueprint('nurse_bp', __name__)
+log = logging.getLogger(__name__)
 
 # ===================== Get Rooms =====================
 
@@ -14,50 +27,71 @@ nurse_bp = Blueprint('nurse_bp', __name__)
 @role_required('nurse')
 def get_queue(user):
     hospital_id = request.args.get('hospital_id', 1)
-    reports = (
-        QueueReport.query
-        .filter_by(hospital_id=hospital_id)
-        .order_by(QueueReport.timestamp.desc())
-        .all()
-    )
-
-    queue_data = []
-    for r in reports:
-        queue_data.append({
-            "report_id": r.report_id,
-            "department": r.department,
-            "queue_length": r.queue_length,
-            "wait_time_reported": r.wait_time_reported,
-            "submitted_by": r.submitted_by,
-            "is_validated": r.is_validated,
-            "timestamp": r.timestamp.strftime("%Y-%m-%d %H:%M:%S") if r.timestamp else "Unknown",
-        })
+    serializer = serializers['queue_report']
+    queue_data = serializer.rows(db.session.execute(hospital_queue_stmt(hospital_id)))
 
     return jsonify(queue_data), 200
 
+def hospital_queue_stmt(hospital_id):
+    """Newest reports first (also EXPLAINed by query_plans)."""
+    return (
+        serializers['queue_report'].select()
+        .where(QueueReport.hospital_id == hospital_id)
+        .order_by(QueueReport.timestamp.desc())
+    )
+
 @nurse_bp.route('/submit_queue_report', methods=['POST'])
 @role_required('nurse')
 def submit_queue_report(user):
     data = request.json
-    required = ['department', 'queue_length', 'wait_time_reported']
-    if not all(k in data for k in required):
-        return jsonify({"error": "Missing fields"}), 400
+    row, error = validate_queue_report(data, defaults={'hospital_id': 1}, submitted_by=user.name)
+    if error:
+        return jsonify({"error": error}), 400
 
-    from datetime import datetime
     report = QueueReport(
-        report_id=f"rep_{int(datetime.utcnow().timestamp())}",
-        hospital_id=data.get('hospital_id', 1),
-        submitted_by=user.name,
-        queue_length=data['queue_length'],
-        wait_time_reported=data['wait_time_reported'],
-        department=data['department'],
-        is_validated=False
+        report_id=new_id("rep_"),
+        **row
     )
     db.session.add(report)
+    analytics_service.record_queue_report(report.hospital_id, report.wait_time_reported)
     db.session.commit()
+    queue_stats.record(report)
+    invalidate_predictions(report.hospital_id)
+    live_updates.publish_queue(report.hospital_id)
 
     return jsonify({"message": "Queue report added successfully"}), 201
 
+# ===================== Batch Triage =====================
+@nurse_bp.route('/triage_batch', methods=['POST'])
+@role_required('nurse')
+def triage_batch(user):
+    """
+    Classify many symptom descriptions in one call without storing anything.
+    Body: ["text", ...] or {"items": [{"id": ..., "symptoms": "..."}, ...]}.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('items')
+    if not isinstance(data, list):
+        return jsonify({"error": "Expected a list of texts or {\"items\": [...]}"}), 400
+    if len(data) > MAX_TRIAGE_BATCH:
+        return jsonify({"error": f"At most {MAX_TRIAGE_BATCH} items per request"}), 413
+
+    ids, texts = [], []
+    for i, item in enumerate(data):
+        if isinstance(item, dict):
+            ids.append(item.get('id', i))
+            text = item.get('symptoms', '')
+        else:
+            ids.append(i)
+            text = item
+        if not isinstance(text, str):
+            return jsonify({"error": f"Item {i}: symptoms must be a string"}), 400
+        texts.append(text)
+
+    results = [dict(analysis, id=item_id) for item_id, analysis in zip(ids, analyze_batch(texts))]
+    return jsonify({"results": results, "count": len(results)}), 200
+
 # ===================== Update Patient Status =====================
 @nurse_bp.route('/update_patient_status', methods=['PUT'])
 @role_required('nurse')
@@ -74,6 +108,7 @@ def update_patient_status(user):
 
     patient.account_status = status
     db.session.commit()
+    invalidate_principal(patient.id)
     return jsonify({
         "message": "Patient status updated",
         "patient_id": patient_id,
@@ -116,7 +151,7 @@ def get_rooms():
         return jsonify(data), 200
 
     except Exception as e:
-        print("Error fetching rooms:", e)
+        log.exception("fetching rooms failed")
         return jsonify({"error": str(e)}), 500
 
 
@@ -1,15 +1,29 @@
-from flask import Blueprint, request, jsonify
+import logging
+
+from flask import Blueprint, Response, request, jsonify
 from database import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import Patient, SymptomReport, Appointment, QueueReport
 from auth import role_required, get_current_user
 from services.symptom_service import analyze_symptoms
 from services.registration_service import register_patient
-from services.appointment_service import book_appointment
+from services.appointment_service import book_appointment, release_slot, parse_date_window, apply_date_window
+from services import analytics_service
+from services.queue_stats import engine as queue_stats
+from services.prediction_cache import invalidate_predictions
+from services.queue_service import validate_queue_report
+from services import live_updates
+from services.id_generator import new_id
+from services.availability_index import index as availability
+from services.triage_pipeline import pipeline as triage_pipeline
+from services.reminder_scheduler import scheduler as reminders
+from serialization import registry as serializers
+from sqlalchemy import select
 from sqlalchemy.orm import joinedload
 from models import Hospital, Doctor
 from flask_cors import cross_origin
 patient_bp = Blueprint('patient_bp', __name__)
+log = logging.getLogger(__name__)
 
 @patient_bp.route('/profile', methods=['GET'])
 @role_required('patient')
@@ -43,24 +57,18 @@ def submit_symptoms(user):
     data = request.json
     text = data.get('symptoms', '')
     analysis = analyze_symptoms(text)
-    # persist SymptomReport
-    sr = SymptomReport(
-        report_id=f"SR-{int(__import__('time').time())}",
-        patient_id=user.id,
-        symptoms=text,
-        urgency_level=analysis['urgency'],
-        classification=analysis['classification'],
-        recommendations=";".join(analysis['recommendations'])
-    )
-    db.session.add(sr)
-    db.session.commit()
+    report_id = new_id("SR-")
+    # classified here so the response carries the result; the write (and the
+    # emergency alert for "High") happens on the triage workers
+    queued = triage_pipeline.submit(user.id, text, analysis, report_id)
     return jsonify({
         "message": "Symptoms analyzed",
-        "report_id": sr.report_id,
-        "urgency": sr.urgency_level,
-        "classification": sr.classification,
-        "recommendations": analysis['recommendations']
-    }), 200
+        "report_id": report_id,
+        "urgency": analysis['urgency'],
+        "classification": analysis['classification'],
+        "recommendations": analysis['recommendations'],
+        "status": "queued" if queued else "saved",
+    }), 202 if queued else 200
 
 @patient_bp.route('/book_appointment', methods=['POST'])
 @role_required('patient')
@@ -69,10 +77,10 @@ def book(user):
     doctor_id = data.get('doctor_id')
     date_time = data.get('date_time')
     hospital_id = data.get('hospital_id')
-    result = book_appointment(user.id, doctor_id, hospital_id, date_time)
-    print("DEBUG RESULT:", result)
+    result = book_appointment(user.id, doctor_id, hospital_id, date_time, slot_id=data.get('slot_id'))
     if result.get('error'):
-        return jsonify(result), 400
+        log.debug("booking rejected: %s", result['error'], extra={"doctor_id": str(doctor_id)})
+        return jsonify(result), 409 if result.get('conflict') else 400
     return jsonify(result), 201
 
 from sqlalchemy.orm import joinedload
@@ -80,44 +88,16 @@ from sqlalchemy.orm import joinedload
 @patient_bp.route('/appointments', methods=['GET'])
 @role_required('patient')
 def list_patient_appointments(user):
-    appointments = (
-        Appointment.query.options(
-            joinedload(Appointment.doctor),
-            joinedload(Appointment.hospital)
-        )
-        .filter_by(patient_id=user.id)
-        .all()
-    )
+    try:
+        start, end = parse_date_window(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # doctor and hospital names come from outer joins in the same query
+    serializer = serializers['patient_appointment']
+    data = serializer.rows(db.session.execute(patient_appointments_stmt(user.id, start, end)))
 
-    data = []
-    for a in appointments:
-        
-        hospital = a.hospital
-        if not hospital:
-            
-            hospital = Hospital.query.filter_by(hospital_id=str(a.hospital_id)).first()
-
-      
-        date_str = None
-        if hasattr(a.date_time, "isoformat"):
-            date_str = a.date_time.isoformat()
-        else:
-            
-            parts = str(a.date_time).split()
-            date_str = parts[-1] if len(parts) > 1 else parts[0]
-
-        data.append({
-            "appointment_id": a.appointment_id,
-            "doctor_id": a.doctor_id,
-            "doctor_name": a.doctor.name if a.doctor else "Unknown Doctor",
-            "hospital_id": a.hospital_id,
-            "hospital_name": hospital.name if hospital else "Unknown Hospital",
-            "date_time": date_str,
-            "status": a.status,
-            "notes": a.notes
-        })
-
-    print("DEBUG APPOINTMENTS:", data)
+    log.debug("listed %d appointments", len(data))
     return jsonify(data), 200
 
 
@@ -125,53 +105,78 @@ def list_patient_appointments(user):
 @role_required('patient')
 def submit_queue_report(user):
     data = request.json
-    hospital_id = data.get('hospital_id')
-    queue_length = int(data.get('queue_length', 0))
-    wait_time = int(data.get('wait_time', 0))
-    department = data.get('department', 'general')
-    qr = QueueReport(
-        report_id=f"QR-{int(__import__('time').time())}",
-        hospital_id=hospital_id,
+    row, error = validate_queue_report(
+        data,
+        defaults={'queue_length': 0, 'wait_time_reported': 0, 'department': 'general'},
         submitted_by=user.name,
-        queue_length=queue_length,
-        wait_time_reported=wait_time,
-        department=department
+    )
+    if error:
+        return jsonify({"error": error}), 400
+    qr = QueueReport(
+        report_id=new_id("QR-"),
+        **row
     )
     db.session.add(qr)
+    analytics_service.record_queue_report(qr.hospital_id, qr.wait_time_reported)
     db.session.commit()
+    queue_stats.record(qr)
+    invalidate_predictions(qr.hospital_id)
+    live_updates.publish_queue(qr.hospital_id)
     return jsonify({"message": "Queue report submitted", "report_id": qr.report_id}), 201
-@patient_bp.route('/queue_status', methods=['GET'])
-@role_required('patient')
-def queue_status(user):
-    """
-    Returns the patient's active queue status, or aggregated queue data if not in queue.
-    """
-    hospital_id_param = request.args.get('hospital_id')
-    department = request.args.get('department', 'general')
+NOT_IN_QUEUE = {
+    "in_queue": False,
+    "doctor": "-",
+    "hospital": "-",
+    "position": 0,
+    "estimated_wait": 0,
+    "total_in_queue": 0,
+    "patients_ahead": 0,
+    "room": "-",
+    "joined_at": None,
+    "status": "Not in Queue"
+}
 
-    # find active appointment
-    active_appt = (
-        Appointment.query
-        .filter_by(patient_id=user.id, status='Scheduled')
+
+def patient_appointments_stmt(patient_id, start=None, end=None):
+    stmt = serializers['patient_appointment'].select().where(Appointment.patient_id == patient_id)
+    return apply_date_window(stmt, start, end)
+
+
+def active_appointment_stmt(patient_id):
+    """The patient's latest Scheduled appointment, the one they queue for."""
+    return (
+        select(Appointment)
+        .where(Appointment.patient_id == patient_id, Appointment.status == 'Scheduled')
         .order_by(Appointment.created_at.desc())
-        .first()
+        .limit(1)
     )
 
-    # If no active appointment, return default
-    if not active_appt:
-        return jsonify({
-            "in_queue": False,
-            "doctor": "-",
-            "hospital": "-",
-            "position": 0,
-            "estimated_wait": 0,
-            "total_in_queue": 0,
-            "patients_ahead": 0,
-            "room": "-",
-            "joined_at": None,
-            "status": "Not in Queue"
-        }), 200
 
+def _active_appointment(patient_id):
+    return db.session.scalars(active_appointment_stmt(patient_id)).first()
+
+
+def _queue_position(hospital_id, department):
+    """Position fields of the queue status from the rolling 24h averages."""
+    summary = queue_stats.summary(hospital_id, department, hours=24)
+    avg_queue, avg_wait = 3, 15  # sensible defaults
+    if summary:
+        if summary["average_queue_length"] is not None:
+            avg_queue = summary["average_queue_length"]
+        if summary["average_wait_time"] is not None:
+            avg_wait = summary["average_wait_time"]
+
+    total_in_queue = int(round(avg_queue))
+    position = min(total_in_queue, 1)
+    return {
+        "position": position,
+        "estimated_wait": round(avg_wait, 2),
+        "total_in_queue": total_in_queue,
+        "patients_ahead": max(0, total_in_queue - position),
+    }
+
+
+def _resolve_queue_hospital(active_appt, hospital_id_param):
     # Get proper hospital_id (integer FK)
     hospital_id = active_appt.hospital_id
     if hospital_id_param:
@@ -180,41 +185,115 @@ def queue_status(user):
             hospital_id = int(hospital_id_param)
         except ValueError:
             pass
+    return hospital_id
 
-    hospital = Hospital.query.get(hospital_id)
-    doctor = Doctor.query.get(active_appt.doctor_id)
 
-    # Query queue reports for same hospital + department
-    reports = QueueReport.query.filter_by(hospital_id=hospital_id, department=department).all()
+@patient_bp.route('/queue_status', methods=['GET'])
+@role_required('patient')
+def queue_status(user):
+    """
+    Returns the patient's active queue status, or aggregated queue data if not in queue.
+    """
+    hospital_id_param = request.args.get('hospital_id')
+    department = request.args.get('department', 'general')
+
+    # find active appointment
+    active_appt = _active_appointment(user.id)
 
-    if reports:
-        avg_queue = sum(r.queue_length for r in reports) / len(reports)
-        avg_wait = sum(r.wait_time_reported for r in reports) / len(reports)
-    else:
-        avg_queue, avg_wait = 3, 15  # sensible defaults
+    # If no active appointment, return default
+    if not active_appt:
+        return jsonify(NOT_IN_QUEUE), 200
 
-    total_in_queue = int(round(avg_queue))
-    position = min(total_in_queue, 1)
-    patients_ahead = max(0, total_in_queue - position)
+    hospital_id = _resolve_queue_hospital(active_appt, hospital_id_param)
+    hospital = Hospital.query.get(hospital_id)
+    doctor = Doctor.query.get(active_appt.doctor_id)
 
     response = {
         "in_queue": True,
         "doctor": doctor.name if doctor else "Unassigned",
         "department": specialty if (specialty := getattr(doctor, "specialty", None)) else "General",
         "hospital": hospital.name if hospital else "Unknown",
-        "position": position,
-        "estimated_wait": round(avg_wait, 2),
-        "total_in_queue": total_in_queue,
-        "patients_ahead": patients_ahead,
+        # Rolling 24h averages for same hospital + department (in-memory, no report scan)
+        **_queue_position(hospital_id, department),
         "room": getattr(doctor, "room", "OPD-1"),
-        "joined_at": str(active_appt.date_time),
+        "joined_at": active_appt.scheduled_at.isoformat() if active_appt.scheduled_at else None,
         "status": "Active"
     }
 
-    print("QUEUE STATUS RESPONSE:", response)
+    log.debug("queue status", extra={"appointment_id": active_appt.appointment_id,
+                                     "position": response["position"],
+                                     "estimated_wait": response["estimated_wait"]})
     return jsonify(response), 200
 
 
+@patient_bp.route('/queue_stream', methods=['GET'])
+@role_required('patient')
+def queue_stream(user):
+    """
+    Server-sent events version of /queue_status. Sends the current status,
+    then a new `queue_status` event whenever a queue report, a congestion
+    change or a status change of the active appointment alters it. The
+    stream ends once the appointment leaves the queue.
+    """
+    hospital_id_param = request.args.get('hospital_id')
+    department = request.args.get('department', 'general')
+
+    active_appt = _active_appointment(user.id)
+    if not active_appt:
+        # nothing to watch: one snapshot, and ask the client to back off
+        body = live_updates.format_event('queue_status', NOT_IN_QUEUE, 1)
+        return Response("retry: 30000\n\n" + body, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+    if not live_updates.streams_supported(request.environ):
+        return jsonify({"error": "Live streams are not served by this worker, poll /queue_status instead"}), 503
+
+    hospital_id = _resolve_queue_hospital(active_appt, hospital_id_param)
+    hospital = Hospital.query.get(hospital_id)
+    doctor = Doctor.query.get(active_appt.doctor_id)
+
+    # everything the stream needs from the database is read here; the
+    # generator below only reads in-memory queue stats and pushed events
+    base = {
+        "in_queue": True,
+        "doctor": doctor.name if doctor else "Unassigned",
+        "department": specialty if (specialty := getattr(doctor, "specialty", None)) else "General",
+        "hospital": hospital.name if hospital else "Unknown",
+        "room": getattr(doctor, "room", "OPD-1"),
+        "appointment_id": active_appt.appointment_id,
+        "joined_at": active_appt.scheduled_at.isoformat() if active_appt.scheduled_at else None,
+        "congestion_level": hospital.current_congestion_level if hospital else None,
+        "status": "Active"
+    }
+    if not live_updates.broker.has_capacity():
+        return jsonify({"error": "Too many live connections, poll /queue_status instead"}), 503
+    sub = live_updates.Subscription(
+        hospital_id,
+        (live_updates.QUEUE, live_updates.CONGESTION, live_updates.APPOINTMENT),
+        patient_id=user.id,
+        appointment_id=active_appt.appointment_id,
+    )
+
+    state = dict(base)
+
+    def render(events):
+        for event in events:
+            if event['type'] == live_updates.CONGESTION:
+                state["congestion_level"] = event['congestion_level']
+            elif event['type'] == live_updates.APPOINTMENT and event['status'] != 'Scheduled':
+                state["status"] = event['status']
+        if state["status"] != "Active":
+            return dict(NOT_IN_QUEUE, appointment_id=state["appointment_id"],
+                        status=state["status"]), True
+        return dict(state, **_queue_position(hospital_id, department)), False
+
+    return Response(
+        live_updates.event_stream(sub, render, 'queue_status', retry_ms=5000),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
 
 @patient_bp.route('/appointments/<appointment_id>', methods=['DELETE', 'OPTIONS'])
 def cancel_appointment(appointment_id):
@@ -236,7 +315,13 @@ def cancel_appointment(appointment_id):
     if appt.status != "Scheduled":
         return jsonify({"error": "Only scheduled appointments can be cancelled"}), 400
 
+    analytics_service.record_status_change(appt.hospital_id, appt.status, "Cancelled")
+    released = release_slot(appt)
     appt.status = "Cancelled"
     db.session.commit()
+    invalidate_predictions(appt.hospital_id)
+    availability.touch([released])
+    reminders.update(appt)
+    live_updates.publish_appointment(appt)
 
     return jsonify({"message": "Appointment cancelled", "appointment_id": appointment_id}), 200
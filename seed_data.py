@@ -1,52 +1,410 @@
-from app import create_app, db
-from models import Hospital, Doctor, Patient, TimeSlot
-from passlib.hash import pbkdf2_sha256
-
-app = create_app()
-with app.app_context():
-    db.drop_all()
-    db.create_all()
-
-    # create hospital
-    h = Hospital(hospital_id="HOSP-1", name="City General Hospital", address="123 Main St", capacity=200, contact_info="0123456789", departments="general,cardiology,emergency")
-    db.session.add(h)
-    db.session.commit()
-
-    # create doctors
-    # create doctors
-    d1 = Doctor(
-        doctor_id="D-100",
-        name="Dr. Alice",
-        email="alice@hospital.org",
-        phone="1111111111",
-        specialty="cardiology",
-        password_hash=pbkdf2_sha256.hash("password"),
-        is_available=True,
-        hospital_id=h.id  # ✅ link to hospital
-    )
-
-    d2 = Doctor(
-        doctor_id="D-101",
-        name="Dr. Bob",
-        email="bob@hospital.org",
-        phone="2222222222",
-        specialty="general",
-        password_hash=pbkdf2_sha256.hash("password"),
-        is_available=True,
-        hospital_id=h.id  # ✅ link to hospital
-    )
-
-    db.session.commit()
-
-    # create timeslots
-    ts1 = TimeSlot(slot_id="TS-1", doctor_id=d1.id, hospital_id=h.id, start_time="2025-10-24 10:00", end_time="2025-10-24 10:30", is_available=True)
-    ts2 = TimeSlot(slot_id="TS-2", doctor_id=d2.id, hospital_id=h.id, start_time="2025-10-24 11:00", end_time="2025-10-24 11:30", is_available=True)
-    db.session.add_all([ts1, ts2])
-    db.session.commit()
-
-    # create a patient
-    p = Patient(patient_id="P-500", name="John Doe", email="john@example.com", phone="9999999999", password_hash=pbkdf2_sha256.hash("password"), is_registered=True)
-    db.session.add(p)
-    db.session.commit()
-
-    print("Seed data created.")
+# Synthetic dataset generator.
+#
+# Fills the configured database (SQLALCHEMY_DATABASE_URI) with a realistic,
+# reproducible dataset whose size grows linearly with --scale:
+#
+#   scale 1:  10 hospitals, 400 doctors, 200 nurses, 100k patients,
+#             1M appointments over --days of history plus --weeks of open and
+#             booked slots ahead, 500k queue reports
+#   scale 10: 10M appointments, 5M queue reports, 1M patients
+#
+# Appointments and queue reports follow clinic hours with morning and late
+# afternoon peaks, quieter weekends and a winter bump; queue length and wait
+# time follow the same daily curve. Past appointments are Completed or
+# Cancelled; upcoming ones are Scheduled on a real slot (marked unavailable),
+# at most one active appointment per patient and doctor, as the booking path
+# enforces.
+#
+# Rows are generated in chunks and written with the driver's executemany, one
+# transaction per chunk; the secondary indexes of the three big tables are
+# dropped for the load and rebuilt once at the end. The same --seed and
+# --today give identical data.
+# Every account's password is --password.
+#
+#   python seed_data.py --scale 0.01                  # a few seconds, for development
+#   python seed_data.py --scale 10 --reset            # ~10M appointments
+#   SQLALCHEMY_DATABASE_URI=sqlite:////tmp/big.db python seed_data.py --scale 1
+import argparse
+import math
+import random
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Index, MetaData, Table, inspect
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+DEPARTMENTS = ['general', 'cardiology', 'emergency', 'pediatrics', 'orthopedics',
+               'neurology', 'dermatology', 'gynecology']
+FIRST_NAMES = ['Aarav', 'Maya', 'Liam', 'Sofia', 'Noah', 'Zara', 'Ethan', 'Isha', 'Lucas',
+               'Anya', 'Omar', 'Chloe', 'Ravi', 'Elena', 'Kenji', 'Amara', 'Diego', 'Priya']
+LAST_NAMES = ['Sharma', 'Smith', 'Garcia', 'Khan', 'Chen', 'Okafor', 'Müller', 'Rossi',
+              'Patel', 'Silva', 'Nguyen', 'Cohen', 'Kowalski', 'Haddad', 'Mensah', 'Ito']
+CITIES = ['Mumbai', 'Pune', 'Delhi', 'Bengaluru', 'Chennai', 'Hyderabad', 'Kolkata']
+
+# relative load per hour of day (clinic hours, peaks at 10:00 and 17:00)
+HOUR_WEIGHTS = [0, 0, 0, 0, 0, 0, 0.2, 0.6, 1.0, 1.4, 1.6, 1.4, 1.0, 0.8,
+                1.0, 1.2, 1.4, 1.5, 1.1, 0.7, 0.4, 0.2, 0.1, 0]
+WEEKDAY_WEIGHTS = [1.0, 1.0, 0.95, 0.95, 0.9, 0.45, 0.25]
+
+SLOT_MINUTES = 15
+SLOT_DAY_START, SLOT_DAY_END = 9, 17
+
+
+class Sizes:
+    def __init__(self, scale, days, weeks):
+        self.hospitals = max(1, round(10 * scale))
+        self.doctors_per_hospital = 40
+        self.nurses_per_hospital = 20
+        self.doctors = self.hospitals * self.doctors_per_hospital
+        self.nurses = self.hospitals * self.nurses_per_hospital
+        self.patients = max(10, round(100_000 * scale))
+        self.appointments = max(10, round(1_000_000 * scale))
+        self.queue_reports = max(10, round(500_000 * scale))
+        self.days = days
+        self.weeks = weeks
+
+
+def _cum_weights(weights):
+    total, cum = 0.0, []
+    for w in weights:
+        total += w
+        cum.append(total)
+    return cum
+
+
+def _hour_cells(today, days):
+    """(day, hour) cells of the history window with their cumulative weights."""
+    cells, weights = [], []
+    for d in range(days, 0, -1):
+        day = today - timedelta(days=d)
+        winter = 1 + 0.2 * math.cos(2 * math.pi * (day.timetuple().tm_yday - 15) / 365)
+        for hour, hw in enumerate(HOUR_WEIGHTS):
+            if hw:
+                cells.append((datetime(day.year, day.month, day.day, hour), hw))
+                weights.append(hw * WEEKDAY_WEIGHTS[day.weekday()] * winter)
+    return [c for c, _ in cells], [h for _, h in cells], _cum_weights(weights)
+
+
+class Generator:
+    def __init__(self, engine, sizes, seed, today, password_hash, chunk_size, out=sys.stdout):
+        self.engine = engine
+        self.sizes = sizes
+        self.rng = random.Random(seed)
+        self.today = today
+        self.password_hash = password_hash
+        self.chunk_size = chunk_size
+        self.out = out
+        self.totals = {}
+
+    # -------- writing --------
+
+    def _insert(self, table, rows_iter, label=None):
+        """
+        Write dict rows in chunks. The statement is compiled once and run with
+        the driver's executemany, values converted by the column types' own
+        bind processors, so the stored format is exactly what the ORM writes.
+        """
+        label = label or table.name
+        dialect = self.engine.dialect
+        started = time.perf_counter()
+        written = 0
+        rows_iter = iter(rows_iter)
+        first = next(rows_iter, None)
+        if first is not None:
+            keys = list(first)
+            compiled = table.insert().compile(dialect=dialect, column_keys=keys)
+            order = list(compiled.positiontup) if compiled.positional else keys
+            processors = [table.c[k].type._cached_bind_processor(dialect) for k in order]
+            convert = [(i, p) for i, p in enumerate(processors) if p is not None]
+
+            def params(row):
+                values = [row[k] for k in order]
+                for i, p in convert:
+                    if values[i] is not None:
+                        values[i] = p(values[i])
+                return tuple(values) if compiled.positional else dict(zip(order, values))
+
+            sql = str(compiled)
+            with self.engine.connect() as conn:
+                if dialect.name == 'sqlite':
+                    # bulk load: the database file is only consistent once the run finishes
+                    conn.exec_driver_sql('PRAGMA synchronous=OFF')
+                chunk = [params(first)]
+                for row in rows_iter:
+                    chunk.append(params(row))
+                    if len(chunk) >= self.chunk_size:
+                        conn.exec_driver_sql(sql, chunk)
+                        conn.commit()
+                        written += len(chunk)
+                        chunk = []
+                if chunk:
+                    conn.exec_driver_sql(sql, chunk)
+                    conn.commit()
+                    written += len(chunk)
+        elapsed = time.perf_counter() - started
+        self.totals[label] = self.totals.get(label, 0) + written
+        print(f"  {label:<16}{written:>11,} rows  {elapsed:7.1f}s  "
+              f"({written / elapsed if elapsed else 0:,.0f} rows/s)", file=self.out)
+
+    @contextmanager
+    def _indexes_deferred(self, *table_names):
+        """Drop the secondary indexes of the bulk tables and rebuild them once at the end."""
+        with self.engine.connect() as conn:
+            inspector = inspect(conn)
+            indexes = [(name, idx) for name in table_names for idx in inspector.get_indexes(name)
+                       if not idx.get('unique')]
+            for _, idx in indexes:
+                conn.execute(DropIndex(Index(idx['name'])))
+            conn.commit()
+        try:
+            yield
+        finally:
+            started = time.perf_counter()
+            metadata = MetaData()
+            with self.engine.connect() as conn:
+                for name, idx in indexes:
+                    table = Table(name, metadata, autoload_with=conn)
+                    conn.execute(CreateIndex(Index(idx['name'], *(table.c[c] for c in idx['column_names']))))
+                conn.commit()
+            print(f"  {len(indexes)} indexes rebuilt in {time.perf_counter() - started:.1f}s", file=self.out)
+
+    def _name(self):
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    def _phone(self):
+        return f"9{self.rng.randrange(10 ** 8, 10 ** 9)}"
+
+    # -------- entities --------
+
+    def run(self):
+        from models import (Appointment, Doctor, Hospital, HospitalAdministrator, Nurse,
+                            Patient, QueueReport, TimeSlot, User)
+        s = self.sizes
+        with self.engine.connect() as conn:
+            next_user = (conn.execute(User.__table__.select().with_only_columns(
+                User.__table__.c.id).order_by(User.__table__.c.id.desc()).limit(1)).scalar() or 0) + 1
+        created = datetime.combine(self.today, datetime.min.time()) - timedelta(days=s.days)
+
+        # hospitals
+        self.hospitals = []
+        hospital_rows = []
+        for h in range(s.hospitals):
+            departments = ['general', 'emergency'] + self.rng.sample(DEPARTMENTS[1:], 3)
+            departments = sorted(set(departments), key=DEPARTMENTS.index)
+            hospital_rows.append({
+                'id': h + 1, 'hospital_id': f"HOSP-{h + 1}",
+                'name': f"{self.rng.choice(CITIES)} {self.rng.choice(['General', 'City', 'Care', 'Memorial'])} Hospital {h + 1}",
+                'address': f"{self.rng.randrange(1, 500)} Main Road", 'location': self.rng.choice(CITIES),
+                'capacity': self.rng.randrange(100, 800), 'current_congestion_level': 0.0,
+                'contact_info': self._phone(), 'departments': ','.join(departments),
+            })
+            self.hospitals.append(departments)
+        self._insert(Hospital.__table__, hospital_rows)
+
+        # users: one row in `user` plus one in the role table, same id
+        def people(count, role, email_prefix):
+            nonlocal next_user
+            first = next_user
+            next_user += count
+            users = ({
+                'id': first + n, 'role': role, 'name': self._name(),
+                'email': f"{email_prefix}{n}@example.com", 'phone': self._phone(),
+                'password_hash': self.password_hash,
+                'created_at': created + timedelta(minutes=self.rng.randrange(s.days * 1440)),
+            } for n in range(count))
+            self._insert(User.__table__, users, f"user ({role})")
+            return first
+
+        first_admin = people(s.hospitals, 'admin', 'admin')
+        self._insert(HospitalAdministrator.__table__, ({
+            'id': first_admin + h, 'admin_id': f"ADM-{h + 1}", 'hospital_id': h + 1,
+            'role_title': 'Hospital Administrator', 'permissions': 'all',
+        } for h in range(s.hospitals)))
+
+        first_doctor = people(s.doctors, 'doctor', 'doctor')
+        self.doctor_hospital = []
+        doctor_rows = []
+        for n in range(s.doctors):
+            hospital = n // s.doctors_per_hospital
+            self.doctor_hospital.append(hospital + 1)
+            doctor_rows.append({
+                'id': first_doctor + n, 'doctor_id': f"DOC-{n + 1}",
+                'specialty': self.rng.choice(self.hospitals[hospital]),
+                'qualification': self.rng.choice(['MBBS', 'MD', 'MS', 'DNB']),
+                'experience': self.rng.randrange(1, 35), 'license_number': f"LIC-{n + 1:06d}",
+                'is_available': True, 'hospital_id': hospital + 1,
+            })
+        self._insert(Doctor.__table__, doctor_rows)
+
+        first_nurse = people(s.nurses, 'nurse', 'nurse')
+        self._insert(Nurse.__table__, ({
+            'id': first_nurse + n, 'nurse_id': f"NUR-{n + 1}",
+            'department': self.rng.choice(self.hospitals[n // s.nurses_per_hospital]),
+            'shift_timings': self.rng.choice(['06:00-14:00', '14:00-22:00', '22:00-06:00']),
+        } for n in range(s.nurses)))
+
+        first_patient = people(s.patients, 'patient', 'patient')
+        self._insert(Patient.__table__, ({
+            'id': first_patient + n, 'patient_id': f"PAT-{n + 1}",
+            'date_of_birth': (date(1940, 1, 1) + timedelta(days=self.rng.randrange(30000))).isoformat(),
+            'address': f"{self.rng.randrange(1, 999)} {self.rng.choice(CITIES)}",
+            'is_registered': True, 'account_status': 'active',
+        } for n in range(s.patients)))
+
+        self.first_doctor, self.first_patient = first_doctor, first_patient
+        with self._indexes_deferred('time_slot', 'appointment', 'queue_report'):
+            self._slots_and_upcoming(TimeSlot.__table__, Appointment.__table__)
+            self._history(Appointment.__table__)
+            self._queue_reports(QueueReport.__table__)
+        return self.totals
+
+    def _slots_and_upcoming(self, slot_table, appt_table):
+        """Open slots for the next --weeks; about 60% of them booked."""
+        s = self.sizes
+        per_day = (SLOT_DAY_END - SLOT_DAY_START) * 60 // SLOT_MINUTES
+        days = [self.today + timedelta(days=d) for d in range(1, s.weeks * 7 + 1)]
+        days = [d for d in days if d.weekday() < 6]
+        booked = []
+        active_pairs = set()
+        slot_pk = 0
+
+        def slots():
+            nonlocal slot_pk
+            for n in range(s.doctors):
+                doctor = self.first_doctor + n
+                hospital = self.doctor_hospital[n]
+                for day in days:
+                    start_of_day = datetime(day.year, day.month, day.day, SLOT_DAY_START)
+                    for i in range(per_day):
+                        slot_pk += 1
+                        start = start_of_day + timedelta(minutes=SLOT_MINUTES * i)
+                        is_booked = self.rng.random() < 0.6
+                        if is_booked:
+                            patient = self.first_patient + self.rng.randrange(s.patients)
+                            if (patient, doctor) in active_pairs:
+                                is_booked = False
+                            else:
+                                active_pairs.add((patient, doctor))
+                                booked.append((slot_pk, patient, doctor, hospital, start))
+                        yield {
+                            'id': slot_pk, 'slot_id': f"TS-{slot_pk}", 'doctor_id': doctor,
+                            'hospital_id': hospital, 'start_time': start,
+                            'end_time': start + timedelta(minutes=SLOT_MINUTES),
+                            'is_available': not is_booked, 'slot_type': 'consult',
+                        }
+        self._insert(slot_table, slots(), 'time_slot')
+
+        now = datetime.combine(self.today, datetime.min.time())
+        self._insert(appt_table, ({
+            'appointment_id': f"APPT-UP-{n + 1}", 'patient_id': patient, 'doctor_id': doctor,
+            'hospital_id': hospital, 'scheduled_at': start, 'time_slot_id': slot,
+            'status': 'Scheduled', 'appointment_type': 'OPD',
+            'created_at': now - timedelta(minutes=self.rng.randrange(1, 20 * 1440)),
+        } for n, (slot, patient, doctor, hospital, start) in enumerate(booked)), 'appointment (up)')
+
+    def _history(self, appt_table):
+        s = self.sizes
+        cells, _, cum = _hour_cells(self.today, s.days)
+        rng = self.rng
+
+        def rows():
+            n = 0
+            while n < s.appointments:
+                count = min(self.chunk_size, s.appointments - n)
+                for cell in rng.choices(cells, cum_weights=cum, k=count):
+                    n += 1
+                    doctor_index = rng.randrange(s.doctors)
+                    at = cell + timedelta(minutes=SLOT_MINUTES * rng.randrange(60 // SLOT_MINUTES))
+                    r = rng.random()
+                    yield {
+                        'appointment_id': f"APPT-{n}",
+                        'patient_id': self.first_patient + rng.randrange(s.patients),
+                        'doctor_id': self.first_doctor + doctor_index,
+                        'hospital_id': self.doctor_hospital[doctor_index],
+                        'scheduled_at': at,
+                        'status': 'Completed' if r < 0.86 else 'Cancelled',
+                        'appointment_type': 'Emergency' if r > 0.97 else 'OPD',
+                        'created_at': at - timedelta(minutes=rng.randrange(30, 30 * 1440)),
+                    }
+        self._insert(appt_table, rows(), 'appointment')
+
+    def _queue_reports(self, table):
+        s = self.sizes
+        cells, hour_weights, cum = _hour_cells(self.today, s.days)
+        rng = self.rng
+        peak = max(HOUR_WEIGHTS)
+
+        def rows():
+            n = 0
+            while n < s.queue_reports:
+                count = min(self.chunk_size, s.queue_reports - n)
+                for i in rng.choices(range(len(cells)), cum_weights=cum, k=count):
+                    n += 1
+                    hospital = rng.randrange(s.hospitals)
+                    department = rng.choice(self.hospitals[hospital])
+                    load = hour_weights[i] / peak * WEEKDAY_WEIGHTS[cells[i].weekday()]
+                    base = 40 if department == 'emergency' else 20
+                    queue_length = max(0, round(base * load + rng.gauss(0, 3)))
+                    yield {
+                        'report_id': f"QR-{n}", 'hospital_id': hospital + 1,
+                        'submitted_by': f"nurse{rng.randrange(s.nurses)}@example.com"
+                        if rng.random() < 0.6 else f"patient{rng.randrange(s.patients)}@example.com",
+                        'queue_length': queue_length,
+                        'wait_time_reported': max(0, round(queue_length * rng.uniform(3, 6) + rng.gauss(0, 5))),
+                        'department': department,
+                        'timestamp': cells[i] + timedelta(seconds=rng.randrange(3600)),
+                        'is_validated': rng.random() < 0.7,
+                    }
+        self._insert(table, rows(), 'queue_report')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic MediQ dataset.")
+    parser.add_argument('--scale', type=float, default=0.01,
+                        help="1.0 = 100k patients, 1M appointments, 500k queue reports")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--today', type=date.fromisoformat, default=date.today(),
+                        help="anchor date (YYYY-MM-DD); history ends and slots start here")
+    parser.add_argument('--days', type=int, default=365, help="days of appointment/report history")
+    parser.add_argument('--weeks', type=int, default=4, help="weeks of upcoming slots")
+    parser.add_argument('--chunk-size', type=int, default=50_000)
+    parser.add_argument('--password', default='password', help="password of every account")
+    parser.add_argument('--reset', action='store_true',
+                        help="drop and recreate all tables first (deletes all data)")
+    args = parser.parse_args(argv)
+
+    from app import app
+    from database import db
+    from migrations import run_migrations
+    from models import Hospital, User
+    from services import analytics_service
+    from services.password_service import hash_password
+
+    with app.app_context():
+        print(f"Database: {db.engine.url.render_as_string(hide_password=True)}")
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+            run_migrations(db.engine)
+        elif db.session.query(User.id).first() or db.session.query(Hospital.id).first():
+            raise SystemExit("The database already has data; pass --reset to replace it.")
+
+        sizes = Sizes(args.scale, args.days, args.weeks)
+        print(f"Generating scale {args.scale} (seed {args.seed}, today {args.today}):")
+        started = time.perf_counter()
+        generator = Generator(db.engine, sizes, args.seed, args.today,
+                              hash_password(args.password), args.chunk_size)
+        totals = generator.run()
+
+        counts = analytics_service.rebuild()
+        elapsed = time.perf_counter() - started
+        print(f"Analytics rebuilt: {counts}")
+        print(f"Done: {sum(totals.values()):,} rows in {elapsed:.0f}s. "
+              f"Log in as admin0@example.com, doctor0@example.com, nurse0@example.com or "
+              f"patient0@example.com with password {args.password!r}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+# serialization.py
+#
+# Response serialization: a registry of per-model/per-query serializers and
+# the app's JSON provider.
+#
+# A Serializer is built once, at startup, from a list of fields. It knows the
+# column expressions to select, so list endpoints can run a Core select() and
+# turn each row tuple straight into a dict without hydrating ORM objects. Rows
+# with no per-field conversion go through dict(zip(keys, row)); the rest use a
+# function compiled from the field list.
+#
+# Values are left in their native types: datetimes and dates are written as
+# ISO 8601 by the JSON provider, the same everywhere. orjson is used when it is
+# installed (it serializes datetimes natively and is several times faster than
+# the stdlib encoder); otherwise the stdlib json module with the same output.
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, time
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import inspect as sa_inspect, select
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+class Field:
+    """
+    One output key. `expr` is a column expression (for row serialization) or
+    an attribute name (objects only); `convert` is applied to non-None
+    values; `default` replaces None (or any falsy value when `or_default`).
+    """
+    __slots__ = ('key', 'expr', 'convert', 'default', 'or_default')
+
+    def __init__(self, key, expr=None, convert=None, default=None, or_default=False):
+        self.key = key
+        self.expr = expr if expr is not None else key
+        self.convert = convert
+        self.default = default
+        self.or_default = or_default
+
+
+class Serializer:
+    def __init__(self, name, fields, model=None, joins=()):
+        self.name = name
+        self.model = model
+        self.joins = tuple(joins)      # (target, onclause) pairs, outer-joined by select()
+        self.fields = [f if isinstance(f, Field) else Field(f) for f in fields]
+        self.keys = tuple(f.key for f in self.fields)
+        self.columns = tuple(self._column(f) for f in self.fields)
+        self.from_row = self._compile_row()
+        self.from_object = self._compile_object()
+
+    def _column(self, field):
+        if isinstance(field.expr, str):
+            return getattr(self.model, field.expr) if self.model is not None else None
+        return field.expr
+
+    def _value_code(self, i, source):
+        field = self.fields[i]
+        code = source
+        if field.convert is not None:
+            code = f"(_c{i}({code}) if {code} is not None else None)"
+        if field.default is not None:
+            test = code if field.or_default else f"{code} is not None"
+            code = f"({code} if {test} else _d{i})"
+        return code
+
+    def _compile(self, fn_name, arg, access):
+        env = {}
+        for i, field in enumerate(self.fields):
+            if field.convert is not None:
+                env[f"_c{i}"] = field.convert
+            if field.default is not None:
+                env[f"_d{i}"] = field.default
+        items = ", ".join(f"{field.key!r}: {self._value_code(i, access(i, field))}"
+                          for i, field in enumerate(self.fields))
+        exec(f"def {fn_name}({arg}):\n    return {{{items}}}\n", env)
+        return env[fn_name]
+
+    def _compile_row(self):
+        if all(f.convert is None and f.default is None for f in self.fields):
+            keys = self.keys
+            return lambda row: dict(zip(keys, row))
+        return self._compile("from_row", "r", lambda i, field: f"r[{i}]")
+
+    def _compile_object(self):
+        if not all(isinstance(f.expr, str) for f in self.fields):
+            return None
+        return self._compile("from_object", "o", lambda i, field: f"o.{field.expr}")
+
+    def select(self):
+        """
+        select() of this serializer's columns with its joins applied, ready
+        for filters. Columns are labelled with their keys, which also keeps
+        two fields reading the same column from being collapsed into one.
+        """
+        stmt = select(*(c.label(k) for k, c in zip(self.keys, self.columns)))
+        if self.model is not None:
+            stmt = stmt.select_from(self.model)
+        for target, onclause in self.joins:
+            stmt = stmt.outerjoin(target, onclause)
+        return stmt
+
+    def rows(self, result):
+        """Dicts for every row of a Core result (or any iterable of tuples)."""
+        return list(map(self.from_row, result))
+
+
+registry = {}
+
+
+def register(name, fields, model=None, joins=()):
+    serializer = Serializer(name, fields, model, joins)
+    registry[name] = serializer
+    return serializer
+
+
+def model_serializer(model, fields=None, name=None):
+    """Register `model` with the given attributes (default: every column)."""
+    if fields is None:
+        fields = [attr.key for attr in sa_inspect(model).column_attrs]
+    return register(name or model.__tablename__, fields, model)
+
+
+def dump(obj, name=None):
+    """Serialize one ORM object with its registered serializer."""
+    if not registry:
+        build_registry()   # scripts that use the models without create_app
+    return registry[name or obj.__tablename__].from_object(obj)
+
+
+# ===================== JSON =====================
+
+def _default(value):
+    # only reached for types the encoder does not handle natively
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj, sort_keys=False):
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+    return json.dumps(obj, default=_default, sort_keys=sort_keys, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj, sort_keys=False):
+    return dumps_bytes(obj, sort_keys).decode("utf-8")
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson when available."""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # callers asking for stdlib options (indent, cls, ...) get the stdlib encoder
+            kwargs.setdefault("default", _default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=self.sort_keys)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            dumps_bytes(obj, sort_keys=self.sort_keys) + b"\n", mimetype=self.mimetype)
+
+
+# ===================== Registered serializers =====================
+
+def _date_part(value):
+    return value.strftime("%Y-%m-%d")
+
+
+def _time_part(value):
+    return value.strftime("%H:%M")
+
+
+def build_registry():
+    """Build every serializer; called once from create_app."""
+    from sqlalchemy import String, cast, func
+    from sqlalchemy.orm import aliased
+    from models import Appointment, Hospital, QueueReport, Room, Task, User
+
+    model_serializer(Room, ['room_id', 'room_number', 'status', 'patient_id',
+                            'patient_name', 'department', 'floor'])
+    model_serializer(Task, ['task_id', 'nurse_id', 'room_id', 'description',
+                            'status', 'created_at'])
+
+    register('queue_report', [
+        'report_id', 'department', 'queue_length', 'wait_time_reported',
+        'submitted_by', 'is_validated', 'timestamp',
+    ], model=QueueReport)
+
+    register('doctor_appointment', [
+        'appointment_id', 'patient_id', 'status', Field('date_time', 'scheduled_at'), 'notes',
+    ], model=Appointment)
+
+    # joined through User rather than Doctor: outer-joining the polymorphic
+    # Doctor entity makes SQLite scan the user table
+    doctor_user = aliased(User)
+    # hospital_id has also been stored as the hospital's business id; fall back to that
+    by_business_id = aliased(Hospital)
+    register('patient_appointment', [
+        Field('appointment_id', Appointment.appointment_id),
+        Field('doctor_id', Appointment.doctor_id),
+        Field('doctor_name', doctor_user.name, default="Unknown Doctor"),
+        Field('hospital_id', Appointment.hospital_id),
+        Field('hospital_name', func.coalesce(Hospital.name, by_business_id.name),
+              default="Unknown Hospital"),
+        Field('date_time', Appointment.scheduled_at),
+        Field('status', Appointment.status),
+        Field('notes', Appointment.notes),
+    ], model=Appointment, joins=[
+        (doctor_user, doctor_user.id == Appointment.doctor_id),
+        (Hospital, Hospital.id == Appointment.hospital_id),
+        (by_business_id, by_business_id.hospital_id == cast(Appointment.hospital_id, String)),
+    ])
+
+    patient_user = aliased(User)
+    doctor_user = aliased(User)
+    register('admin_appointment', [
+        Field('id', Appointment.id),
+        Field('patient', patient_user.name, default="Unknown", or_default=True),
+        Field('doctor', doctor_user.name, default="Unknown", or_default=True),
+        Field('hospital', Hospital.name, default="Unknown", or_default=True),
+        Field('date', Appointment.scheduled_at, convert=_date_part, default="N/A"),
+        Field('time', Appointment.scheduled_at, convert=_time_part, default="N/A"),
+        Field('status', Appointment.status, default="Scheduled", or_default=True),
+    ], model=Appointment, joins=[
+        (patient_user, patient_user.id == Appointment.patient_id),
+        (doctor_user, doctor_user.id == Appointment.doctor_id),
+        (Hospital, Hospital.id == Appointment.hospital_id),
+    ])
+    return registry
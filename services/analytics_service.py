@@ -0,0 +1,244 @@
+# Incrementally maintained analytics for the admin dashboard.
+#
+# Every write path that changes an appointment, queue report or user calls one
+# of the record_* helpers *before* committing, so the counters are updated in
+# the same transaction as the row they describe. The dashboard then reads a
+# handful of small rows instead of scanning the big tables. Hospitals are few
+# and created outside the API, so they are counted directly.
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import (
+    Appointment, GlobalCounter, Hospital, HospitalStats, QueueReport, User
+)
+
+STATUS_COLUMNS = {
+    'Scheduled': 'appointments_scheduled',
+    'Completed': 'appointments_completed',
+    'Cancelled': 'appointments_cancelled',
+}
+OTHER_STATUS_COLUMN = 'appointments_other'
+
+COUNTERS = ('users', 'appointments')
+
+
+def _status_column(status):
+    return STATUS_COLUMNS.get(status or 'Scheduled', OTHER_STATUS_COLUMN)
+
+
+def _hospital_pk(hospital_id):
+    try:
+        return int(hospital_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _increment(table, key_col, key, values, defaults):
+    """
+    UPDATE ... SET col = col + delta for one row, creating the row first if it
+    does not exist yet. The insert runs in a savepoint so a concurrent creator
+    just makes us fall back to the UPDATE.
+    """
+    stmt = (
+        update(table)
+        .where(key_col == key)
+        .values({name: getattr(table.c, name) + delta for name, delta in values.items()})
+    )
+    if db.session.execute(stmt).rowcount:
+        return
+    row = dict(defaults)
+    row.update(values)
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(**row))
+    except IntegrityError:
+        db.session.execute(stmt)
+
+
+def _bump_hospital(hospital_id, values):
+    key = _hospital_pk(hospital_id)
+    if key is None:
+        return
+    table = HospitalStats.__table__
+    defaults = {c.name: 0 for c in table.columns}
+    defaults['hospital_id'] = key
+    _increment(table, table.c.hospital_id, key, values, defaults)
+
+
+def bump_counter(name, delta=1):
+    if not delta:
+        return
+    table = GlobalCounter.__table__
+    _increment(table, table.c.name, name, {'value': delta}, {'name': name, 'value': 0})
+
+
+# -------- write-path hooks --------
+
+def record_appointment(hospital_id, status='Scheduled', delta=1):
+    """An appointment was created (delta=1) or deleted (delta=-1)."""
+    _bump_hospital(hospital_id, {
+        'appointments_total': delta,
+        _status_column(status): delta,
+    })
+    bump_counter('appointments', delta)
+
+
+def record_status_change(hospital_id, old_status, new_status):
+    old_col, new_col = _status_column(old_status), _status_column(new_status)
+    if old_col == new_col:
+        return
+    _bump_hospital(hospital_id, {old_col: -1, new_col: 1})
+
+
+def record_queue_report(hospital_id, wait_time, delta=1):
+    if wait_time is None:
+        return
+    _bump_hospital(hospital_id, {
+        'wait_time_sum': int(wait_time) * delta,
+        'wait_time_count': delta,
+    })
+
+
+def record_queue_report_totals(hospital_id, wait_sum, wait_count):
+    """Bulk form of record_queue_report for a batch of reports."""
+    if not wait_count:
+        return
+    _bump_hospital(hospital_id, {
+        'wait_time_sum': int(wait_sum),
+        'wait_time_count': wait_count,
+    })
+
+
+def forget_appointments(criterion):
+    """Back out the stats of appointments about to be bulk-deleted."""
+    rows = (
+        db.session.query(Appointment.hospital_id, Appointment.status, func.count(Appointment.id))
+        .filter(criterion)
+        .group_by(Appointment.hospital_id, Appointment.status)
+        .all()
+    )
+    for hospital_id, status, count in rows:
+        record_appointment(hospital_id, status, delta=-count)
+
+
+def forget_queue_reports(criterion):
+    """Back out the stats of queue reports about to be bulk-deleted."""
+    rows = (
+        db.session.query(
+            QueueReport.hospital_id,
+            func.coalesce(func.sum(QueueReport.wait_time_reported), 0),
+            func.count(QueueReport.wait_time_reported),
+        )
+        .filter(criterion)
+        .group_by(QueueReport.hospital_id)
+        .all()
+    )
+    for hospital_id, wait_sum, wait_count in rows:
+        if wait_count:
+            _bump_hospital(hospital_id, {
+                'wait_time_sum': -int(wait_sum),
+                'wait_time_count': -wait_count,
+            })
+
+
+# -------- reads --------
+
+def get_hospital_analytics():
+    rows = (
+        db.session.query(Hospital, HospitalStats)
+        .outerjoin(HospitalStats, HospitalStats.hospital_id == Hospital.id)
+        .all()
+    )
+    data = []
+    for h, stats in rows:
+        data.append({
+            "hospital_id": h.hospital_id,
+            "name": h.name,
+            "appointment_count": stats.appointments_total if stats else 0,
+            "appointments_by_status": {
+                "Scheduled": stats.appointments_scheduled if stats else 0,
+                "Completed": stats.appointments_completed if stats else 0,
+                "Cancelled": stats.appointments_cancelled if stats else 0,
+                "Other": stats.appointments_other if stats else 0,
+            },
+            "average_wait_time": round(stats.average_wait_time(), 2) if stats else 0,
+            "congestion": h.current_congestion_level or 0,
+        })
+    return data
+
+
+def get_global_counts():
+    counts = dict.fromkeys(COUNTERS, 0)
+    for c in GlobalCounter.query.filter(GlobalCounter.name.in_(COUNTERS)):
+        counts[c.name] = c.value
+    # hospitals are few and are added outside the app's write paths; count them
+    counts['hospitals'] = db.session.query(func.count(Hospital.id)).scalar()
+    return counts
+
+
+# -------- maintenance --------
+
+def is_initialized():
+    return db.session.query(GlobalCounter.name).first() is not None
+
+
+def rebuild():
+    """
+    Recompute every counter from the source tables with a few grouped
+    queries. Used to bootstrap an existing database and by the
+    `flask rebuild-analytics` command to repair drift.
+    """
+    stats = {}
+
+    def row(hospital_id):
+        if hospital_id not in stats:
+            stats[hospital_id] = {c.name: 0 for c in HospitalStats.__table__.columns}
+            stats[hospital_id]['hospital_id'] = hospital_id
+        return stats[hospital_id]
+
+    appt_rows = (
+        db.session.query(Appointment.hospital_id, Appointment.status, func.count(Appointment.id))
+        .group_by(Appointment.hospital_id, Appointment.status)
+        .all()
+    )
+    for hospital_id, status, count in appt_rows:
+        key = _hospital_pk(hospital_id)
+        if key is None:
+            continue
+        r = row(key)
+        r['appointments_total'] += count
+        r[_status_column(status)] += count
+
+    wait_rows = (
+        db.session.query(
+            QueueReport.hospital_id,
+            func.coalesce(func.sum(QueueReport.wait_time_reported), 0),
+            func.count(QueueReport.wait_time_reported),
+        )
+        .group_by(QueueReport.hospital_id)
+        .all()
+    )
+    for hospital_id, wait_sum, wait_count in wait_rows:
+        key = _hospital_pk(hospital_id)
+        if key is None:
+            continue
+        r = row(key)
+        r['wait_time_sum'] = int(wait_sum)
+        r['wait_time_count'] = wait_count
+
+    counters = {
+        'users': db.session.query(func.count(User.id)).scalar(),
+        'appointments': db.session.query(func.count(Appointment.id)).scalar(),
+    }
+
+    db.session.execute(HospitalStats.__table__.delete())
+    db.session.execute(GlobalCounter.__table__.delete())
+    if stats:
+        db.session.execute(HospitalStats.__table__.insert(), list(stats.values()))
+    db.session.execute(
+        GlobalCounter.__table__.insert(),
+        [{'name': name, 'value': value} for name, value in counters.items()],
+    )
+    db.session.commit()
+    return counters
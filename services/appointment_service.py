@@ -1,36 +1,167 @@
+import logging
+
 from database import db
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 
 from models import Appointment, Doctor, Patient, TimeSlot, Hospital
-import time
-
-def find_available_slots(doctor_id=None, hospital_id=None, date=None):
-    q = TimeSlot.query.filter_by(is_available=True)
-    if doctor_id:
-        q = q.filter_by(doctor_id=doctor_id)
-    if hospital_id:
-        q = q.filter_by(hospital_id=hospital_id)
-    slots = q.all()
-    out = []
-    for s in slots:
-        out.append({
-            "slot_id": s.slot_id,
-            "doctor_id": s.doctor_id,
-            "hospital_id": s.hospital_id,
-            "start_time": s.start_time,
-            "end_time": s.end_time,
-            "is_available": s.is_available
-        })
-    return out
+from services import analytics_service
+from services.prediction_cache import invalidate_predictions
+from services.id_generator import new_id
+from services.availability_index import index as availability
+from services.notification_service import dispatcher as notifications, send_booking_confirmation
+from services.reminder_scheduler import scheduler as reminders
+from datetime import datetime, timezone
+
+log = logging.getLogger(__name__)
+
+def parse_appointment_datetime(value):
+    """
+    Normalize an appointment date/time to a naive UTC datetime, or None if it
+    cannot be understood. Accepts datetimes, ISO strings with either a space
+    or a 'T' separator, a trailing 'Z' or offset, bare dates, and the
+    "2025-10-31 2025-10-31T11:00:00" strings older clients produced.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        raw = str(value).strip()
+        if not raw:
+            return None
+        parts = raw.split()
+        if len(parts) > 1 and any("T" in p for p in parts):
+            # duplicated date prefix: keep the full ISO token
+            raw = next(p for p in reversed(parts) if "T" in p)
+        if raw.endswith("Z"):
+            raw = raw[:-1] + "+00:00"
+        try:
+            dt = datetime.fromisoformat(raw)
+        except ValueError:
+            return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def parse_date_window(args):
+    """
+    Read an optional appointment time window from request args: either
+    ?date=YYYY-MM-DD for a single day or ?from=/?to= ISO bounds (to is
+    exclusive). Returns (start, end), either may be None; raises ValueError.
+    """
+    from datetime import timedelta
+    if args.get('date'):
+        day = datetime.strptime(args['date'], "%Y-%m-%d")
+        return day, day + timedelta(days=1)
+    bounds = []
+    for key in ('from', 'to'):
+        raw = args.get(key)
+        parsed = parse_appointment_datetime(raw) if raw else None
+        if raw and parsed is None:
+            raise ValueError(f"Invalid '{key}' value: {raw}")
+        bounds.append(parsed)
+    return bounds[0], bounds[1]
+
+
+def apply_date_window(query, start, end):
+    if start is not None:
+        query = query.filter(Appointment.scheduled_at >= start)
+    if end is not None:
+        query = query.filter(Appointment.scheduled_at < end)
+    return query
+
+
+# -------- statements (also EXPLAINed by query_plans) --------
+
+def active_appointment_stmt(patient_id, doctor_id):
+    return select(Appointment).where(
+        Appointment.patient_id == patient_id, Appointment.doctor_id == doctor_id,
+        Appointment.status == 'Scheduled',
+    ).limit(1)
+
+
+def slot_lookup_stmt(doctor_pk, slot_id=None, scheduled_at=None):
+    """The doctor's slot with this slot_id, or the free one starting at scheduled_at."""
+    stmt = select(TimeSlot.id, TimeSlot.slot_id, TimeSlot.start_time, TimeSlot.hospital_id) \
+        .where(TimeSlot.doctor_id == doctor_pk)
+    if slot_id:
+        return stmt.where(TimeSlot.slot_id == str(slot_id)).limit(1)
+    return stmt.where(TimeSlot.is_available == True,  # noqa: E712
+                      TimeSlot.start_time == scheduled_at).limit(1)
+
+
+def doctor_has_slots_stmt(doctor_pk):
+    return select(TimeSlot.id).where(TimeSlot.doctor_id == doctor_pk).limit(1)
+
 
 def validate_booking_rules(patient: Patient, doctor_id, date_time):
     # Business rules simplified:
     # - A patient cannot have another active appointment for same doctor
-    s = Appointment.query.filter_by(patient_id=patient.id, doctor_id=doctor_id).filter(Appointment.status=='Scheduled').first()
+    #   (enforced by uq_appointment_patient_doctor_scheduled; this check only
+    #   gives the common case a friendly error before anything is reserved)
+    s = db.session.scalars(active_appointment_stmt(patient.id, doctor_id)).first()
     if s:
         return False, "Patient already has an active appointment with this doctor"
     return True, None
 
-def book_appointment(patient_id, doctor_id, hospital_id, date_time):
+# -------- slot reservation --------
+#
+# A slot is taken by flipping is_available true -> false with one conditional
+# UPDATE in the booking transaction. Whoever's UPDATE matches the row wins;
+# everyone else matches zero rows and gets a conflict, with no locks held while
+# the booking is validated. The UPDATE and the appointment INSERT commit (or
+# roll back) together, so a failed booking never leaves a slot taken.
+
+def reserve_slot(slot_pk):
+    """Returns True if this transaction took the slot."""
+    stmt = (
+        update(TimeSlot)
+        .where(TimeSlot.id == slot_pk, TimeSlot.is_available == True)  # noqa: E712
+        .values(is_available=False)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).rowcount == 1
+
+
+def release_slot(appointment):
+    """
+    Make the appointment's slot bookable again (call before commit). Returns
+    the slot's primary key for availability.touch() after the commit.
+    """
+    if appointment.time_slot_id is None:
+        return None
+    db.session.execute(
+        update(TimeSlot)
+        .where(TimeSlot.id == appointment.time_slot_id)
+        .values(is_available=True)
+        .execution_options(synchronize_session=False)
+    )
+    return appointment.time_slot_id
+
+
+def _find_slot(doctor_pk, slot_id, scheduled_at):
+    return db.session.execute(slot_lookup_stmt(doctor_pk, slot_id, scheduled_at)).first()
+
+
+def _doctor_publishes_slots(doctor_pk):
+    return db.session.execute(doctor_has_slots_stmt(doctor_pk)).first() is not None
+
+
+def book_appointment(patient_id, doctor_id, hospital_id, date_time, slot_id=None):
+    """
+    Book by slot_id, or by date_time matching the start of one of the
+    doctor's free slots. Doctors who have never published slots can still be
+    booked at any time. Errors come back as {"error": ...}; "conflict": True
+    marks a slot that is taken or not offered.
+    """
+    scheduled_at = None
+    if date_time or not slot_id:
+        scheduled_at = parse_appointment_datetime(date_time)
+        if scheduled_at is None:
+            return {"error": "Invalid date_time, expected ISO format like 2025-10-24T10:00"}
+
     # Validate doctor and patient exist
     patient = Patient.query.get(patient_id)
     if not patient:
@@ -47,31 +178,63 @@ def book_appointment(patient_id, doctor_id, hospital_id, date_time):
     ).first()
 
     if not doctor:
-        print(f"DEBUG: No doctor found for doctor_id={doctor_id}")
+        log.debug("booking rejected: no doctor", extra={"doctor_id": str(doctor_id)})
         return {"error": "Doctor not found"}
 
+    slot = _find_slot(doctor.id, slot_id, scheduled_at)
+    if slot_id and slot is None:
+        return {"error": "Slot not found for this doctor"}
+    if slot is None and _doctor_publishes_slots(doctor.id):
+        return {"error": "No available slot for this doctor at that time", "conflict": True}
+    if slot is not None:
+        scheduled_at = slot.start_time
+        hospital_id = hospital_id or slot.hospital_id
+
     # Validate business rules
     valid, reason = validate_booking_rules(patient, doctor.id, date_time)
     if not valid:
-        return {"error": reason}
+        return {"error": reason, "conflict": True}
+
+    if slot is not None and not reserve_slot(slot.id):
+        db.session.rollback()
+        return {"error": "Slot already booked", "conflict": True}
 
     # Create appointment
     appt = Appointment(
-        appointment_id=f"APPT-{int(time.time())}",
+        appointment_id=new_id("APPT-"),
         patient_id=patient_id,
         doctor_id=doctor.id,  # always use the internal numeric ID
         hospital_id=hospital_id,
-        date_time=date_time,
+        scheduled_at=scheduled_at,
+        time_slot_id=slot.id if slot is not None else None,
         status="Scheduled"
     )
 
     db.session.add(appt)
-    db.session.commit()
+    try:
+        # the unique index on active appointments is checked here
+        db.session.flush()
+        analytics_service.record_appointment(hospital_id, appt.status)
+        send_booking_confirmation(patient, appt)
+        db.session.commit()
+    except IntegrityError:
+        # rolls the slot reservation (and the confirmation) back with it
+        db.session.rollback()
+        # a concurrent booking for the same patient and doctor won the unique
+        # index on active appointments
+        valid, reason = validate_booking_rules(patient, doctor.id, date_time)
+        return {"error": reason if not valid else "Booking conflict, please retry", "conflict": True}
+    notifications.wake()
+    reminders.update(appt)
+    invalidate_predictions(hospital_id)
+    if slot is not None:
+        availability.touch([slot.id])
 
     return {
         "message": "Appointment booked",
         "appointment_id": appt.appointment_id,
+        "slot_id": slot.slot_id if slot is not None else None,
         "status": appt.status,
-        "date_time": appt.date_time
+        "date_time": appt.scheduled_at.isoformat()
     }
 
@@ -0,0 +1,343 @@
+# In-memory index of free time slots.
+#
+# For every doctor the free slots are kept per calendar day in lists sorted by
+# start time, plus a sorted list of the days that have any. Lookups for one
+# doctor and day are a dict hit; "earliest N free slots for any cardiologist
+# at hospital X between A and B" is a k-way merge over the matching doctors'
+# day lists, reading only as many slots as it returns.
+#
+# The index is loaded at startup and kept current by the write paths, which
+# call touch(slot_ids) after committing a slot create/delete/book/release.
+# Changes made by other worker processes are picked up three ways:
+#   * new slots: rows past an id high-water mark, checked every sync_interval
+#   * slots booked or deleted elsewhere: every search result is re-checked by
+#     primary key before it is returned, and stale entries are dropped
+#   * slots released elsewhere: a full reload every reload_interval, built by
+#     a background thread per process and swapped in under the lock, so no
+#     request pays for it
+import heapq
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+from datetime import datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import select
+
+from database import db
+
+log = logging.getLogger(__name__)
+
+# ordered by (start_time, id); id is unique so comparisons never reach the rest
+FreeSlot = namedtuple('FreeSlot', 'start_time id end_time slot_id doctor_id hospital_id slot_type')
+
+
+# -------- statements (also EXPLAINed by query_plans) --------
+
+def new_slots_stmt(watermark):
+    from models import TimeSlot
+    return select(TimeSlot.id).where(TimeSlot.id > watermark).order_by(TimeSlot.id)
+
+
+def free_slots_stmt(slot_pks):
+    """Which of these slots are still free."""
+    from models import TimeSlot
+    return select(TimeSlot.id).where(
+        TimeSlot.id.in_(slot_pks), TimeSlot.is_available == True,  # noqa: E712
+    )
+
+
+class _DoctorDays:
+    __slots__ = ('days', 'dates')
+
+    def __init__(self):
+        self.days = {}    # date -> [FreeSlot] sorted
+        self.dates = []   # sorted dates present in `days`
+
+    def add(self, slot):
+        day = slot.start_time.date()
+        slots = self.days.get(day)
+        if slots is None:
+            slots = self.days[day] = []
+            insort(self.dates, day)
+        insort(slots, slot)
+
+    def remove(self, slot):
+        day = slot.start_time.date()
+        slots = self.days.get(day)
+        if not slots:
+            return
+        i = bisect_left(slots, slot)
+        if i < len(slots) and slots[i].id == slot.id:
+            del slots[i]
+        if not slots:
+            del self.days[day]
+            self.dates.pop(bisect_left(self.dates, day))
+
+    def between(self, start, end):
+        """
+        Free slots with start <= start_time < end, in order. Lazy and
+        lock-free: a concurrent change can at worst skip or repeat an entry,
+        and every result is re-checked against the table anyway.
+        """
+        first = bisect_left(self.dates, start.date())
+        for day in islice(self.dates, first, None):
+            if day > end.date():
+                return
+            slots = self.days.get(day, ())
+            i = bisect_left(slots, (start,)) if day == start.date() else 0
+            for slot in islice(slots, i, None):
+                if slot.start_time >= end:
+                    return
+                yield slot
+
+
+class AvailabilityIndex:
+    def __init__(self, sync_interval=5.0, reload_interval=300.0):
+        self._lock = threading.RLock()
+        self._doctors = {}      # doctor pk -> _DoctorDays
+        self._slots = {}        # slot pk -> FreeSlot
+        self._specialty = {}    # doctor pk -> lower-cased specialty
+        self._home = {}         # doctor pk -> doctor's hospital pk
+        # hospital pk -> doctors with slots indexed there; only grows between
+        # reloads, so it may list a doctor whose slots there are gone
+        self._hospitals = {}
+        self._watermark = 0     # highest time_slot.id read by warm() or sync()
+        self._touched_ids = set()   # ids applied by touch() that are above the watermark
+        self._reload_touched = None  # ids touched while a reload is being built
+        self._last_sync = 0.0
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self.configure(sync_interval, reload_interval)
+
+    def configure(self, sync_interval=None, reload_interval=None, app=None):
+        if sync_interval is not None:
+            self.sync_interval = float(sync_interval)
+        if reload_interval is not None:
+            self.reload_interval = float(reload_interval)
+        if app is not None:
+            self._app = app
+
+    # -------- loading --------
+
+    @staticmethod
+    def _slot_columns():
+        from models import TimeSlot
+        return (TimeSlot.start_time, TimeSlot.id, TimeSlot.end_time, TimeSlot.slot_id,
+                TimeSlot.doctor_id, TimeSlot.hospital_id, TimeSlot.slot_type, TimeSlot.is_available)
+
+    def _load_doctors(self, doctor_ids=None):
+        from models import Doctor
+        q = db.session.query(Doctor.id, Doctor.specialty, Doctor.hospital_id)
+        if doctor_ids is not None:
+            q = q.filter(Doctor.id.in_(doctor_ids))
+        for doctor_pk, specialty, hospital_id in q:
+            self._specialty[doctor_pk] = (specialty or '').strip().lower()
+            self._home[doctor_pk] = hospital_id
+
+    def warm(self):
+        """
+        (Re)load every free slot that has not started yet. The new structures
+        are built aside and swapped in, so readers keep using the old ones
+        meanwhile; slots touched during the build are re-read afterwards.
+        """
+        from models import TimeSlot
+        with self._lock:
+            self._reload_touched = set()
+        try:
+            max_id = db.session.query(db.func.max(TimeSlot.id)).scalar() or 0
+            rows = (
+                db.session.query(*self._slot_columns())
+                .filter(TimeSlot.is_available == True,  # noqa: E712
+                        TimeSlot.start_time >= datetime.utcnow(),
+                        TimeSlot.id <= max_id)
+                .all()
+            )
+            fresh = AvailabilityIndex()
+            fresh._load_doctors()
+            for row in rows:
+                fresh._put(FreeSlot(*row[:-1]))
+            with self._lock:
+                self._doctors, self._slots = fresh._doctors, fresh._slots
+                self._specialty, self._home = fresh._specialty, fresh._home
+                self._hospitals = fresh._hospitals
+                self._watermark = max(self._watermark, max_id)
+                self._touched_ids = {i for i in self._touched_ids if i > self._watermark}
+                self._last_sync = time.monotonic()
+                retouch = self._reload_touched
+        finally:
+            with self._lock:
+                self._reload_touched = None
+        self.touch(retouch)
+
+    def _put(self, slot):
+        if slot.start_time is None or slot.doctor_id is None:
+            return
+        old = self._slots.get(slot.id)
+        if old is not None:
+            self._doctors[old.doctor_id].remove(old)
+        self._slots[slot.id] = slot
+        days = self._doctors.get(slot.doctor_id)
+        if days is None:
+            days = self._doctors[slot.doctor_id] = _DoctorDays()
+        days.add(slot)
+        self._hospitals.setdefault(self._slot_hospital(slot), set()).add(slot.doctor_id)
+
+    def _slot_hospital(self, slot):
+        # slots without a hospital are held at the doctor's own hospital
+        return slot.hospital_id if slot.hospital_id is not None else self._home.get(slot.doctor_id)
+
+    def _drop(self, slot_pk):
+        old = self._slots.pop(slot_pk, None)
+        if old is not None:
+            self._doctors[old.doctor_id].remove(old)
+
+    # -------- background reload --------
+
+    def ensure_running(self):
+        if self._app is None or self.reload_interval <= 0:
+            return
+        # threads do not survive a fork; each worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._reload_loop, name='availability-reload',
+                                            daemon=True)
+            self._thread.start()
+
+    def _reload_loop(self):
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                with self._app.app_context():
+                    self.warm()
+            except Exception:
+                log.exception("availability index reload failed")
+
+    def touch(self, slot_pks):
+        """
+        Re-read the given slots after a committed create/delete/book/release
+        and bring the index in line: free slots are (re)inserted, booked or
+        deleted ones removed.
+        """
+        from models import TimeSlot
+        slot_pks = [pk for pk in slot_pks if pk is not None]
+        if not slot_pks:
+            return
+        rows = db.session.query(*self._slot_columns()).filter(TimeSlot.id.in_(slot_pks)).all()
+        with self._lock:
+            unknown = {row.doctor_id for row in rows} - set(self._specialty)
+            if unknown:
+                self._load_doctors(unknown)
+            found = set()
+            for row in rows:
+                found.add(row.id)
+                if row.is_available:
+                    self._put(FreeSlot(*row[:-1]))
+                else:
+                    self._drop(row.id)
+            for pk in slot_pks:
+                if pk not in found:
+                    self._drop(pk)
+            # the watermark only moves in sync(): slots with lower ids that
+            # another worker committed may not have been read yet
+            self._touched_ids.update(pk for pk in slot_pks if pk > self._watermark)
+            if self._reload_touched is not None:
+                self._reload_touched.update(slot_pks)
+
+    def sync(self, force=False):
+        """Catch up with slots created by other processes."""
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = now
+        new_ids = list(db.session.scalars(new_slots_stmt(self._watermark)))
+        if not new_ids:
+            return
+        self.touch([pk for pk in new_ids if pk not in self._touched_ids])
+        with self._lock:
+            self._watermark = max(self._watermark, new_ids[-1])
+            self._touched_ids = {i for i in self._touched_ids if i > self._watermark}
+
+    # -------- reads --------
+
+    def day(self, doctor_id, date):
+        """Free slots of one doctor on one date, in start order."""
+        self.sync()
+        start = datetime.combine(date, datetime.min.time())
+        return self._verified(self._candidates([doctor_id], start, start + timedelta(days=1)), None)
+
+    def search(self, specialty=None, hospital_id=None, doctor_id=None,
+               start=None, end=None, limit=10):
+        """
+        Earliest `limit` free slots across doctors, optionally filtered by
+        specialty (case-insensitive), hospital pk, doctor pk and a
+        [start, end) window. Slots in the past are never returned.
+        """
+        self.sync()
+        now = datetime.utcnow()
+        start = max(start or now, now)
+        end = end or datetime.max
+        with self._lock:
+            if hospital_id is not None:
+                # only doctors with slots at this hospital are merged at all
+                doctors = list(self._hospitals.get(hospital_id, ()))
+            else:
+                doctors = list(self._doctors)
+        if doctor_id is not None:
+            doctors = [d for d in doctors if d == doctor_id]
+        if specialty:
+            wanted = specialty.strip().lower()
+            doctors = [d for d in doctors if self._specialty.get(d) == wanted]
+        candidates = self._candidates(doctors, start, end)
+        if hospital_id is not None:
+            # a doctor may also hold slots at other hospitals
+            candidates = (s for s in candidates if self._slot_hospital(s) == hospital_id)
+        return self._verified(candidates, limit)
+
+    def _candidates(self, doctor_ids, start, end):
+        streams = [self._doctors[d].between(start, end)
+                   for d in doctor_ids if d in self._doctors]
+        return heapq.merge(*streams)
+
+    def _verified(self, candidates, limit):
+        """
+        Take candidates in order, confirming each batch against the table by
+        primary key so a slot booked or deleted by another process is never
+        returned (and is dropped from the index).
+        """
+        out = []
+        while limit is None or len(out) < limit:
+            batch = list(islice(candidates, limit - len(out) if limit else 500))
+            if not batch:
+                break
+            free = set(db.session.scalars(free_slots_stmt([s.id for s in batch])))
+            with self._lock:
+                for s in batch:
+                    if s.id in free:
+                        out.append(s)
+                    else:
+                        self._drop(s.id)
+        return out
+
+
+index = AvailabilityIndex()
+
+
+def slot_to_dict(slot):
+    return {
+        "slot_id": slot.slot_id,
+        "doctor_id": slot.doctor_id,
+        "hospital_id": slot.hospital_id,
+        "start_time": slot.start_time.isoformat(),
+        "end_time": slot.end_time.isoformat() if slot.end_time else None,
+        "date": slot.start_time.strftime("%Y-%m-%d"),
+        "slot_type": slot.slot_type,
+    }
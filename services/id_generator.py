@@ -0,0 +1,77 @@
+# Business id generator (APPT-, QR-, SR-, P-, TS- ...).
+#
+# Ids are 80-bit, k-sortable values rendered as 16 Crockford base32 characters,
+# so string order equals creation order:
+#
+#   42 bits  milliseconds since 2024-01-01 UTC (good for ~139 years)
+#    6 bits  node id, ID_NODE_ID (0-63), one per host/container
+#   22 bits  process id, which is unique among the workers of one host
+#   10 bits  sequence within the millisecond (1024 ids/ms per process)
+#
+# No database round trip or coordination between gunicorn workers is needed:
+# two processes never share (node, pid) while both are alive. Within a process
+# the clock is never allowed to run backwards, and a sequence overflow borrows
+# the next millisecond instead of sleeping.
+import os
+import threading
+import time
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+
+TIME_BITS, NODE_BITS, PID_BITS, SEQ_BITS = 42, 6, 22, 10
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford base32, ASCII-ordered
+_WIDTH = (TIME_BITS + NODE_BITS + PID_BITS + SEQ_BITS) // 5
+
+
+class IdGenerator:
+    def __init__(self, node_id=0):
+        self._lock = threading.Lock()
+        self.configure(node_id)
+        self._reset()
+
+    def configure(self, node_id=None):
+        if node_id is not None:
+            node_id = int(node_id)
+            if not 0 <= node_id < (1 << NODE_BITS):
+                raise ValueError(f"ID_NODE_ID must be between 0 and {(1 << NODE_BITS) - 1}")
+            self.node_id = node_id
+
+    def _reset(self):
+        self._pid = os.getpid() & ((1 << PID_BITS) - 1)
+        self._last_ms = 0
+        self._seq = 0
+
+    def next_int(self):
+        with self._lock:
+            now = int(time.time() * 1000) - EPOCH_MS
+            if now > self._last_ms:
+                self._last_ms = now
+                self._seq = 0
+            else:
+                self._seq += 1
+                if self._seq >> SEQ_BITS:
+                    self._last_ms += 1
+                    self._seq = 0
+            value = self._last_ms
+            value = (value << NODE_BITS) | self.node_id
+            value = (value << PID_BITS) | self._pid
+            return (value << SEQ_BITS) | self._seq
+
+    def next_code(self):
+        value = self.next_int()
+        chars = []
+        for _ in range(_WIDTH):
+            chars.append(_ALPHABET[value & 31])
+            value >>= 5
+        return "".join(reversed(chars))
+
+
+generator = IdGenerator()
+# a forked worker must not reuse its parent's pid bits or sequence
+os.register_at_fork(after_in_child=generator._reset)
+
+
+def new_id(prefix):
+    """e.g. new_id("APPT-") -> "APPT-01J9Z3Q8M4T2X0K7"."""
+    return prefix + generator.next_code()
+
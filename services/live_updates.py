@@ -0,0 +1,302 @@
+# In-process pub/sub for live queue and congestion streams.
+#
+# Server-sent event streams subscribe to one hospital. Write paths publish
+# small events after they commit (a queue report arrived, congestion changed,
+# an appointment changed status) and the broker fans each event out to that
+# hospital's subscribers only. A subscriber keeps just the latest event of each
+# type, so a burst of reports wakes a waiting stream once.
+#
+# Writes made by other worker processes never reach this broker directly, so
+# one poller thread per process checks the database every `poll_interval`
+# seconds for the hospitals that currently have subscribers: one congestion
+# query, one appointment status query and a queue_stats sync, however many
+# streams are open.
+#
+# An open stream holds a greenlet (or a worker thread) for as long as it
+# lasts, so streams are only served by gevent or threaded workers (see
+# gunicorn.conf.py), are capped at max_subscribers per process, and end after
+# max_stream_seconds; the `retry:` hint makes clients reconnect.
+import logging
+import os
+import threading
+import time
+
+from database import db
+from serialization import dumps
+
+log = logging.getLogger(__name__)
+
+QUEUE, CONGESTION, APPOINTMENT = 'queue', 'congestion', 'appointment'
+
+
+class BrokerFull(Exception):
+    """Raised when a new subscription would exceed max_subscribers."""
+
+
+class Subscription:
+    __slots__ = ('hospital_id', 'patient_id', 'appointment_id', 'topics',
+                 '_cond', '_pending', 'closed')
+
+    def __init__(self, hospital_id, topics, patient_id=None, appointment_id=None):
+        self.hospital_id = hospital_id
+        self.patient_id = patient_id
+        self.appointment_id = appointment_id
+        self.topics = frozenset(topics)
+        self._cond = threading.Condition()
+        self._pending = {}
+        self.closed = False
+
+    def offer(self, event):
+        if event['type'] not in self.topics:
+            return
+        if event['type'] == APPOINTMENT and event.get('appointment_id') != self.appointment_id:
+            return
+        with self._cond:
+            self._pending[event['type']] = event
+            self._cond.notify()
+
+    def wait(self, timeout):
+        """Block until events arrive or `timeout` passes; returns them (maybe [])."""
+        with self._cond:
+            if not self._pending and not self.closed:
+                self._cond.wait(timeout)
+            events, self._pending = list(self._pending.values()), {}
+        return events
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class LiveBroker:
+    def __init__(self, poll_interval=5.0, keepalive=15.0, max_subscribers=16,
+                 max_stream_seconds=300.0):
+        self._lock = threading.Lock()
+        self._subscribers = {}   # hospital pk -> set of Subscription
+        self._count = 0
+        self._app = None
+        self._poller = None
+        self._poller_pid = None
+        self._stop = threading.Event()
+        self._congestion = {}    # hospital pk -> last congestion level seen by the poller
+        self.configure(poll_interval, keepalive, max_subscribers, max_stream_seconds)
+
+    def configure(self, poll_interval=None, keepalive=None, max_subscribers=None,
+                  max_stream_seconds=None, app=None):
+        if poll_interval is not None:
+            self.poll_interval = float(poll_interval)
+        if keepalive is not None:
+            self.keepalive = float(keepalive)
+        if max_subscribers is not None:
+            self.max_subscribers = int(max_subscribers)
+        if max_stream_seconds is not None:
+            self.max_stream_seconds = float(max_stream_seconds)
+        if app is not None:
+            self._app = app
+
+    # -------- subscriptions --------
+
+    def has_capacity(self):
+        """Cheap pre-check for routes; subscribe() enforces the limit."""
+        return self._count < self.max_subscribers
+
+    def subscribe(self, sub):
+        """
+        Register a Subscription. Called by event_stream once the response is
+        actually being sent, so a response that is never iterated cannot
+        leave a subscriber counted.
+        """
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise BrokerFull()
+            self._subscribers.setdefault(sub.hospital_id, set()).add(sub)
+            self._count += 1
+        self._ensure_poller()
+
+    def unsubscribe(self, sub):
+        sub.close()
+        with self._lock:
+            subs = self._subscribers.get(sub.hospital_id)
+            if subs and sub in subs:
+                subs.discard(sub)
+                self._count -= 1
+                if not subs:
+                    del self._subscribers[sub.hospital_id]
+                    self._congestion.pop(sub.hospital_id, None)
+
+    def subscriber_count(self):
+        return self._count
+
+    # -------- publishing --------
+
+    def publish(self, hospital_id, event):
+        try:
+            hospital_id = int(hospital_id)
+        except (TypeError, ValueError):
+            return 0
+        with self._lock:
+            subs = list(self._subscribers.get(hospital_id, ()))
+        for sub in subs:
+            sub.offer(event)
+        return len(subs)
+
+    # -------- cross-process poller --------
+
+    def _ensure_poller(self):
+        if self._app is None:
+            return
+        with self._lock:
+            # threads do not survive a fork; each worker starts its own
+            if self._poller is not None and self._poller_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._poller_pid = os.getpid()
+            self._poller = threading.Thread(target=self._poll_loop, name='live-updates-poller',
+                                            daemon=True)
+            self._poller.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                with self._app.app_context():
+                    self.poll()
+            except Exception:
+                log.exception("live update poll failed")
+
+    def poll(self):
+        """Publish changes made by other processes. Needs an app context."""
+        from models import Appointment, Hospital
+        from services.queue_stats import engine as queue_stats
+
+        with self._lock:
+            hospital_ids = list(self._subscribers)
+            watched = {
+                sub.appointment_id
+                for subs in self._subscribers.values() for sub in subs
+                if sub.appointment_id is not None
+            }
+        if not hospital_ids:
+            return
+        try:
+            rows = (
+                db.session.query(Hospital.id, Hospital.current_congestion_level)
+                .filter(Hospital.id.in_(hospital_ids))
+                .all()
+            )
+            for hospital_id, level in rows:
+                if self._congestion.get(hospital_id, level) != level:
+                    publish_congestion(hospital_id, level)
+                self._congestion[hospital_id] = level
+
+            if watched:
+                appts = (
+                    db.session.query(Appointment.appointment_id, Appointment.hospital_id,
+                                     Appointment.status)
+                    .filter(Appointment.appointment_id.in_(watched),
+                            Appointment.status != 'Scheduled')
+                    .all()
+                )
+                for appointment_id, hospital_id, status in appts:
+                    self.publish(hospital_id, {'type': APPOINTMENT,
+                                               'appointment_id': appointment_id,
+                                               'status': status})
+
+            for hospital_id in queue_stats.sync(force=True):
+                publish_queue(hospital_id)
+        finally:
+            db.session.remove()
+
+
+broker = LiveBroker()
+
+
+# -------- write-path hooks (call after commit) --------
+
+def publish_queue(hospital_id):
+    if hospital_id is not None:
+        broker.publish(hospital_id, {'type': QUEUE})
+
+
+def publish_congestion(hospital_id, level):
+    broker.publish(hospital_id, {'type': CONGESTION, 'congestion_level': level})
+
+
+def publish_appointment(appointment):
+    broker.publish(appointment.hospital_id, {
+        'type': APPOINTMENT,
+        'appointment_id': appointment.appointment_id,
+        'status': appointment.status,
+    })
+
+
+# -------- server-sent events --------
+
+def streams_supported(environ):
+    """
+    False under gunicorn's sync worker, where an open stream would hold the
+    worker's only thread and starve every other request.
+    """
+    return bool(environ.get('wsgi.multithread')) or \
+        not environ.get('SERVER_SOFTWARE', '').startswith('gunicorn/')
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def event_stream(sub, render, event_name, retry_ms=None):
+    """
+    SSE frames for one subscription: the current snapshot first, then a new
+    one only when an event changes it, with a comment line every `keepalive`
+    seconds so proxies keep the connection open. The stream ends after the
+    broker's max_stream_seconds and the client reconnects after `retry_ms`.
+
+    `sub` is registered with the broker here rather than by the route, and
+    unregistered when the generator is closed. If the broker filled up since
+    the route checked has_capacity(), only the retry hint is sent.
+
+    render(events) returns (payload, finished); it runs without an app
+    context and must not touch the database. When finished is true the
+    snapshot is sent and the stream ends.
+    """
+    if retry_ms is not None:
+        yield f"retry: {int(retry_ms)}\n\n"
+    try:
+        broker.subscribe(sub)
+    except BrokerFull:
+        return
+    seq = 0
+    last = None
+    deadline = time.monotonic() + broker.max_stream_seconds if broker.max_stream_seconds > 0 else None
+    try:
+        events = []
+        while True:
+            payload, finished = render(events)
+            if payload != last:
+                seq += 1
+                last = payload
+                yield format_event(event_name, payload, seq)
+            if finished or sub.closed:
+                return
+            timeout = broker.keepalive
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                timeout = min(timeout, remaining)
+            events = sub.wait(timeout)
+            if not events and deadline is not None and time.monotonic() >= deadline:
+                return
+            if not events:
+                yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(sub)
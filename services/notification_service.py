@@ -1,13 +1,393 @@
-# Minimal notification service - placeholder that prints to console.
+# Outbox-backed notifications.
+#
+# send_* calls never talk to a gateway. They add a NotificationOutbox row to
+# the caller's session, so the notification commits (or rolls back) with the
+# booking or report that caused it, and the request never waits on SMTP/SMS.
+# After committing, callers wake() the dispatcher.
+#
+# The dispatcher is one background thread per process. Each round it claims a
+# batch of due rows with a conditional UPDATE (safe with several worker
+# processes), groups them per channel and hands each group to that channel's
+# transport in one go (one SMTP connection per batch). Failures are retried
+# with exponential backoff up to max_attempts, then marked failed. A row left
+# in "sending" by a crashed process is reclaimed after `lease` seconds.
+# Each row carries a unique dedupe_key, so the same notification is only ever
+# queued once.
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from sqlalchemy import and_, bindparam, or_, select
+
+from database import db
+
+log = logging.getLogger(__name__)
+
+EMAIL, SMS = 'email', 'sms'
+
+
+# ===================== Transports =====================
+# send_batch(rows) -> one error string (or None on success) per row, in order.
+
+def _mask_recipient(recipient):
+    """'jane@example.com' -> 'j***@example.com', '+15551234567' -> '***67'."""
+    recipient = recipient or ''
+    local, at, domain = recipient.partition('@')
+    if at:
+        return f"{local[:1]}***@{domain}"
+    return f"***{recipient[-2:]}" if len(recipient) > 4 else "***"
+
+
+class ConsoleTransport:
+    """
+    Logs instead of delivering; the default when no gateway is configured.
+    Only the outbox id and a masked recipient are logged at INFO; the
+    message itself (patient data) only at DEBUG.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def send_batch(self, rows):
+        for row in rows:
+            extra = {"outbox_id": row.id, "kind": row.kind}
+            log.info("%s %s to %s", self.channel, row.id, _mask_recipient(row.recipient), extra=extra)
+            log.debug("%s %s: %s - %s", self.channel, row.id, row.subject, row.body, extra=extra)
+        return [None] * len(rows)
+
+
+class SMTPTransport:
+    def __init__(self, host='localhost', port=25, sender='noreply@mediq.local',
+                 username=None, password=None, starttls=False, timeout=10.0):
+        self.host = host
+        self.port = int(port)
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send_batch(self, rows):
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        except (OSError, smtplib.SMTPException) as e:
+            return [f"connect failed: {e}"] * len(rows)
+        errors = []
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or '')
+            for row in rows:
+                msg = EmailMessage()
+                msg['From'] = self.sender
+                msg['To'] = row.recipient
+                msg['Subject'] = row.subject or ''
+                msg['Message-ID'] = f"<outbox-{row.id}@{self.host}>"
+                msg.set_content(row.body or '')
+                try:
+                    smtp.send_message(msg)
+                    errors.append(None)
+                except smtplib.SMTPServerDisconnected as e:
+                    errors.extend([f"disconnected: {e}"] * (len(rows) - len(errors)))
+                    return errors
+                except (smtplib.SMTPException, OSError) as e:
+                    errors.append(str(e))
+        except (smtplib.SMTPException, OSError) as e:
+            errors.extend([str(e)] * (len(rows) - len(errors)))
+        finally:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        return errors
+
+
+# ===================== Dispatcher =====================
+
+class _ChannelStats:
+    __slots__ = ('sent', 'retried', 'failed', 'batches', 'send_seconds', 'recent')
+
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.send_seconds = 0.0
+        self.recent = deque()   # (monotonic time, delivered) for the last minute
+
+    def snapshot(self, now):
+        while self.recent and now - self.recent[0][0] > 60:
+            self.recent.popleft()
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+            "sent_per_second_1m": round(sum(n for _, n in self.recent) / 60.0, 2),
+            "avg_batch_ms": round(self.send_seconds / self.batches * 1000, 2) if self.batches else None,
+        }
+
+
+class NotificationDispatcher:
+    def __init__(self, poll_interval=2.0, batch_size=100, max_attempts=5,
+                 backoff_base=5.0, backoff_max=600.0, lease=120.0):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._stats = {}
+        self.transports = {EMAIL: ConsoleTransport(EMAIL), SMS: ConsoleTransport(SMS)}
+        self.configure(poll_interval, batch_size, max_attempts, backoff_base, backoff_max, lease)
+
+    def configure(self, poll_interval=None, batch_size=None, max_attempts=None,
+                  backoff_base=None, backoff_max=None, lease=None, transports=None, app=None):
+        if poll_interval is not None:
+            self.poll_interval = float(poll_interval)
+        if batch_size is not None:
+            self.batch_size = int(batch_size)
+        if max_attempts is not None:
+            self.max_attempts = int(max_attempts)
+        if backoff_base is not None:
+            self.backoff_base = float(backoff_base)
+        if backoff_max is not None:
+            self.backoff_max = float(backoff_max)
+        if lease is not None:
+            self.lease = float(lease)
+        if transports is not None:
+            self.transports.update(transports)
+        if app is not None:
+            self._app = app
+
+    # -------- background thread --------
+
+    def ensure_running(self):
+        if self._app is None or self.poll_interval <= 0:
+            return
+        # threads do not survive a fork; each worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='notification-dispatcher',
+                                            daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Deliver without waiting for the next poll; call after committing outbox rows."""
+        self.ensure_running()
+        self._wakeup.set()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self._app.app_context():
+                    # keep going while full batches come back
+                    while self.run_once() >= self.batch_size:
+                        pass
+            except Exception:
+                log.exception("notification dispatch failed")
+
+    # -------- one round --------
+
+    def _due(self, now):
+        from models import NotificationOutbox as O
+        return or_(
+            and_(O.status == 'pending', O.next_attempt_at <= now),
+            and_(O.status == 'sending', O.claimed_at < now - timedelta(seconds=self.lease)),
+        )
+
+    def due_stmt(self, now):
+        """Ids of the next batch to claim (also EXPLAINed by query_plans)."""
+        from models import NotificationOutbox as O
+        return select(O.id).where(self._due(now)).order_by(O.next_attempt_at).limit(self.batch_size)
+
+    def _claim(self):
+        from models import NotificationOutbox as O
+        now = datetime.utcnow()
+        ids = list(db.session.scalars(self.due_stmt(now)))
+        if not ids:
+            db.session.rollback()
+            return None, []
+        token = uuid.uuid4().hex
+        # re-checking the due condition makes the claim exclusive across processes
+        db.session.query(O).filter(O.id.in_(ids), self._due(now)).update(
+            {O.status: 'sending', O.claim_token: token, O.claimed_at: now,
+             O.attempts: O.attempts + 1},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        return token, db.session.scalars(claimed_stmt(token)).all()
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def run_once(self):
+        """Claim and deliver one batch. Needs an app context. Returns rows handled."""
+        from models import NotificationOutbox as O
+        token, rows = self._claim()
+        if not rows:
+            return 0
+
+        by_channel = {}
+        for row in rows:
+            by_channel.setdefault(row.channel, []).append(row)
+
+        now = datetime.utcnow()
+        updates = []
+        for channel, group in by_channel.items():
+            transport = self.transports.get(channel)
+            started = time.monotonic()
+            if transport is None:
+                errors = [f"no transport for channel {channel}"] * len(group)
+            else:
+                try:
+                    errors = transport.send_batch(group)
+                except Exception as e:
+                    errors = [f"{type(e).__name__}: {e}"] * len(group)
+            elapsed = time.monotonic() - started
+
+            delivered = retried = failed = 0
+            for row, error in zip(group, errors):
+                if error is None:
+                    delivered += 1
+                    updates.append({'_id': row.id, '_status': 'sent', '_sent_at': now,
+                                    '_next': row.next_attempt_at, '_error': None})
+                elif row.attempts >= self.max_attempts or transport is None:
+                    failed += 1
+                    updates.append({'_id': row.id, '_status': 'failed', '_sent_at': None,
+                                    '_next': row.next_attempt_at, '_error': error[:1000]})
+                else:
+                    retried += 1
+                    updates.append({'_id': row.id, '_status': 'pending', '_sent_at': None,
+                                    '_next': now + timedelta(seconds=self._backoff(row.attempts)),
+                                    '_error': error[:1000]})
+            with self._lock:
+                stats = self._stats.setdefault(channel, _ChannelStats())
+                stats.sent += delivered
+                stats.retried += retried
+                stats.failed += failed
+                stats.batches += 1
+                stats.send_seconds += elapsed
+                stats.recent.append((time.monotonic(), delivered))
+
+        t = O.__table__
+        db.session.execute(
+            t.update()
+            .where(t.c.id == bindparam('_id'), t.c.claim_token == token)
+            .values(status=bindparam('_status'), sent_at=bindparam('_sent_at'),
+                    next_attempt_at=bindparam('_next'), last_error=bindparam('_error'),
+                    claim_token=None),
+            updates,
+        )
+        db.session.commit()
+        return len(rows)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            channels = {name: s.snapshot(now) for name, s in self._stats.items()}
+        return {
+            "running": self._thread is not None and self._pid == os.getpid(),
+            "batch_size": self.batch_size,
+            "max_attempts": self.max_attempts,
+            "channels": channels,
+        }
+
+
+dispatcher = NotificationDispatcher()
+
+
+def outbox_counts():
+    """Rows per status across all processes."""
+    from models import NotificationOutbox as O
+    return dict(db.session.query(O.status, db.func.count(O.id)).group_by(O.status).all())
+
+
+# ===================== Statements =====================
+# also EXPLAINed by query_plans
+
+def claimed_stmt(token):
+    from models import NotificationOutbox as O
+    return select(O).where(O.claim_token == token).order_by(O.id)
+
+
+def dedupe_stmt(dedupe_key):
+    from models import NotificationOutbox as O
+    return select(O.id).where(O.dedupe_key == dedupe_key).limit(1)
+
+
+# ===================== Enqueueing =====================
+
+def enqueue(kind, channel, recipient, subject, body, dedupe_key):
+    """
+    Add a notification to the current session; the caller commits it with
+    its own change and then calls dispatcher.wake(). Returns the new row, or
+    None when there is no recipient or the dedupe_key was already queued.
+    """
+    from models import NotificationOutbox
+    if not recipient:
+        return None
+    if db.session.execute(dedupe_stmt(dedupe_key)).first():
+        return None
+    row = NotificationOutbox(
+        kind=kind, channel=channel, recipient=recipient, subject=subject, body=body,
+        dedupe_key=dedupe_key, status='pending', attempts=0, next_attempt_at=datetime.utcnow(),
+    )
+    db.session.add(row)
+    return row
+
+
+def _field(obj, name):
+    return getattr(obj, name, None) if not isinstance(obj, dict) else obj.get(name)
+
+
+def _when(appointment):
+    value = (_field(appointment, 'date_time') if isinstance(appointment, dict)
+             else appointment.scheduled_at)
+    return value.strftime("%Y-%m-%d %H:%M") if isinstance(value, datetime) else str(value)
+
+
 def send_booking_confirmation(patient, appointment):
-    # patient: Patient object or dict, appointment: dict
-    print(f"[NOTIFICATION] Booking confirmation to {patient.email if hasattr(patient,'email') else patient.get('email')}: {appointment}")
-    return True
+    # patient: Patient object or dict, appointment: Appointment object or dict
+    appointment_id = _field(appointment, 'appointment_id')
+    return enqueue(
+        'booking_confirmation', EMAIL, _field(patient, 'email'),
+        "Appointment confirmed",
+        f"Your appointment {appointment_id} is booked for {_when(appointment)}.",
+        f"booking_confirmation:{appointment_id}",
+    )
+
+
+def send_reminder(patient, appointment, label='reminder'):
+    # one reminder per appointment, offset label and time: a moved appointment is reminded again
+    appointment_id = _field(appointment, 'appointment_id')
+    return enqueue(
+        'reminder', EMAIL, _field(patient, 'email'),
+        "Appointment reminder",
+        f"Reminder: your appointment {appointment_id} is at {_when(appointment)}.",
+        f"reminder:{label}:{appointment_id}:{_when(appointment)}",
+    )
 
-def send_reminder(patient, appointment):
-    print(f"[NOTIFICATION] Reminder to {patient.email if hasattr(patient,'email') else patient.get('email')}: {appointment}")
-    return True
 
-def send_emergency_alert(patient):
-    print(f"[NOTIFICATION] Emergency alert for {patient.name}")
-    return True
+def send_emergency_alert(patient, report_id=None):
+    key = report_id or uuid.uuid4().hex
+    body = f"Emergency alert for {_field(patient, 'name')}"
+    rows = [enqueue('emergency_alert', EMAIL, _field(patient, 'email'),
+                    "Emergency alert", body, f"emergency_alert:email:{key}"),
+            enqueue('emergency_alert', SMS, _field(patient, 'phone'),
+                    "Emergency alert", body, f"emergency_alert:sms:{key}")]
+    return [row for row in rows if row is not None]
@@ -0,0 +1,135 @@
+# Password hashing/verification off the request thread.
+#
+# pbkdf2 is deliberately CPU-bound; running it inline on a gunicorn worker
+# starves every other request during a login surge. Jobs are handed to a small
+# process pool instead, with a bounded number of in-flight jobs per worker so a
+# surge is shed with 503s rather than queueing without limit.
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from passlib.hash import pbkdf2_sha256
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing pool cannot admit another job in time."""
+
+
+_settings = {
+    "rounds": 29000,            # pbkdf2 rounds for new hashes (passlib default)
+    "workers": 2,               # 0 = hash inline on the calling thread
+    "max_pending": 32,          # jobs admitted per process before shedding
+    "admission_timeout": 2.0,   # seconds to wait for a free admission slot
+    "job_timeout": 10.0,        # seconds to wait for a single hash/verify
+}
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = threading.BoundedSemaphore(_settings["max_pending"])
+
+
+def configure(rounds=None, workers=None, max_pending=None,
+              admission_timeout=None, job_timeout=None):
+    """Apply the hashing policy; called from create_app."""
+    global _slots
+    with _lock:
+        if rounds is not None:
+            _settings["rounds"] = int(rounds)
+        if workers is not None:
+            _settings["workers"] = int(workers)
+        if max_pending is not None:
+            _settings["max_pending"] = int(max_pending)
+            _slots = threading.BoundedSemaphore(_settings["max_pending"])
+        if admission_timeout is not None:
+            _settings["admission_timeout"] = float(admission_timeout)
+        if job_timeout is not None:
+            _settings["job_timeout"] = float(job_timeout)
+    _shutdown_pool()
+
+
+def shutdown():
+    _shutdown_pool()
+
+
+def _shutdown_pool():
+    global _pool, _pool_pid
+    with _lock:
+        pool, _pool, _pool_pid = _pool, None, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _get_pool():
+    # Created lazily and per process: a pool inherited across a gunicorn fork
+    # points at the parent's workers and must not be reused.
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=_settings["workers"])
+            _pool_pid = os.getpid()
+        return _pool
+
+
+# -------- pool jobs (module level so they pickle) --------
+
+def _hash_job(password, rounds):
+    return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+
+def _verify_job(password, password_hash):
+    try:
+        return pbkdf2_sha256.verify(password, password_hash)
+    except (ValueError, TypeError):
+        return False
+
+
+def _run(fn, *args):
+    if _settings["workers"] <= 0:
+        return fn(*args)
+    slots = _slots
+    if not slots.acquire(timeout=_settings["admission_timeout"]):
+        raise PasswordPoolBusy("Password hashing pool is saturated")
+    try:
+        return _get_pool().submit(fn, *args).result(timeout=_settings["job_timeout"])
+    except FutureTimeout:
+        raise PasswordPoolBusy("Password hashing job timed out")
+    finally:
+        slots.release()
+
+
+# -------- public API --------
+
+def busy_response():
+    """The 503 every endpoint returns when PasswordPoolBusy is raised."""
+    from flask import jsonify
+    resp = jsonify({"error": "Server busy, please retry"})
+    resp.headers['Retry-After'] = '1'
+    return resp, 503
+
+
+def hash_password(password):
+    """Hash with the current rounds policy."""
+    return _run(_hash_job, password, _settings["rounds"])
+
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made under a different rounds policy."""
+    try:
+        return pbkdf2_sha256.from_string(password_hash).rounds != _settings["rounds"]
+    except (ValueError, TypeError):
+        return False
+
+
+def verify_and_update(password, password_hash):
+    """
+    Verify a password and, when it matches but was hashed under an older
+    policy, return a replacement hash. Returns (ok, new_hash_or_None).
+    """
+    if not password_hash:
+        return False, None
+    if not _run(_verify_job, password, password_hash):
+        return False, None
+    if needs_rehash(password_hash):
+        return True, hash_password(password)
+    return True, None
@@ -0,0 +1,148 @@
+# Stale-while-revalidate cache for wait-time predictions.
+#
+# GET /api/hospital/predict_wait_time is the most-polled public endpoint, and
+# each prediction costs an appointment count plus the queue statistics lookup.
+# Entries are keyed by (hospital, department):
+#   * younger than `ttl` and not invalidated -> served as is (HIT)
+#   * older, or invalidated by a write        -> served immediately while one
+#     background refresh recomputes it (STALE)
+#   * missing, or older than `max_stale`      -> computed inline (MISS)
+# so callers only ever wait on the database for a cold key.
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+HIT, STALE, MISS = 'HIT', 'STALE', 'MISS'
+
+
+class _Entry:
+    __slots__ = ('value', 'computed_at', 'invalidated', 'refreshing')
+
+    def __init__(self, value, computed_at):
+        self.value = value
+        self.computed_at = computed_at
+        self.invalidated = False
+        self.refreshing = False
+
+
+class PredictionCache:
+    def __init__(self, ttl=15.0, max_stale=300.0, maxsize=5000, refresh_workers=2):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.refresh_workers = refresh_workers
+        self._executor = None
+        self._pid = None
+
+    def configure(self, ttl=None, max_stale=None, maxsize=None):
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if max_stale is not None:
+                self.max_stale = max_stale
+            if maxsize is not None:
+                self.maxsize = maxsize
+            self._entries.clear()
+
+    @staticmethod
+    def key(hospital_id, department):
+        return str(hospital_id), (department or 'general').lower()
+
+    def get(self, key, compute, app):
+        """
+        Return (value, age_seconds, state). `compute()` is called with an app
+        context, inline on a miss or on a background thread when stale.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._pid != os.getpid():
+                self._after_fork()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                age = now - entry.computed_at
+                if age < self.ttl and not entry.invalidated:
+                    return entry.value, age, HIT
+                if age < self.max_stale:
+                    if not entry.refreshing:
+                        entry.refreshing = True
+                        self._executor.submit(self._refresh, key, compute, app)
+                    return entry.value, age, STALE
+
+        # cold key: compute inline, one caller per key at a time
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and not entry.invalidated \
+                        and time.monotonic() - entry.computed_at < self.ttl:
+                    return entry.value, time.monotonic() - entry.computed_at, HIT
+            value = compute()
+            self._store(key, value)
+            return value, 0.0, MISS
+
+    def invalidate(self, hospital_id):
+        """Mark every department of a hospital stale; values stay servable."""
+        hospital_key = str(hospital_id)
+        with self._lock:
+            for (h, _), entry in self._entries.items():
+                if h == hospital_key:
+                    entry.invalidated = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _after_fork(self):
+        # called with self._lock held, on first use in each process. Pool
+        # threads do not survive a fork, so every worker creates its own, and
+        # refreshes that were in flight in the parent never finish here.
+        if self._pid is not None:
+            for entry in self._entries.values():
+                entry.refreshing = False
+            self._key_locks.clear()
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers,
+                                            thread_name_prefix='prediction-refresh')
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = _Entry(value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self._key_locks.pop(evicted, None)
+
+    def _refresh(self, key, compute, app):
+        try:
+            with app.app_context():
+                value = compute()
+            self._store(key, value)
+        except Exception:
+            log.exception("prediction refresh failed", extra={"key": str(key)})
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+
+
+prediction_cache = PredictionCache()
+
+
+def invalidate_predictions(hospital_id):
+    if hospital_id is not None:
+        prediction_cache.invalidate(hospital_id)
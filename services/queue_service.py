@@ -1,104 +1,69 @@
-from models import Appointment, QueueReport
-from database import db
+import logging
 
-from datetime import datetime, timedelta
+from sqlalchemy import func, select
 
-from models import Appointment, QueueReport
+from models import Appointment
 from database import db
-from datetime import datetime, timedelta
-import statistics
+from datetime import datetime, timedelta, timezone
+
+from services.queue_stats import engine as queue_stats
+from services.id_generator import new_id
+
+log = logging.getLogger(__name__)
+
+# Averages and trends come from the in-memory rolling aggregator in
+# services/queue_stats.py rather than from QueueReport scans.
 
 def update_historical_data(wait_data):
     try:
         hospital_id = wait_data.get("hospital_id")
         department = wait_data.get("department")
-        avg_wait = wait_data.get("average_wait_time", 0)
-        avg_queue = wait_data.get("average_queue_length", 0)
-        timestamp = datetime.utcnow()
-
-        since = timestamp - timedelta(hours=24)
-        recent_reports = QueueReport.query.filter(
-            QueueReport.hospital_id == hospital_id,
-            QueueReport.department == department,
-            QueueReport.timestamp >= since
-        ).all()
-
-        if not recent_reports:
+
+        summary = queue_stats.summary(hospital_id, department, hours=24)
+        if not summary or summary["average_wait_time"] is None:
             return False
 
-        avg_wait_time = statistics.mean([r.wait_time_reported for r in recent_reports if r.wait_time_reported is not None])
-        avg_queue_len = statistics.mean([r.queue_length for r in recent_reports if r.queue_length is not None])
+        avg_wait_time = summary["average_wait_time"]
+        avg_queue_len = summary["average_queue_length"] or 0
 
        
-        print(f"[Historical Update] Hospital {hospital_id}, Dept {department}: Avg Wait={avg_wait_time:.2f}, Avg Queue={avg_queue_len:.2f}")
+        log.debug("historical update: avg wait %.2f, avg queue %.2f", avg_wait_time, avg_queue_len,
+                  extra={"hospital_id": hospital_id, "department": department})
 
         return True
-    except Exception as e:
-        print(f"Error updating historical data: {e}")
+    except Exception:
+        log.exception("updating historical data failed")
         return False
 
 
 def get_wait_time_trends(hospital_id, department):
     """
     Determines the short-term trend of waiting times.
-    Returns: dict like {"trend": "increasing"/"decreasing"/"stable", "change": percent_change}
+    Returns: dict like {"trend": "increasing"/"decreasing"/"stable", "change": percent_change,
+    "slope_per_hour": minutes of wait gained per hour}
     """
     try:
-        now = datetime.utcnow()
-        since = now - timedelta(hours=6)  # analyze last 6 hours
-        reports = QueueReport.query.filter(
-            QueueReport.hospital_id == hospital_id,
-            QueueReport.department == department,
-            QueueReport.timestamp >= since
-        ).order_by(QueueReport.timestamp.asc()).all()
-
-        if len(reports) < 4:
-            return {"trend": "insufficient data"}
-
-        mid = len(reports) // 2
-        first_half = [r.wait_time_reported for r in reports[:mid] if r.wait_time_reported is not None]
-        second_half = [r.wait_time_reported for r in reports[mid:] if r.wait_time_reported is not None]
-
-        if not first_half or not second_half:
-            return {"trend": "insufficient data"}
-
-        avg_first = statistics.mean(first_half)
-        avg_second = statistics.mean(second_half)
-
-        if avg_first == 0:
-            return {"trend": "stable", "change": 0.0}
-
-        percent_change = ((avg_second - avg_first) / avg_first) * 100
-
-        if percent_change > 10:
-            trend = "increasing"
-        elif percent_change < -10:
-            trend = "decreasing"
-        else:
-            trend = "stable"
-
-        return {"trend": trend, "change": round(percent_change, 2)}
-
-    except Exception as e:
-        print(f"Error computing wait time trends: {e}")
-        return {"trend": "error"}
+        return queue_stats.trend(hospital_id, department, hours=6)  # analyze last 6 hours
+    except Exception:
+        log.exception("computing wait time trends failed")
+        return {"trend": "error"}
 
 def calculate_average_wait_time(hospital_id, department):
-   
-    now = datetime.utcnow()
-    since = now - timedelta(hours=24)
-    reports = QueueReport.query.filter(QueueReport.hospital_id == hospital_id, QueueReport.timestamp >= since).all()
-    if not reports:
+    # hospital-wide over the last 24h, across all departments
+    summary = queue_stats.summary(hospital_id, None, hours=24)
+    if not summary:
         return None
-    total = sum([r.wait_time_reported for r in reports if r.wait_time_reported is not None])
-    return total / max(1, len(reports))
+    return summary["average_wait_time"]
+
+def scheduled_count_stmt(hospital_id):
+    """Appointments still waiting at a hospital (also EXPLAINed by query_plans)."""
+    return select(func.count(Appointment.id)).where(
+        Appointment.hospital_id == hospital_id, Appointment.status == 'Scheduled',
+    )
 
 def predict_wait_time(hospital_id, department):
    
-    from datetime import datetime, timedelta
-    now = datetime.utcnow()
-    
-    upcoming = Appointment.query.filter_by(hospital_id=hospital_id, status='Scheduled').count()
+    upcoming = db.session.execute(scheduled_count_stmt(hospital_id)).scalar()
     avg_recent = calculate_average_wait_time(hospital_id, department)
     
     base = 20  
@@ -109,3 +74,102 @@ def predict_wait_time(hospital_id, department):
     if est < 5:
         est = 5
     return int(est)
+
+# ===================== Report validation =====================
+
+QUEUE_REPORT_FIELDS = ('hospital_id', 'department', 'queue_length', 'wait_time_reported')
+
+def validate_queue_report(data, defaults=None, submitted_by=None):
+    """
+    Validate one queue report payload and normalize it to QueueReport column
+    values. `wait_time` is accepted as an alias of `wait_time_reported`;
+    `defaults` fills fields the caller treats as optional; an authenticated
+    caller passes `submitted_by` so the payload cannot override it. An
+    optional ISO `timestamp` lets devices report readings taken earlier.
+    Returns (row, None) or (None, error_message).
+    """
+    if not isinstance(data, dict):
+        return None, "Report must be a JSON object"
+    values = dict(defaults or {})
+    for key in QUEUE_REPORT_FIELDS:
+        if data.get(key) is not None:
+            values[key] = data[key]
+    if data.get('wait_time_reported') is None and data.get('wait_time') is not None:
+        values['wait_time_reported'] = data['wait_time']
+
+    missing = [k for k in QUEUE_REPORT_FIELDS if values.get(k) is None]
+    if missing:
+        return None, "Missing fields: " + ", ".join(missing)
+
+    row = {}
+    for key in ('hospital_id', 'queue_length', 'wait_time_reported'):
+        try:
+            row[key] = int(values[key])
+        except (TypeError, ValueError):
+            return None, f"{key} must be an integer"
+    if row['queue_length'] < 0 or row['wait_time_reported'] < 0:
+        return None, "queue_length and wait_time_reported must not be negative"
+
+    department = values['department']
+    if not isinstance(department, str) or not department.strip():
+        return None, "department must be a non-empty string"
+    row['department'] = department.strip()
+
+    row['submitted_by'] = submitted_by or data.get('submitted_by')
+    row['timestamp'] = datetime.utcnow()
+    if data.get('timestamp'):
+        try:
+            ts = datetime.fromisoformat(str(data['timestamp']).replace('Z', '+00:00'))
+        except ValueError:
+            return None, "timestamp must be an ISO 8601 datetime"
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+        if ts > row['timestamp'] + timedelta(minutes=5):
+            return None, "timestamp is in the future"
+        row['timestamp'] = ts
+    row['is_validated'] = False
+    return row, None
+
+
+def ingest_queue_reports(items, submitted_by=None, defaults=None):
+    """
+    Validate a batch of report payloads in one pass and insert the valid ones
+    with a single executemany. Returns per-item results in input order:
+    {"index", "status": "created", "report_id"} or {"index", "status": "rejected", "error"}.
+    """
+    from models import QueueReport
+    from services import analytics_service
+    from services.prediction_cache import invalidate_predictions
+    from services import live_updates
+
+    results = []
+    rows = []
+    for index, item in enumerate(items):
+        row, error = validate_queue_report(item, defaults=defaults, submitted_by=submitted_by)
+        if error:
+            results.append({"index": index, "status": "rejected", "error": error})
+            continue
+        row['report_id'] = new_id("QR-")
+        rows.append(row)
+        results.append({"index": index, "status": "created", "report_id": row['report_id']})
+
+    if not rows:
+        return results
+
+    db.session.execute(QueueReport.__table__.insert(), rows)
+
+    per_hospital = {}
+    for row in rows:
+        agg = per_hospital.setdefault(row['hospital_id'], [0, 0])
+        agg[0] += row['wait_time_reported']
+        agg[1] += 1
+    for hospital_id, (wait_sum, count) in per_hospital.items():
+        analytics_service.record_queue_report_totals(hospital_id, wait_sum, count)
+    db.session.commit()
+
+    # the new ids are not known here; let the aggregator pick the rows up by id
+    queue_stats.sync(force=True)
+    for hospital_id in per_hospital:
+        invalidate_predictions(hospital_id)
+        live_updates.publish_queue(hospital_id)
+    return results
@@ -0,0 +1,337 @@
+# In-memory rolling queue statistics.
+#
+# One ring buffer of per-minute buckets per (hospital, department), stored in
+# flat typed arrays: wait-time sum/count/min/max and queue-length sum/count.
+# Averages and trends over the last N hours are computed by walking at most
+# N*60 buckets, with no database query.
+#
+# The buffers are warmed from queue_report at startup and fed directly by the
+# report write paths. A background thread per worker catches up with rows
+# inserted by other worker processes (queue_report rows past an id high-water
+# mark) every sync_interval, and rebuilds every buffer from the table every
+# rebuild_interval, which also recovers rows committed out of id order. Reads
+# never query the database.
+import calendar
+import logging
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from database import db
+from models import QueueReport
+
+log = logging.getLogger(__name__)
+
+BUCKET_SECONDS = 60
+_EMPTY = -1
+
+
+def _minute(ts):
+    # timestamps are naive UTC throughout the app
+    return calendar.timegm(ts.utctimetuple()) // BUCKET_SECONDS
+
+
+def _now_minute():
+    return _minute(datetime.utcnow())
+
+
+def new_reports_stmt(watermark):
+    """Reports past the id high-water mark (also EXPLAINed by query_plans)."""
+    return (
+        select(QueueReport.id, QueueReport.hospital_id, QueueReport.department,
+               QueueReport.timestamp, QueueReport.wait_time_reported, QueueReport.queue_length)
+        .where(QueueReport.id > watermark)
+        .order_by(QueueReport.id)
+    )
+
+
+class DepartmentStats:
+    """Ring buffer of per-minute aggregates for one (hospital, department)."""
+
+    __slots__ = ('size', 'owner', 'wait_sum', 'wait_count', 'wait_min', 'wait_max',
+                 'queue_sum', 'queue_count')
+
+    def __init__(self, size):
+        self.size = size
+        self.owner = array('q', [_EMPTY]) * size        # absolute minute held by each slot
+        self.wait_sum = array('d', [0.0]) * size
+        self.wait_count = array('l', [0]) * size
+        self.wait_min = array('d', [0.0]) * size
+        self.wait_max = array('d', [0.0]) * size
+        self.queue_sum = array('d', [0.0]) * size
+        self.queue_count = array('l', [0]) * size
+
+    def add(self, minute, wait_time, queue_length):
+        slot = minute % self.size
+        owner = self.owner[slot]
+        if owner > minute:
+            return  # older than anything the window still covers
+        if owner != minute:
+            self.owner[slot] = minute
+            self.wait_sum[slot] = 0.0
+            self.wait_count[slot] = 0
+            self.queue_sum[slot] = 0.0
+            self.queue_count[slot] = 0
+        if wait_time is not None:
+            if self.wait_count[slot] == 0:
+                self.wait_min[slot] = self.wait_max[slot] = wait_time
+            else:
+                self.wait_min[slot] = min(self.wait_min[slot], wait_time)
+                self.wait_max[slot] = max(self.wait_max[slot], wait_time)
+            self.wait_sum[slot] += wait_time
+            self.wait_count[slot] += 1
+        if queue_length is not None:
+            self.queue_sum[slot] += queue_length
+            self.queue_count[slot] += 1
+
+    def buckets(self, first_minute, last_minute):
+        """Yield slot indexes whose minute lies in [first_minute, last_minute]."""
+        owner = self.owner
+        size = self.size
+        for minute in range(max(first_minute, last_minute - size + 1), last_minute + 1):
+            slot = minute % size
+            if owner[slot] == minute:
+                yield slot
+
+
+class QueueStatsEngine:
+    def __init__(self, window_hours=24, sync_interval=5.0, rebuild_interval=300.0):
+        self._lock = threading.RLock()
+        self._stats = {}            # (hospital_id, department) -> DepartmentStats
+        self._watermark = 0         # highest queue_report.id folded in
+        self._recorded_ids = set()  # ids fed locally that are above the watermark
+        self._last_sync = 0.0
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self.configure(window_hours, sync_interval, rebuild_interval)
+
+    def configure(self, window_hours=None, sync_interval=None, rebuild_interval=None, app=None):
+        with self._lock:
+            if window_hours is not None:
+                self.window_minutes = int(window_hours * 60)
+                self._stats.clear()
+                self._watermark = 0
+                self._recorded_ids.clear()
+                self._last_sync = 0.0
+            if sync_interval is not None:
+                self.sync_interval = float(sync_interval)
+            if rebuild_interval is not None:
+                self.rebuild_interval = float(rebuild_interval)
+            if app is not None:
+                self._app = app
+
+    # -------- feeding --------
+
+    @staticmethod
+    def _key(hospital_id, department):
+        try:
+            return int(hospital_id), (department or 'general')
+        except (TypeError, ValueError):
+            return None
+
+    def _add(self, hospital_id, department, timestamp, wait_time, queue_length, into=None):
+        key = self._key(hospital_id, department)
+        if key is None:
+            return
+        minute = _minute(timestamp or datetime.utcnow())
+        if minute <= _now_minute() - self.window_minutes:
+            return
+        buffers = self._stats if into is None else into
+        stats = buffers.get(key)
+        if stats is None:
+            stats = buffers[key] = DepartmentStats(self.window_minutes)
+        stats.add(minute, wait_time, queue_length)
+
+    def record(self, report):
+        """Fold in a just-committed QueueReport (or row with the same fields)."""
+        with self._lock:
+            if report.id is not None:
+                if report.id <= self._watermark or report.id in self._recorded_ids:
+                    return
+                self._recorded_ids.add(report.id)
+            self._add(report.hospital_id, report.department, report.timestamp,
+                      report.wait_time_reported, report.queue_length)
+
+    def warm(self):
+        """
+        Rebuild every buffer from the reports inside the window. The new
+        buffers are built aside and swapped in, so reads are not blocked
+        while the table is scanned.
+        """
+        since = datetime.utcnow() - timedelta(minutes=self.window_minutes)
+        max_id = db.session.query(db.func.max(QueueReport.id)).scalar() or 0
+        q = (
+            db.session.query(
+                QueueReport.id, QueueReport.hospital_id, QueueReport.department,
+                QueueReport.timestamp, QueueReport.wait_time_reported, QueueReport.queue_length,
+            )
+            .filter(QueueReport.timestamp >= since, QueueReport.id <= max_id)
+            .execution_options(yield_per=5000)
+        )
+        fresh = {}
+        for row in q:
+            self._add(row.hospital_id, row.department, row.timestamp,
+                      row.wait_time_reported, row.queue_length, into=fresh)
+        with self._lock:
+            # reports recorded during the scan with ids above max_id are
+            # dropped with the old buffers and read back by the next sync
+            self._stats = fresh
+            self._recorded_ids.clear()
+            self._watermark = max_id
+            self._last_sync = time.monotonic()
+
+    # -------- background refresh --------
+
+    def ensure_running(self):
+        if self._app is None or self.sync_interval <= 0:
+            return
+        # threads do not survive a fork; each worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._refresh_loop, name='queue-stats-refresh',
+                                            daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        last_rebuild = time.monotonic()
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                with self._app.app_context():
+                    if 0 < self.rebuild_interval <= time.monotonic() - last_rebuild:
+                        self.warm()
+                        last_rebuild = time.monotonic()
+                    else:
+                        self.sync(force=True)
+            except Exception:
+                log.exception("queue stats refresh failed")
+
+    def sync(self, force=False):
+        """
+        Catch up with reports inserted by other processes since the last sync.
+        Throttled to once per sync_interval unless forced. Returns the ids of
+        the hospitals that received new reports.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return set()
+        self._last_sync = now
+        rows = db.session.execute(new_reports_stmt(self._watermark)).all()
+        touched = set()
+        with self._lock:
+            # a concurrent sync may have folded in some of these rows (and
+            # moved the watermark past them) since the query above ran
+            for row in rows:
+                if row.id <= self._watermark or row.id in self._recorded_ids:
+                    continue
+                self._add(row.hospital_id, row.department, row.timestamp,
+                          row.wait_time_reported, row.queue_length)
+                touched.add(row.hospital_id)
+            if rows:
+                self._watermark = max(self._watermark, rows[-1].id)
+            self._recorded_ids = {i for i in self._recorded_ids if i > self._watermark}
+        return touched
+
+    # -------- reads --------
+
+    def _matching(self, hospital_id, department):
+        """Buffers for one department, or every department of the hospital."""
+        try:
+            hospital_id = int(hospital_id)
+        except (TypeError, ValueError):
+            return []
+        if department is not None:
+            stats = self._stats.get((hospital_id, department))
+            return [stats] if stats else []
+        return [s for (h, _), s in self._stats.items() if h == hospital_id]
+
+    def summary(self, hospital_id, department=None, hours=24):
+        """
+        Aggregate over the last `hours`. department=None covers the whole
+        hospital. Returns None when there is no data in the window.
+        """
+        last = _now_minute()
+        first = last - min(int(hours * 60), self.window_minutes) + 1
+        wait_sum = queue_sum = 0.0
+        wait_count = queue_count = 0
+        wait_min = wait_max = None
+        with self._lock:
+            for stats in self._matching(hospital_id, department):
+                for slot in stats.buckets(first, last):
+                    if stats.wait_count[slot]:
+                        wait_sum += stats.wait_sum[slot]
+                        wait_count += stats.wait_count[slot]
+                        lo, hi = stats.wait_min[slot], stats.wait_max[slot]
+                        wait_min = lo if wait_min is None else min(wait_min, lo)
+                        wait_max = hi if wait_max is None else max(wait_max, hi)
+                    queue_sum += stats.queue_sum[slot]
+                    queue_count += stats.queue_count[slot]
+        if not wait_count and not queue_count:
+            return None
+        return {
+            "average_wait_time": wait_sum / wait_count if wait_count else None,
+            "average_queue_length": queue_sum / queue_count if queue_count else None,
+            "min_wait_time": wait_min,
+            "max_wait_time": wait_max,
+            "report_count": max(wait_count, queue_count),
+        }
+
+    def trend(self, hospital_id, department=None, hours=6):
+        """
+        Compare mean wait in the older and newer half of the window and fit a
+        least-squares slope over the per-minute means.
+        Returns {"trend", "change", "slope_per_hour"} or {"trend": "insufficient data"}.
+        """
+        last = _now_minute()
+        span = min(int(hours * 60), self.window_minutes)
+        first = last - span + 1
+        mid = first + span // 2
+        points = {}  # minute -> [sum, count]
+        with self._lock:
+            for stats in self._matching(hospital_id, department):
+                for slot in stats.buckets(first, last):
+                    if stats.wait_count[slot]:
+                        p = points.setdefault(stats.owner[slot], [0.0, 0])
+                        p[0] += stats.wait_sum[slot]
+                        p[1] += stats.wait_count[slot]
+
+        total = sum(c for _, c in points.values())
+        first_half = [(s, c) for m, (s, c) in points.items() if m < mid]
+        second_half = [(s, c) for m, (s, c) in points.items() if m >= mid]
+        if total < 4 or not first_half or not second_half:
+            return {"trend": "insufficient data"}
+
+        avg_first = sum(s for s, _ in first_half) / sum(c for _, c in first_half)
+        avg_second = sum(s for s, _ in second_half) / sum(c for _, c in second_half)
+
+        xs = [m - first for m in points]
+        ys = [s / c for s, c in points.values()]
+        x_mean = sum(xs) / len(xs)
+        y_mean = sum(ys) / len(ys)
+        denom = sum((x - x_mean) ** 2 for x in xs)
+        slope = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / denom if denom else 0.0
+
+        if avg_first == 0:
+            return {"trend": "stable", "change": 0.0, "slope_per_hour": round(slope * 60, 2)}
+
+        percent_change = ((avg_second - avg_first) / avg_first) * 100
+        if percent_change > 10:
+            trend = "increasing"
+        elif percent_change < -10:
+            trend = "decreasing"
+        else:
+            trend = "stable"
+        return {"trend": trend, "change": round(percent_change, 2),
+                "slope_per_hour": round(slope * 60, 2)}
+
+
+engine = QueueStatsEngine()
@@ -1,6 +1,9 @@
 from database import db
 
 from models import Patient
+from services import analytics_service
+from services.id_generator import new_id
+
 def register_patient(data):
     # basic validation
     required = ['name', 'email']
@@ -10,7 +13,7 @@ def register_patient(data):
     if existing:
         return False, "Email already registered"
     p = Patient(
-        patient_id = data.get('patient_id') or f"P-{int(__import__('time').time())}",
+        patient_id = data.get('patient_id') or new_id("P-"),
         name = data.get('name'),
         email = data.get('email'),
         phone = data.get('phone'),
@@ -20,5 +23,6 @@ def register_patient(data):
         is_registered = True
     )
     db.session.add(p)
+    analytics_service.bump_counter('users')
     db.session.commit()
     return True, p.patient_id
@@ -0,0 +1,315 @@
+# Appointment reminders on a hierarchical timing wheel.
+#
+# Each reminder is a timer at scheduled_at - offset (24h and 1h by default).
+# Timers live in a hierarchical wheel: four levels of 64 buckets, the lowest
+# one `tick` seconds per bucket, each level 64x coarser than the one below.
+# Adding or cancelling a timer is O(1); advancing the clock only touches the
+# bucket that expires, plus an occasional cascade of a coarser bucket into
+# the finer levels.
+#
+# Only the near future is held in memory. The scheduler loads appointments in
+# time-ordered windows (`window` seconds of fire times at a time, through the
+# scheduled_at index) shortly before they are due. Booking, cancellation and
+# status changes call update() after committing so the wheel stays current.
+# Changes made by other processes are caught when a timer fires: the
+# appointment is re-read and nothing is sent unless it is still Scheduled for
+# the same time.
+#
+# Reminders go through the notification outbox with a dedupe key per
+# appointment, offset and time. So a restart (which reloads from `grace`
+# seconds back) or several worker processes loading the same window never
+# send a reminder twice.
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+
+log = logging.getLogger(__name__)
+
+WHEEL_BITS = 6
+WHEEL_LEVELS = 4
+_EPOCH = datetime(1970, 1, 1)
+
+
+def window_stmt(start, end):
+    """Scheduled appointments starting in [start, end) (also EXPLAINed by query_plans)."""
+    from models import Appointment
+    return (
+        select(Appointment.id, Appointment.scheduled_at)
+        .where(Appointment.status == 'Scheduled',
+               Appointment.scheduled_at >= start,
+               Appointment.scheduled_at < end)
+        .order_by(Appointment.scheduled_at)
+    )
+
+
+class Timer:
+    __slots__ = ('tick', 'appointment_pk', 'label', 'scheduled_at', 'cancelled')
+
+    def __init__(self, tick, appointment_pk, label, scheduled_at):
+        self.tick = tick
+        self.appointment_pk = appointment_pk
+        self.label = label
+        self.scheduled_at = scheduled_at
+        self.cancelled = False
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel over integer ticks. Not thread-safe; the
+    scheduler serialises access.
+    """
+
+    def __init__(self, current_tick, bits=WHEEL_BITS, levels=WHEEL_LEVELS):
+        self.bits = bits
+        self.size = 1 << bits
+        self.mask = self.size - 1
+        self.levels = [[[] for _ in range(self.size)] for _ in range(levels)]
+        self.horizon = 1 << (bits * levels)
+        self.current = current_tick
+        self.due = []           # timers added at or before the current tick
+        self.count = 0
+
+    def add(self, timer):
+        delta = timer.tick - self.current
+        if delta <= 0:
+            self.due.append(timer)
+        elif delta >= self.horizon:
+            raise ValueError("timer is beyond the wheel's horizon")
+        else:
+            level = 0
+            while delta >= 1 << (self.bits * (level + 1)):
+                level += 1
+            index = (timer.tick >> (self.bits * level)) & self.mask
+            self.levels[level][index].append(timer)
+        self.count += 1
+
+    def advance(self, to_tick):
+        """Move the clock to `to_tick`; returns the timers that expired."""
+        expired, self.due = self.due, []
+        while self.current < to_tick:
+            if not self.count - len(expired):
+                self.current = to_tick   # nothing pending: jump
+                break
+            self.current += 1
+            t = self.current
+            for level in range(len(self.levels) - 1, 0, -1):
+                if t & ((1 << (self.bits * level)) - 1) == 0:
+                    bucket = self.levels[level][(t >> (self.bits * level)) & self.mask]
+                    timers, bucket[:] = list(bucket), []
+                    self.count -= len(timers)
+                    for timer in timers:
+                        self.add(timer)
+            bucket = self.levels[0][t & self.mask]
+            expired.extend(bucket)
+            bucket.clear()
+            expired.extend(self.due)
+            self.due = []
+        self.count -= len(expired)
+        return expired
+
+
+def parse_offsets(value):
+    """"24h,1h,30m" -> [("24h", 86400), ("1h", 3600), ("30m", 1800)]."""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    offsets = []
+    for part in (value or '').split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        if part[-1] in units:
+            seconds = float(part[:-1]) * units[part[-1]]
+        else:
+            seconds = float(part)
+        offsets.append((part, seconds))
+    return sorted(offsets, key=lambda o: -o[1])
+
+
+class ReminderScheduler:
+    def __init__(self, offsets='24h,1h', tick=1.0, window=3600.0, grace=900.0):
+        self._lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._wheel = None
+        self._timers = {}          # appointment pk -> [Timer]
+        self._loaded_until = None  # fire times before this are in the wheel
+        self._loading_until = None  # end of the window being loaded right now
+        self._stats = {"loaded": 0, "fired": 0, "sent": 0, "skipped": 0, "windows": 0}
+        self.configure(offsets, tick, window, grace)
+
+    def configure(self, offsets=None, tick=None, window=None, grace=None, app=None):
+        if offsets is not None:
+            self.offsets = parse_offsets(offsets) if isinstance(offsets, str) else list(offsets)
+        if tick is not None:
+            self.tick = float(tick)
+        if window is not None:
+            self.window = float(window)
+        if grace is not None:
+            self.grace = float(grace)
+        if app is not None:
+            self._app = app
+
+    def _to_tick(self, when):
+        # naive UTC, like every datetime in the app
+        return int((when - _EPOCH).total_seconds() // self.tick)
+
+    # -------- background thread --------
+
+    def ensure_running(self):
+        if self._app is None or not self.offsets:
+            return
+        # threads do not survive a fork; each worker starts its own wheel
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wheel = TimingWheel(self._to_tick(datetime.utcnow()))
+            self._timers = {}
+            self._loaded_until = self._loading_until = None
+            self._thread = threading.Thread(target=self._loop, name='reminder-scheduler', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    self.run_once()
+            except Exception:
+                log.exception("reminder scheduler round failed")
+            time.sleep(self.tick)
+
+    def run_once(self, now=None):
+        """Load the next window if due and fire expired timers. Needs an app context."""
+        now = now or datetime.utcnow()
+        if self._loaded_until is None:
+            self._load(now - timedelta(seconds=self.grace), now + timedelta(seconds=self.window))
+        elif self._loaded_until < now + timedelta(seconds=self.window):
+            self._load(self._loaded_until, self._loaded_until + timedelta(seconds=self.window))
+        with self._lock:
+            expired = self._wheel.advance(self._to_tick(now))
+        live = [t for t in expired if not t.cancelled]
+        with self._lock:
+            for t in live:
+                timers = self._timers.get(t.appointment_pk)
+                if timers and t in timers:
+                    timers.remove(t)
+                    if not timers:
+                        del self._timers[t.appointment_pk]
+        if live:
+            self._fire(live, now)
+        return len(live)
+
+    # -------- loading --------
+
+    def _load(self, start, end):
+        """Queue every reminder whose fire time falls in [start, end)."""
+        with self._lock:
+            self._loading_until = end
+        timers = []
+        for label, seconds in self.offsets:
+            offset = timedelta(seconds=seconds)
+            rows = db.session.execute(window_stmt(start + offset, end + offset)).all()
+            timers.extend(Timer(self._to_tick(at - offset), pk, label, at) for pk, at in rows)
+        with self._lock:
+            for timer in timers:
+                self._add(timer)
+            self._loaded_until = end
+            self._stats["loaded"] += len(timers)
+            self._stats["windows"] += 1
+
+    def _add(self, timer):
+        self._wheel.add(timer)
+        self._timers.setdefault(timer.appointment_pk, []).append(timer)
+
+    # -------- incremental updates --------
+
+    def update(self, appointment):
+        """
+        Bring the appointment's reminders in line after a committed booking,
+        cancellation or status change.
+        """
+        self.ensure_running()
+        if self._wheel is None or self._loading_until is None:
+            return      # the first window load will see it
+        now = datetime.utcnow()
+        with self._lock:
+            # a window still being loaded may have read the table before this
+            # commit; a reminder queued twice is dropped by the outbox dedupe
+            loaded_until = max(self._loaded_until or self._loading_until, self._loading_until)
+            for timer in self._timers.pop(appointment.id, ()):
+                timer.cancelled = True
+            if appointment.status != 'Scheduled' or appointment.scheduled_at is None:
+                return
+            for label, seconds in self.offsets:
+                fire_at = appointment.scheduled_at - timedelta(seconds=seconds)
+                # later fire times are picked up when their window is loaded
+                if now - timedelta(seconds=self.grace) <= fire_at < loaded_until:
+                    self._add(Timer(self._to_tick(fire_at), appointment.id, label,
+                                    appointment.scheduled_at))
+
+    # -------- firing --------
+
+    def _fire(self, timers, now):
+        from models import Appointment, Patient
+        from services.notification_service import dispatcher as notifications, send_reminder
+
+        pks = {t.appointment_pk for t in timers}
+        current = {
+            appt.id: (appt, patient)
+            for appt, patient in db.session.query(Appointment, Patient)
+            .join(Patient, Patient.id == Appointment.patient_id)
+            .filter(Appointment.id.in_(pks))
+        }
+        queued = []
+        for t in timers:
+            appt, patient = current.get(t.appointment_pk, (None, None))
+            # cancelled, moved or deleted by another process since it was loaded
+            if appt is None or appt.status != 'Scheduled' or appt.scheduled_at != t.scheduled_at \
+                    or appt.scheduled_at <= now:
+                continue
+            queued.append((patient, appt, t.label))
+
+        sent = 0
+        try:
+            sent = sum(1 for p, a, label in queued if send_reminder(p, a, label))
+            db.session.commit()
+        except IntegrityError:
+            # another process queued some of the same reminders; add them one by one
+            db.session.rollback()
+            sent = 0
+            for p, a, label in queued:
+                try:
+                    if send_reminder(p, a, label):
+                        db.session.commit()
+                        sent += 1
+                except IntegrityError:
+                    db.session.rollback()
+        with self._lock:
+            self._stats["fired"] += len(timers)
+            self._stats["sent"] += sent
+            self._stats["skipped"] += len(timers) - sent
+        if sent:
+            notifications.wake()
+
+    def stats(self):
+        with self._lock:
+            running = self._thread is not None and self._pid == os.getpid()
+            return dict(
+                self._stats,
+                running=running,
+                offsets=[label for label, _ in self.offsets],
+                pending=self._wheel.count if running else 0,
+                loaded_until=self._loaded_until.isoformat() if running and self._loaded_until else None,
+            )
+
+
+scheduler = ReminderScheduler()
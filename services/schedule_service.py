@@ -0,0 +1,227 @@
+# Recurring weekly schedule templates.
+#
+# A doctor describes a week once (working days, hours, slot length, breaks)
+# plus a date range; the template is expanded into concrete slots in memory,
+# compared against the doctor's existing slots in that range with a single
+# query, and the new ones are written with one bulk INSERT. With dry_run the
+# comparison is returned without writing anything.
+#
+# Times are wall-clock times in the same naive UTC convention as the rest of
+# the app.
+from datetime import datetime, timedelta
+
+from database import db
+from models import TimeSlot
+from services.id_generator import new_id
+
+MAX_TEMPLATE_DAYS = 366
+MAX_TEMPLATE_SLOTS = 10000
+
+_WEEKDAYS = {
+    'mon': 0, 'monday': 0, 'tue': 1, 'tues': 1, 'tuesday': 1, 'wed': 2, 'wednesday': 2,
+    'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3, 'fri': 4, 'friday': 4,
+    'sat': 5, 'saturday': 5, 'sun': 6, 'sunday': 6,
+}
+
+
+def _parse_weekday(value):
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 6:
+        return value
+    return _WEEKDAYS.get(str(value).strip().lower())
+
+
+def _parse_clock(value):
+    t = datetime.strptime(str(value).strip(), "%H:%M")
+    return t.hour * 60 + t.minute
+
+
+def _parse_ranges(items, name):
+    """[{"start": "09:00", "end": "12:00"}, ...] -> sorted [(start_min, end_min)]."""
+    ranges = []
+    for item in items or []:
+        if not isinstance(item, dict) or 'start' not in item or 'end' not in item:
+            raise ValueError(f"{name} entries need 'start' and 'end'")
+        start, end = _parse_clock(item['start']), _parse_clock(item['end'])
+        if end <= start:
+            raise ValueError(f"{name} entry {item['start']}-{item['end']} ends before it starts")
+        ranges.append((start, end))
+    return sorted(ranges)
+
+
+def parse_template(data):
+    """
+    Validate a template payload. Returns (template, None) or (None, error).
+
+        {"days": ["mon", "wed", "fri"],          # names or 0=Monday .. 6=Sunday
+         "hours": [{"start": "09:00", "end": "17:00"}],
+                                                 # or "start_time"/"end_time"
+         "slot_minutes": 15,
+         "breaks": [{"start": "12:00", "end": "13:00"}],
+         "start_date": "2025-11-01", "end_date": "2025-11-30",   # inclusive
+         "slot_type": "consultation"}
+    """
+    if not isinstance(data, dict):
+        return None, "Template must be a JSON object"
+    try:
+        days = data.get('days')
+        if not days or not isinstance(days, list):
+            return None, "days must be a non-empty list"
+        weekdays = set()
+        for d in days:
+            wd = _parse_weekday(d)
+            if wd is None:
+                return None, f"Unknown day: {d}"
+            weekdays.add(wd)
+
+        if data.get('hours'):
+            hours = _parse_ranges(data['hours'], 'hours')
+        elif data.get('start_time') and data.get('end_time'):
+            hours = _parse_ranges([{'start': data['start_time'], 'end': data['end_time']}], 'hours')
+        else:
+            return None, "hours (or start_time and end_time) are required"
+        if any(a[1] > b[0] for a, b in zip(hours, hours[1:])):
+            return None, "hours blocks must not overlap"
+        breaks = _parse_ranges(data.get('breaks'), 'breaks')
+
+        try:
+            slot_minutes = int(data.get('slot_minutes', 15))
+        except (TypeError, ValueError):
+            return None, "slot_minutes must be an integer"
+        if not 5 <= slot_minutes <= 480:
+            return None, "slot_minutes must be between 5 and 480"
+
+        if not data.get('start_date') or not data.get('end_date'):
+            return None, "start_date and end_date are required"
+        start_date = datetime.strptime(data['start_date'], "%Y-%m-%d").date()
+        end_date = datetime.strptime(data['end_date'], "%Y-%m-%d").date()
+    except ValueError as e:
+        return None, f"Invalid template: {e}"
+
+    if end_date < start_date:
+        return None, "end_date must not be before start_date"
+    if (end_date - start_date).days + 1 > MAX_TEMPLATE_DAYS:
+        return None, f"A template can cover at most {MAX_TEMPLATE_DAYS} days"
+
+    return {
+        'weekdays': weekdays,
+        'hours': hours,
+        'breaks': breaks,
+        'slot_minutes': slot_minutes,
+        'start_date': start_date,
+        'end_date': end_date,
+        'slot_type': str(data.get('slot_type') or 'consultation'),
+    }, None
+
+
+def expand_template(template, now=None):
+    """Concrete (start, end) datetimes for every slot of the template, in order."""
+    now = now or datetime.utcnow()
+    step = template['slot_minutes']
+    breaks = template['breaks']
+    out = []
+    day = template['start_date']
+    while day <= template['end_date']:
+        if day.weekday() in template['weekdays']:
+            midnight = datetime.combine(day, datetime.min.time())
+            for block_start, block_end in template['hours']:
+                t = block_start
+                while t + step <= block_end:
+                    clash = next((b for b in breaks if b[0] < t + step and t < b[1]), None)
+                    if clash:
+                        t = clash[1]
+                        continue
+                    start = midnight + timedelta(minutes=t)
+                    if start >= now:
+                        out.append((start, start + timedelta(minutes=step)))
+                    t += step
+        day += timedelta(days=1)
+    return out
+
+
+def diff_against_existing(doctor_id, slots):
+    """
+    Split expanded slots into (new, existing, overlapping) using one query for
+    the doctor's slots in the covered range. `existing` are exact matches,
+    `overlapping` collide with a slot of a different shape.
+    """
+    if not slots:
+        return [], [], []
+    first = slots[0][0]
+    last = max(end for _, end in slots)
+    rows = (
+        db.session.query(TimeSlot.start_time, TimeSlot.end_time)
+        .filter(TimeSlot.doctor_id == doctor_id,
+                TimeSlot.start_time < last,
+                TimeSlot.start_time >= first - timedelta(days=1))
+        .order_by(TimeSlot.start_time)
+        .all()
+    )
+    current = sorted((s, e or s) for s, e in rows if s is not None)
+    exact = set(current)
+
+    # slots come out of expand_template ordered by start and end, so one pass
+    # keeping the latest end among existing slots that start before ours ends
+    # is enough to detect overlaps
+    new, existing, overlapping = [], [], []
+    j, max_end = 0, None
+    for start, end in slots:
+        if (start, end) in exact:
+            existing.append((start, end))
+            continue
+        while j < len(current) and current[j][0] < end:
+            max_end = current[j][1] if max_end is None else max(max_end, current[j][1])
+            j += 1
+        if max_end is not None and max_end > start:
+            overlapping.append((start, end))
+        else:
+            new.append((start, end))
+    return new, existing, overlapping
+
+
+def apply_template(doctor, data, dry_run=False):
+    """
+    Expand, diff and (unless dry_run) bulk-insert a template for `doctor`.
+    Returns (result, None) or (None, error).
+    """
+    template, error = parse_template(data)
+    if error:
+        return None, error
+    slots = expand_template(template)
+    if len(slots) > MAX_TEMPLATE_SLOTS:
+        return None, f"Template expands to {len(slots)} slots; at most {MAX_TEMPLATE_SLOTS} per request"
+
+    new, existing, overlapping = diff_against_existing(doctor.id, slots)
+
+    def fmt(pairs):
+        return [{"start_time": s.isoformat(), "end_time": e.isoformat()} for s, e in pairs]
+
+    result = {
+        "dry_run": bool(dry_run),
+        "expanded": len(slots),
+        "to_create": fmt(new),
+        "already_exist": fmt(existing),
+        "overlapping": fmt(overlapping),
+    }
+    if dry_run or not new:
+        result["created"] = 0
+        return result, None
+
+    rows = [{
+        'slot_id': new_id(f"TS-{doctor.id}-"),
+        'doctor_id': doctor.id,
+        'hospital_id': doctor.hospital_id,
+        'start_time': start,
+        'end_time': end,
+        'is_available': True,
+        'slot_type': template['slot_type'],
+    } for start, end in new]
+    db.session.execute(TimeSlot.__table__.insert(), rows)
+    db.session.commit()
+
+    # the new ids are not known here; the index picks them up past its watermark
+    from services.availability_index import index as availability
+    availability.sync(force=True)
+
+    result["created"] = len(rows)
+    result["created_slot_ids"] = [r['slot_id'] for r in rows]
+    return result, None
@@ -1,4 +1,254 @@
-# Mock symptom analyzer: simple keyword based classifier
+# Rule-based symptom triage.
+#
+# The phrase table lives in services/symptom_rules.json (or SYMPTOM_RULES_PATH):
+# weighted, multilingual phrases grouped into categories, urgency thresholds
+# on the total score, and negation cues. It is compiled once into an
+# Aho-Corasick automaton, so a text is classified in a single pass over its
+# characters however many phrases there are. Hyphens count as spaces. Matches
+# must sit on word boundaries; overlapping matches keep the longest phrase; a
+# phrase preceded within `window` words (in the same clause) by a negation cue
+# such as "no" or "denies" does not count. Clauses end at punctuation and at
+# scope breaks ("but", "and", "with", ...). Phrases of an adjacent-only
+# category (emergency) are only negated by a cue directly before them, so
+# "no nausea, chest pain" and "no fever chest pain" still score as urgent.
+#
+# The file is re-read when its mtime changes (checked at most every
+# check_interval seconds); a broken file is reported and the previous rules
+# stay in use.
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'symptom_rules.json')
+
+_WS = re.compile(r'\s+')
+_HYPHENS = re.compile(r'[-\u2010\u2011\u2012\u2013\u2014]')
+_WORD = re.compile(r'\w+')
+_CLAUSE_PUNCT = set('.,;:!?')
+
+
+def _normalize(text):
+    return _WS.sub(' ', _HYPHENS.sub(' ', text.casefold())).strip()
+
+
+class _Automaton:
+    """Aho-Corasick over characters; iter() yields (end_index, pattern_index)."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for idx, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                node = nxt
+            self.out[node] = self.out[node] + (idx,)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            r = queue.popleft()
+            for ch, s in self.goto[r].items():
+                queue.append(s)
+                f = self.fail[r]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[s] = self.goto[f].get(ch, 0)
+                self.out[s] = self.out[s] + self.out[self.fail[s]]
+
+    def iter(self, text):
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                yield i, idx
+
+
+class RuleSet:
+    """A compiled rule file."""
+
+    def __init__(self, data):
+        rules = data.get('rules')
+        if not isinstance(rules, list) or not rules:
+            raise ValueError("rules must be a non-empty list")
+        self.categories = data.get('categories') or {}
+        self.routine = data.get('routine') or {
+            "classification": "Routine", "recommendations": ["Self-care"]}
+        self.levels = sorted(
+            ((float(level['min_score']), level['name']) for level in data['urgency_levels']),
+            reverse=True,
+        )
+        negation = data.get('negation') or {}
+        self.cues = {_normalize(c) for c in negation.get('cues', [])}
+        self.scope_breaks = {_normalize(c) for c in negation.get('scope_breaks', [])}
+        self.window = int(negation.get('window', 3))
+        self.adjacent_only = set(negation.get('adjacent_only_categories', ['emergency']))
+        self.version = data.get('version')
+
+        self.rules = []
+        patterns = []
+        seen = set()
+        for rule in rules:
+            phrase = _normalize(str(rule['phrase']))
+            if not phrase or phrase in seen:
+                continue
+            if rule.get('category') not in self.categories:
+                raise ValueError(f"rule {rule['phrase']!r} has unknown category {rule.get('category')!r}")
+            seen.add(phrase)
+            patterns.append(phrase)
+            self.rules.append({
+                "phrase": rule['phrase'],
+                "length": len(phrase),
+                "weight": float(rule.get('weight', 1)),
+                "category": rule['category'],
+            })
+        self.automaton = _Automaton(patterns)
+
+    def _matches(self, t):
+        """Leftmost-longest, word-bounded, non-overlapping (start, end, rule index)."""
+        found = []
+        n = len(t)
+        for end, idx in self.automaton.iter(t):
+            start = end - self.rules[idx]['length'] + 1
+            if start > 0 and t[start - 1].isalnum():
+                continue
+            if end + 1 < n and t[end + 1].isalnum():
+                continue
+            found.append((start, -end, idx))
+        found.sort()
+        picked = []
+        last_end = -1
+        for start, neg_end, idx in found:
+            if start > last_end:
+                picked.append((start, -neg_end, idx))
+                last_end = -neg_end
+        return picked
+
+    def _negated_starts(self, t):
+        """
+        Token start offsets and, per token, how many words back the nearest
+        cue in scope is (None when no cue reaches it).
+        """
+        starts, cue_distance = [], []
+        clause = 0
+        recent = deque()      # (token position, clause) of cues seen lately
+        prev_end = 0
+        for pos, m in enumerate(_WORD.finditer(t)):
+            word = m.group()
+            if word in self.scope_breaks or any(ch in _CLAUSE_PUNCT for ch in t[prev_end:m.start()]):
+                clause += 1
+            prev_end = m.end()
+            while recent and (pos - recent[0][0] > self.window or recent[0][1] != clause):
+                recent.popleft()
+            starts.append(m.start())
+            cue_distance.append(pos - recent[-1][0] if recent else None)
+            if word in self.cues:
+                recent.append((pos, clause))
+        return starts, cue_distance
+
+    def analyze(self, text):
+        t = _normalize(text)
+        matches = self._matches(t)
+        starts, cue_distance = self._negated_starts(t) if matches else ([], [])
+
+        score = 0.0
+        by_category = {}
+        counted = set()
+        details = []
+        for start, end, idx in matches:
+            rule = self.rules[idx]
+            k = bisect_right(starts, start) - 1
+            distance = cue_distance[k] if k >= 0 and starts[k] == start else None
+            is_negated = distance is not None and (
+                distance == 1 or rule['category'] not in self.adjacent_only)
+            details.append({"phrase": rule['phrase'], "category": rule['category'],
+                            "weight": rule['weight'], "negated": is_negated})
+            if is_negated or idx in counted:
+                continue
+            counted.add(idx)
+            score += rule['weight']
+            by_category[rule['category']] = by_category.get(rule['category'], 0.0) + rule['weight']
+
+        urgency = next((name for minimum, name in self.levels if score >= minimum), "Low")
+        if urgency == self.levels[-1][1] or not by_category:
+            outcome = self.routine
+        else:
+            top = max(by_category.items(), key=lambda kv: kv[1])[0]
+            outcome = self.categories[top]
+        return {
+            "urgency": urgency,
+            "classification": outcome['classification'],
+            "recommendations": list(outcome['recommendations']),
+            "score": score,
+            "matches": details,
+        }
+
+
+class SymptomEngine:
+    def __init__(self, path=DEFAULT_RULES_PATH, check_interval=2.0):
+        self._lock = threading.Lock()
+        self._rules = None
+        self._mtime = None
+        self._last_check = 0.0
+        self.path = path
+        self.check_interval = check_interval
+
+    def configure(self, path=None, check_interval=None):
+        with self._lock:
+            if path is not None and path != self.path:
+                self.path = path
+                self._rules = None
+            if check_interval is not None:
+                self.check_interval = float(check_interval)
+        self.reload()
+
+    def reload(self):
+        """Compile the rule file now. Raises if it cannot be read or compiled."""
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding='utf-8') as f:
+            rules = RuleSet(json.load(f))
+        with self._lock:
+            self._rules, self._mtime = rules, mtime
+            self._last_check = time.monotonic()
+        return rules
+
+    def rules(self):
+        now = time.monotonic()
+        if self._rules is None:
+            return self.reload()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    # remembered up front so a broken file is reported once, not per call
+                    self._mtime = mtime
+                    self.reload()
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                log.error("symptom rules reload failed, keeping previous rules: %s", e,
+                          extra={"path": self.path})
+        return self._rules
+
+
+engine = SymptomEngine()
+
+
 def analyze_symptoms(text: str):
     if not text:
         return {
@@ -6,21 +256,10 @@ def analyze_symptoms(text: str):
             "classification": "Insufficient data",
             "recommendations": ["Please provide more details"]
         }
-    t = text.lower()
-    emergency_keywords = ["chest pain", "severe bleeding", "unconscious", "shortness of breath", "severe difficulty breathing"]
-    high = any(k in t for k in emergency_keywords)
-    fever = "fever" in t
-    cough = "cough" in t
-    if high:
-        urgency = "High"
-        classification = "Emergency"
-        recs = ["Visit nearest ER immediately", "Call emergency services"]
-    elif fever and cough:
-        urgency = "Medium"
-        classification = "Possible infection"
-        recs = ["Book an appointment with a physician", "Isolate and monitor symptoms"]
-    else:
-        urgency = "Low"
-        classification = "Routine"
-        recs = ["Self-care", "Schedule regular checkup if persists"]
-    return {"urgency": urgency, "classification": classification, "recommendations": recs}
+    return engine.rules().analyze(text)
+
+
+def analyze_batch(texts):
+    """Classify many texts against one rule snapshot."""
+    rules = engine.rules()
+    return [rules.analyze(t) if t else analyze_symptoms(t) for t in texts]
@@ -0,0 +1,212 @@
+# Asynchronous symptom triage.
+#
+# POST /api/patient/submit_symptoms classifies the text on the request thread
+# (one pass of the rule automaton, well under a millisecond) and hands the
+# write to a small pool of worker threads through a priority queue with two
+# lanes: "High" urgency reports are persisted, together with their emergency
+# alert in the notification outbox, before any routine report still waiting,
+# so a backlog of routine submissions never delays an emergency alert. When
+# the queue is full, or workers is 0, the report is persisted inline on the
+# request thread instead.
+#
+# The queue is in-process and not durable: reports still queued when a worker
+# process dies are lost, so the pool is drained for a few seconds at exit.
+import atexit
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from database import db
+
+log = logging.getLogger(__name__)
+
+HIGH, ROUTINE = 0, 1
+_LANE_NAMES = {HIGH: "high", ROUTINE: "routine"}
+_LATENCY_SAMPLES = 1000
+
+
+class _LaneStats:
+    __slots__ = ('enqueued', 'processed', 'failed', 'inline', 'latencies')
+
+    def __init__(self):
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.inline = 0
+        self.latencies = deque(maxlen=_LATENCY_SAMPLES)   # enqueue -> persisted, seconds
+
+    def snapshot(self, depth):
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))] * 1000, 2)
+
+        return {
+            "depth": depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "inline": self.inline,
+            "latency_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99), "max": pct(100)},
+        }
+
+
+def persist_report(job):
+    """Write one SymptomReport and queue its emergency alert. Needs an app context."""
+    from models import Patient, SymptomReport
+    from services.notification_service import dispatcher as notifications, send_emergency_alert
+
+    analysis = job['analysis']
+    sr = SymptomReport(
+        report_id=job['report_id'],
+        patient_id=job['patient_id'],
+        symptoms=job['symptoms'],
+        urgency_level=analysis['urgency'],
+        classification=analysis['classification'],
+        recommendations=";".join(analysis['recommendations']),
+        timestamp=job['submitted_at'],
+    )
+    db.session.add(sr)
+    alerted = False
+    if sr.is_emergency():
+        patient = db.session.get(Patient, job['patient_id'])
+        if patient is not None:
+            # goes through the outbox in the same transaction as the report
+            alerted = bool(send_emergency_alert(patient, sr.report_id))
+    db.session.commit()
+    if alerted:
+        notifications.wake()
+    return sr
+
+
+class TriagePipeline:
+    def __init__(self, workers=2, max_pending=1000):
+        self._lock = threading.Lock()
+        self._app = None
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._seq = itertools.count()
+        self._stats = {HIGH: _LaneStats(), ROUTINE: _LaneStats()}
+        self._depth = {HIGH: 0, ROUTINE: 0}
+        self.configure(workers, max_pending)
+
+    def configure(self, workers=None, max_pending=None, app=None):
+        if workers is not None:
+            self.workers = int(workers)
+        if max_pending is not None:
+            self.max_pending = int(max_pending)
+        if app is not None:
+            self._app = app
+
+    def _ensure_workers(self):
+        # worker threads do not survive a fork; each process starts its own
+        with self._lock:
+            if self._queue is not None and self._pid == os.getpid():
+                return self._queue
+            self._queue = queue.PriorityQueue(maxsize=self.max_pending)
+            self._depth = {HIGH: 0, ROUTINE: 0}
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._work, args=(self._queue,),
+                                 name=f'triage-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+            return self._queue
+
+    # -------- submission --------
+
+    def submit(self, patient_id, symptoms, analysis, report_id):
+        """
+        Queue a classified report for persisting. Returns True when queued,
+        False when it was persisted inline (no workers, or queue full).
+        """
+        lane = HIGH if (analysis.get('urgency') or '').lower() == 'high' else ROUTINE
+        job = {
+            'report_id': report_id,
+            'patient_id': patient_id,
+            'symptoms': symptoms,
+            'analysis': analysis,
+            'submitted_at': datetime.utcnow(),
+            'enqueued': time.perf_counter(),
+        }
+        if self.workers > 0 and self._app is not None:
+            q = self._ensure_workers()
+            try:
+                q.put_nowait((lane, next(self._seq), job))
+            except queue.Full:
+                pass
+            else:
+                with self._lock:
+                    self._stats[lane].enqueued += 1
+                    self._depth[lane] += 1
+                return True
+
+        persist_report(job)
+        with self._lock:
+            stats = self._stats[lane]
+            stats.inline += 1
+            stats.latencies.append(time.perf_counter() - job['enqueued'])
+        return False
+
+    # -------- workers --------
+
+    def _work(self, q):
+        while True:
+            lane, _, job = q.get()
+            with self._lock:
+                self._depth[lane] -= 1
+            try:
+                with self._app.app_context():
+                    try:
+                        persist_report(job)
+                    except Exception:
+                        db.session.rollback()
+                        raise
+                with self._lock:
+                    stats = self._stats[lane]
+                    stats.processed += 1
+                    stats.latencies.append(time.perf_counter() - job['enqueued'])
+            except Exception:
+                with self._lock:
+                    self._stats[lane].failed += 1
+                log.exception("triage worker failed to persist report",
+                              extra={"report_id": job['report_id']})
+            finally:
+                q.task_done()
+
+    def drain(self, timeout=5.0):
+        """Wait until every queued report is persisted. Returns True if drained."""
+        q = self._queue
+        if q is None or self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        while q.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        with self._lock:
+            depth = dict(self._depth) if self._pid == os.getpid() else {HIGH: 0, ROUTINE: 0}
+            lanes = {_LANE_NAMES[lane]: s.snapshot(depth[lane]) for lane, s in self._stats.items()}
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "depth": sum(depth.values()),
+            "lanes": lanes,
+        }
+
+
+pipeline = TriagePipeline()
+atexit.register(pipeline.drain, 5.0)